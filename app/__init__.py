@@ -2,9 +2,19 @@ from os import getenv
 
 from dotenv import load_dotenv
 
-import app.core.logging_config  # noqa: F401
 from app.core.config import Settings
+from app.core.logging_config import configure_logging
+from app.core.tracing import configure_tracing
 
 load_dotenv(getenv("ENV_FILE"))
 
 settings = Settings()
+
+configure_logging(
+    level=settings.log_level,
+    use_queue=settings.log_queue_enabled,
+    log_payloads=settings.log_payloads,
+    payload_max_length=settings.log_payload_max_length,
+)
+
+configure_tracing(exporter=settings.tracing_exporter, file_path=settings.tracing_file)
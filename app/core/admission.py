@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+
+from app import settings
+from app.core import metrics
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when a request is shed because the worker is saturated.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        """
+        :param reason: Why the request was rejected.
+        :param retry_after: The seconds the caller should wait before retrying.
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds the requests a worker processes at once.
+
+    Up to `max_in_flight` requests are admitted, then up to `max_queue`
+    requests wait for a slot, in arrival order, for at most `queue_timeout`
+    seconds. Beyond that, the requests are rejected right away, so that the
+    latency of the admitted ones stays bounded instead of every request
+    slowing down as the load grows.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue: int = 0,
+        queue_timeout: float = 1.0,
+        retry_after: float = 1.0,
+    ):
+        """
+        :param max_in_flight: The requests processed at once. 0 disables the limit.
+        :param max_queue: The requests waiting for a slot at most.
+        :param queue_timeout: How long a request waits for a slot, in seconds.
+        :param retry_after: The seconds the rejected callers should wait
+            before retrying.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """
+        Waits for a slot to process a request.
+        Each successful call must be followed by a call to `release()`.
+
+        :raise: AdmissionRejectedError if the queue is full or no slot is
+            released in time.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just before the timeout or the
+                # request going away
+                if isinstance(error, TimeoutError):
+                    self.admitted += 1
+                    return
+                self.release()
+                raise
+            waiter.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(error, TimeoutError):
+                self._reject("timeout")
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """
+        Releases the slot of a processed request, handing it over to the
+        oldest request waiting, if any.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Returns the limits, the current occupancy and the counters.
+        """
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        admission_rejected.inc((reason,))
+        if reason == "full":
+            message = "Too many requests are waiting to be processed"
+        else:
+            message = f"No request slot was released within {self.queue_timeout}s"
+        raise AdmissionRejectedError(message, self.retry_after)
+
+
+admission_rejected = metrics.registry.counter(
+    "admission_rejected_total",
+    "Inbound requests shed by the admission control, by reason (full or timeout).",
+    ("reason",),
+)
+admission_in_flight = metrics.registry.gauge(
+    "admission_in_flight", "Inbound requests admitted and being processed."
+)
+admission_queued = metrics.registry.gauge(
+    "admission_queued", "Inbound requests waiting to be admitted."
+)
+admission_max_in_flight = metrics.registry.gauge(
+    "admission_max_in_flight", "Inbound requests processed at once at most."
+)
+
+admission_controller = AdmissionController(
+    max_in_flight=settings.admission_max_in_flight,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout,
+    retry_after=settings.admission_retry_after,
+)
+
+
+def _collect_admission_metrics():
+    admission_in_flight.set((), admission_controller.in_flight)
+    admission_queued.set((), admission_controller.queued)
+    admission_max_in_flight.set((), admission_controller.max_in_flight)
+
+
+metrics.registry.add_collector(_collect_admission_metrics)
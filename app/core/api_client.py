@@ -1,40 +1,173 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import time
 from typing import Any
 
 import httpx
 from httpx import Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
 
 from app import settings
+from app.core import metrics
+from app.core.cache import fingerprint
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from app.core.deadline import DeadlineExceededError, remaining
+from app.core.rate_limit import OutboundRateLimiter, UpstreamRateLimitError
+from app.core.request_id import REQUEST_ID_HEADER, get_request_id
+from app.core.retry import IDEMPOTENCY_KEY_HEADER, RetryPolicy, parse_retry_after
+from app.core.single_flight import SingleFlight
+from app.core.tracing import TRACEPARENT_HEADER, tracer
 
 logger = logging.getLogger(__name__)
 
 API_REQUEST_TIMEOUT = settings.default_request_timeout
 
+# the signals of an upstream that can't answer, counted by the circuit breaker:
+# a full pool or a plain 500 don't mean that the upstream is down
+UNAVAILABLE_STATUSES = frozenset({502, 503, 504})
+UNAVAILABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.ReadTimeout,
+    httpx.RemoteProtocolError,
+)
+
+upstream_request_duration = metrics.registry.histogram(
+    "optscale_request_duration_seconds",
+    "Duration of each attempt of the upstream requests, by endpoint and status "
+    "code, or `error` when no response was received.",
+    ("method", "endpoint", "status"),
+)
+upstream_requests_in_flight = metrics.registry.gauge(
+    "optscale_requests_in_flight",
+    "Upstream requests waiting for a response.",
+    ("upstream",),
+)
+upstream_coalesced_requests = metrics.registry.counter(
+    "optscale_coalesced_requests_total",
+    "GET requests served by joining an identical upstream request in flight.",
+    ("upstream",),
+)
+upstream_pool_connections = metrics.registry.gauge(
+    "optscale_pool_connections",
+    "Connections of the upstream pools, by state.",
+    ("upstream", "state"),
+)
+upstream_pool_max_connections = metrics.registry.gauge(
+    "optscale_pool_max_connections",
+    "Maximum number of connections of the upstream pools.",
+    ("upstream",),
+)
+
+
+def build_connection_limits() -> httpx.Limits:
+    """
+    Builds the connection pool limits for the API clients from the settings.
+
+    :return: an httpx.Limits instance
+    """
+    return httpx.Limits(
+        max_connections=settings.api_client_max_connections,
+        max_keepalive_connections=settings.api_client_max_keepalive_connections,
+        keepalive_expiry=settings.api_client_keepalive_expiry,
+    )
+
+
+def build_timeout() -> httpx.Timeout:
+    """
+    Builds the default timeouts of the API clients from the settings.
+    The connect, read, write and pool timeouts fall back to
+    `default_request_timeout` when they are not set.
+
+    :return: an httpx.Timeout instance
+    """
+    return httpx.Timeout(
+        settings.default_request_timeout,
+        **{
+            name: value
+            for name, value in (
+                ("connect", settings.api_client_connect_timeout),
+                ("read", settings.api_client_read_timeout),
+                ("write", settings.api_client_write_timeout),
+                ("pool", settings.api_client_pool_timeout),
+            )
+            if value is not None
+        },
+    )
+
+
+def cap_timeout(timeout: httpx.Timeout, seconds: float) -> httpx.Timeout:
+    """
+    Returns the given timeout with each of its values limited to `seconds`.
+    """
+    return httpx.Timeout(
+        connect=min(timeout.connect or seconds, seconds),
+        read=min(timeout.read or seconds, seconds),
+        write=min(timeout.write or seconds, seconds),
+        pool=min(timeout.pool or seconds, seconds),
+    )
 
-class LogRequestMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        logger.info(f"Request: {request.method} {request.url}")
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        logger.info(
-            f"Response: status_code={response.status_code}, process_time={process_time:.2f}s"
-        )
-        return response
+
+def build_request_key(
+    method: str,
+    endpoint: str,
+    headers: dict[str, Any] | None = None,
+    params: dict[str, Any] | None = None,
+) -> tuple[str, str, tuple, str]:
+    """
+    Builds a hashable key identifying a request.
+    The headers, which carry the caller's credentials, are fingerprinted
+    so that no secret is kept in the key.
+
+    :param method: The HTTP method.
+    :param endpoint: The requested endpoint.
+    :param headers: The request headers.
+    :param params: The query parameters.
+    :return: A tuple identifying the request.
+    """
+    query = tuple(sorted(httpx.QueryParams(params or {}).multi_items()))
+    identity = fingerprint(
+        repr(sorted((name.lower(), value) for name, value in (headers or {}).items()))
+    )
+    return method, endpoint, query, identity
 
 
 class APIClient:
-    def __init__(self, base_url: str, timeout: int = API_REQUEST_TIMEOUT):
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float | httpx.Timeout = API_REQUEST_TIMEOUT,
+        endpoint_timeouts: dict[str, float] | None = None,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+        coalesce_gets: bool = False,
+        retry_policy: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        rate_limiter: OutboundRateLimiter | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         self.base_url = base_url
-        self.timeout = timeout
+        self.timeout = httpx.Timeout(timeout)
+        # the longest prefix first, so that it wins
+        self.endpoint_timeouts = sorted(
+            (endpoint_timeouts or {}).items(), key=lambda item: -len(item[0])
+        )
+        self.coalesce_gets = coalesce_gets
+        self.retry_policy = retry_policy or RetryPolicy.from_settings()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker.from_settings(base_url)
+        self.rate_limiter = rate_limiter or OutboundRateLimiter.from_settings(base_url)
+        self.in_flight_gets = SingleFlight()
+        self.in_flight = 0
+        limits = limits or build_connection_limits()
+        self.max_connections = limits.max_connections
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
             timeout=self.timeout,
+            limits=limits,
+            http2=http2,
+            transport=transport,
         )
 
     async def _make_request(
@@ -44,6 +177,48 @@ class APIClient:
         headers: dict[str, Any] | None = None,
         params: dict[str, Any] | None = None,
         data: dict[str, Any] | None = None,
+        raw: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Makes the request in a client span, whose context is sent to the
+        upstream with the `traceparent` header, along with the ID of the
+        inbound request in the `X-Request-ID` header. See `_request`.
+        """
+        endpoint_label = metrics.endpoint_label(endpoint)
+        with tracer.start_as_current_span(
+            f"{method} {endpoint_label}",
+            kind="client",
+            attributes={
+                "http.request.method": method,
+                "server.address": self.base_url,
+                "url.path": endpoint_label,
+            },
+        ) as span:
+            headers = {**(headers or {}), TRACEPARENT_HEADER: span.traceparent}
+            request_id = get_request_id()
+            if request_id is not None:
+                headers[REQUEST_ID_HEADER] = request_id
+            response = await self._request(
+                method=method,
+                endpoint=endpoint,
+                headers=headers,
+                params=params,
+                data=data,
+                raw=raw,
+            )
+            span.set_attribute("http.response.status_code", response["status_code"])
+            if response["status_code"] >= 500:
+                span.set_error(response.get("error"))
+            return response
+
+    async def _request(
+        self,
+        method: str,
+        endpoint: str,
+        headers: dict[str, Any] | None = None,
+        params: dict[str, Any] | None = None,
+        data: dict[str, Any] | None = None,
+        raw: bool = False,
     ) -> (
         Response
         | dict[str, None | str | int]
@@ -60,16 +235,33 @@ class APIClient:
         :type params:
         :param data:
         :type data:
+        :param raw: Return the body of a successful response as is, under the
+            `content` key, instead of parsing it under the `data` key.
+        :type raw: bool
         :return:
         :rtype:
         """
         try:
-            response = await self.client.request(
-                method=method, headers=headers, url=endpoint, params=params, json=data
+            response = await self._send_with_retries(
+                method=method,
+                endpoint=endpoint,
+                headers=headers,
+                params=params,
+                data=data,
             )
             response.raise_for_status()
             # Check if the response is JSON by inspecting the Content-Type header
             if response.headers.get("Content-Type", "").startswith("application/json"):
+                if raw:
+                    content = response.content
+                    # only check that the body is a JSON document, not its content
+                    if content.lstrip()[:1] not in (b"{", b"["):
+                        logger.error("The JSON response is not an object nor an array.")
+                        return {
+                            "status_code": 403,
+                            "error": "Invalid JSON format in response",
+                        }
+                    return {"status_code": response.status_code, "content": content}
                 try:
                     data = response.json()
                     return {"status_code": response.status_code, "data": data}
@@ -89,11 +281,35 @@ class APIClient:
                 )
                 return {"status_code": 403, "error": "Response is not JSON"}
 
+        except DeadlineExceededError as error:
+            logger.warning("Request to %s abandoned: %s", endpoint, error)
+            return {
+                "status_code": 504,  # Gateway Timeout
+                "data": {"error": {"reason": str(error)}},
+                "error": f"Deadline exceeded: {error}",
+            }
+        except CircuitOpenError as error:
+            # Fail fast while the upstream is known to be down
+            logger.warning("Request to %s rejected: %s", endpoint, error)
+            return {
+                "status_code": 503,  # Service Unavailable
+                "data": {"error": {"reason": str(error)}},
+                "error": f"Circuit open: {error}",
+            }
+        except UpstreamRateLimitError as error:
+            # The quota of the upstream is exhausted for longer than we can wait
+            logger.warning("Request to %s rejected: %s", endpoint, error)
+            return {
+                "status_code": 503,  # Service Unavailable
+                "data": {"error": {"reason": str(error)}},
+                "error": f"Rate limited: {error}",
+            }
         except httpx.RequestError as error:
             # Log and handle connection-related errors
             logger.error(
-                f"An error occurred while "
-                f"requesting {error.request.url!r}. Error: {error}"
+                "An error occurred while requesting %r. Error: %s",
+                error.request.url,
+                error,
             )
             return {
                 "status_code": 503,  # Service Unavailable
@@ -103,41 +319,306 @@ class APIClient:
         except httpx.HTTPStatusError as error:
             # Log and handle HTTP errors (non-2xx responses)
             logger.error(
-                f"Error response {error.response.status_code} "
-                f"while requesting {error.request.url!r}."
+                "Error response %s while requesting %r.",
+                error.response.status_code,
+                error.request.url,
             )
 
+            try:
+                error_data = error.response.json()
+            except ValueError:
+                # e.g. an HTML error page from a proxy
+                error_data = {}
             return {
                 "status_code": error.response.status_code,
-                "data": error.response.json(),
+                "data": error_data,
                 "error": f"HTTP error: {error.response.status_code} - {error.response.text}",
             }
         except Exception as error:
             # Catch any other unexpected errors
-            logger.error(f"An unexpected error occurred: {str(error)}")
+            logger.error("An unexpected error occurred: %s", error)
             return {
                 "status_code": 500,  # Internal Server Error
                 "data": {},
                 "error": f"Unexpected error: {error}",
             }
 
+    def timeout_for(self, endpoint: str) -> httpx.Timeout:
+        """
+        Returns the timeout of a request to the given endpoint: the timeout
+        configured for the endpoint, if any, limited to the time left before
+        the deadline of the current request.
+
+        :param endpoint: The requested endpoint.
+        :return: The timeout to use.
+        :raise: DeadlineExceededError if the deadline has already passed.
+        """
+        timeout = self.timeout
+        for prefix, seconds in self.endpoint_timeouts:
+            if endpoint.startswith(prefix):
+                # the connection doesn't depend on the endpoint
+                timeout = httpx.Timeout(
+                    seconds, connect=timeout.connect, pool=timeout.pool
+                )
+                break
+        time_left = remaining()
+        if time_left is None:
+            return timeout
+        if time_left <= 0:
+            raise DeadlineExceededError(f"No time left to request {endpoint}")
+        return cap_timeout(timeout, time_left)
+
+    async def _send_with_retries(
+        self,
+        method: str,
+        endpoint: str,
+        headers: dict[str, Any] | None = None,
+        params: dict[str, Any] | None = None,
+        data: dict[str, Any] | None = None,
+    ) -> Response:
+        """
+        Sends the request, retrying it according to the retry policy.
+        Each attempt waits for its turn in the rate limit of the upstream.
+        The call goes through the circuit breaker of the upstream once,
+        reporting the outcome of its last attempt.
+
+        :return: The last response received.
+        :raise: httpx.RequestError if the last attempt failed to get a response.
+        :raise: CircuitOpenError if the circuit of the upstream is open.
+        :raise: UpstreamRateLimitError if the rate limit doesn't allow the
+            request in time.
+        :raise: DeadlineExceededError if the deadline of the request is reached.
+        """
+        max_attempts = self.retry_policy.attempts_for(method, headers)
+        self.circuit_breaker.check()
+        # whether the upstream answered the last attempt, None if unknown
+        answered: bool | None = None
+        try:
+            attempt = 1
+            while True:
+                if self.rate_limiter.enabled:
+                    await self.rate_limiter.acquire(endpoint)
+                timeout = self.timeout_for(endpoint)
+                if attempt > 1 and self.circuit_breaker.state is CircuitState.OPEN:
+                    # opened by other requests meanwhile
+                    raise CircuitOpenError(
+                        self.circuit_breaker.name, self.circuit_breaker.retry_after()
+                    )
+                start_time = time.monotonic()
+                try:
+                    response = await self._send(
+                        method=method,
+                        endpoint=endpoint,
+                        headers=headers,
+                        params=params,
+                        data=data,
+                        timeout=timeout,
+                    )
+                except httpx.RequestError as error:
+                    time_left = remaining()
+                    if (
+                        isinstance(error, httpx.TimeoutException)
+                        and time_left is not None
+                        and time_left <= 0
+                    ):
+                        # cut short by our own budget, not the upstream's fault
+                        raise DeadlineExceededError(
+                            f"Timed out requesting {endpoint}"
+                        ) from error
+                    if isinstance(error, UNAVAILABLE_ERRORS):
+                        answered = False
+                    logger.warning(
+                        "%s %s attempt %d/%d failed after %.3fs: %r",
+                        method,
+                        endpoint,
+                        attempt,
+                        max_attempts,
+                        time.monotonic() - start_time,
+                        error,
+                    )
+                    delay = self.retry_policy.backoff_delay(attempt)
+                    if attempt >= max_attempts or self._past_deadline(delay):
+                        raise
+                else:
+                    answered = response.status_code not in UNAVAILABLE_STATUSES
+                    if response.status_code == 429 and self.rate_limiter.enabled:
+                        await self.rate_limiter.throttle(
+                            endpoint,
+                            parse_retry_after(response.headers.get("Retry-After")),
+                        )
+                    logger.info(
+                        "%s %s attempt %d/%d: status_code=%s in %.3fs",
+                        method,
+                        endpoint,
+                        attempt,
+                        max_attempts,
+                        response.status_code,
+                        time.monotonic() - start_time,
+                    )
+                    if (
+                        attempt >= max_attempts
+                        or response.status_code not in self.retry_policy.retry_statuses
+                    ):
+                        return response
+                    delay = self.retry_policy.backoff_delay(
+                        attempt, retry_after=response.headers.get("Retry-After")
+                    )
+                    if delay is None or self._past_deadline(delay):
+                        return response
+                    await response.aclose()
+
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            # once per call, on the outcome of the last attempt
+            if answered:
+                self.circuit_breaker.record_success()
+            elif answered is False:
+                self.circuit_breaker.record_failure()
+
+    async def _send(
+        self,
+        method: str,
+        endpoint: str,
+        headers: dict[str, Any] | None,
+        params: dict[str, Any] | None,
+        data: dict[str, Any] | None,
+        timeout: httpx.Timeout,
+    ) -> Response:
+        # a single attempt, recorded in the upstream metrics
+        start_time = time.monotonic()
+        status = "error"
+        self.in_flight += 1
+        try:
+            response = await self.client.request(
+                method=method,
+                headers=headers,
+                url=endpoint,
+                params=params,
+                json=data,
+                timeout=timeout,
+            )
+            status = str(response.status_code)
+            return response
+        finally:
+            self.in_flight -= 1
+            upstream_request_duration.observe(
+                (method, metrics.endpoint_label(endpoint), status),
+                time.monotonic() - start_time,
+            )
+
+    def pool_stats(self) -> dict[str, int] | None:
+        """
+        Returns the number of active and idle connections of the pool,
+        or None if the transport doesn't expose them (e.g. a mock transport).
+        """
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return None
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
+
+    @staticmethod
+    def _past_deadline(delay: float) -> bool:
+        # a retry is pointless if the deadline passes while waiting for it
+        time_left = remaining()
+        return time_left is not None and delay >= time_left
+
     async def get(
         self,
         endpoint: str,
         headers: dict[str, Any] | None = None,
         params: dict[str, Any] | None = None,
+        coalesce: bool | None = None,
     ) -> Any:
-        response = await self._make_request(
-            "GET", endpoint, params=params, headers=headers
+        """
+        Sends a GET request.
+        When coalescing is enabled, concurrent identical requests (same endpoint,
+        params and headers, hence same caller identity) share a single upstream call.
+
+        :param endpoint: The endpoint to request.
+        :param headers: The request headers.
+        :param params: The query parameters.
+        :param coalesce: Overrides the `coalesce_gets` setting of the client.
+        :return: The response dict built by `_make_request`.
+        """
+        if coalesce is None:
+            coalesce = self.coalesce_gets
+        if not coalesce:
+            return await self._make_request(
+                "GET", endpoint, params=params, headers=headers
+            )
+
+        key = build_request_key("GET", endpoint, headers=headers, params=params)
+        if self.in_flight_gets.is_in_flight(key):
+            upstream_coalesced_requests.inc((self.base_url,))
+        response = await self.in_flight_gets.do(
+            key,
+            lambda: self._make_request("GET", endpoint, params=params, headers=headers),
+        )
+        # each caller gets its own copy of the shared response
+        return dict(response)
+
+    async def get_raw(
+        self,
+        endpoint: str,
+        headers: dict[str, Any] | None = None,
+        params: dict[str, Any] | None = None,
+    ) -> Any:
+        """
+        Sends a GET request, returning the body of a successful response
+        unparsed, to be forwarded as is.
+
+        :param endpoint: The endpoint to request.
+        :param headers: The request headers.
+        :param params: The query parameters.
+        :return: The response dict built by `_make_request`, with the body
+            under the `content` key on success.
+        """
+        return await self._make_request(
+            "GET", endpoint, params=params, headers=headers, raw=True
+        )
+
+    async def post_raw(
+        self,
+        endpoint: str,
+        headers: dict[str, Any] | None = None,
+        data: dict[str, Any] | None = None,
+    ) -> Any:
+        """
+        Sends a POST request, returning the body of a successful response
+        unparsed, to be forwarded as is.
+
+        :param endpoint: The endpoint to request.
+        :param headers: The request headers.
+        :param data: The JSON payload.
+        :return: The response dict built by `_make_request`, with the body
+            under the `content` key on success.
+        """
+        return await self._make_request(
+            "POST", endpoint, data=data, headers=headers, raw=True
         )
-        return response
 
     async def post(
         self,
         endpoint: str,
         headers: dict[str, Any] | None = None,
         data: dict[str, Any] | None = None,
+        idempotency_key: str | None = None,
     ) -> Any:
+        """
+        Sends a POST request.
+        POST requests are retried only when an idempotency key is provided.
+
+        :param endpoint: The endpoint to request.
+        :param headers: The request headers.
+        :param data: The JSON payload.
+        :param idempotency_key: Sent as the Idempotency-Key header if provided.
+        :return: The response dict built by `_make_request`.
+        """
+        if idempotency_key is not None:
+            headers = {**(headers or {}), IDEMPOTENCY_KEY_HEADER: idempotency_key}
         response = await self._make_request(
             "POST", endpoint, data=data, headers=headers
         )
@@ -177,3 +658,93 @@ class APIClient:
     async def close(self):
         """Close the client connection."""
         await self.client.aclose()
+
+
+class APIClientRegistry:
+    """
+    Keeps a single pooled APIClient per base URL for the whole application,
+    so that inbound requests reuse the upstream keep-alive connections
+    instead of opening a new one each time.
+    The registry is opened and closed by the application lifespan handler.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, APIClient] = {}
+
+    def register(self, client: APIClient) -> APIClient | None:
+        """
+        Registers a client for its base URL, e.g. a client whose transport
+        targets a local stand-in of the upstream API.
+
+        :param client: The client to register.
+        :return: The client it replaces, if any, which is not closed.
+        """
+        previous = self._clients.get(client.base_url)
+        self._clients[client.base_url] = client
+        return previous
+
+    def get(self, base_url: str) -> APIClient:
+        """
+        Returns the shared client for the given base URL, creating it if needed.
+
+        :param base_url: The base URL of the upstream API.
+        :return: The shared APIClient instance.
+        """
+        client = self._clients.get(base_url)
+        if client is None:
+            client = APIClient(
+                base_url=base_url,
+                timeout=build_timeout(),
+                endpoint_timeouts=settings.api_client_endpoint_timeouts,
+                limits=build_connection_limits(),
+                http2=settings.api_client_http2,
+                coalesce_gets=settings.api_client_coalesce_gets,
+            )
+            self._clients[base_url] = client
+            logger.info("Opened a pooled API client for %s", base_url)
+        return client
+
+    def health(self) -> dict[str, dict[str, str | int | float]]:
+        """
+        Returns the state of the circuit breaker of each upstream.
+        """
+        return {
+            base_url: client.circuit_breaker.stats()
+            for base_url, client in self._clients.items()
+        }
+
+    def collect_metrics(self):
+        """
+        Updates the in-flight requests and the pool gauges of the clients.
+        """
+        for gauge in (
+            upstream_requests_in_flight,
+            upstream_pool_connections,
+            upstream_pool_max_connections,
+        ):
+            gauge.clear()
+        for base_url, client in self._clients.items():
+            upstream_requests_in_flight.set((base_url,), client.in_flight)
+            if client.max_connections is not None:
+                upstream_pool_max_connections.set((base_url,), client.max_connections)
+            pool_stats = client.pool_stats()
+            for state, count in (pool_stats or {}).items():
+                upstream_pool_connections.set((base_url, state), count)
+
+    async def close(self):
+        """Close all the registered clients."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.close()
+
+
+api_clients = APIClientRegistry()
+metrics.registry.add_collector(api_clients.collect_metrics)
+
+
+def get_optscale_api_client() -> APIClient:
+    """
+    Returns the application-wide pooled client for the OptScale API.
+    """
+    return api_clients.get(settings.opt_scale_api_url)
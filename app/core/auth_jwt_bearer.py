@@ -1,5 +1,9 @@
 import logging
-from typing import Optional
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Optional
 
 import jwt
 from fastapi import Request
@@ -13,7 +17,11 @@ from jwt.exceptions import (
 )
 
 from app import settings
+from app.core import metrics
+from app.core.cache import TTLCache, fingerprint
 from app.core.error_formats import create_error_response
+from app.core.rate_limit import enforce_rate_limit
+from app.core.tracing import tracer
 
 JWT_SECRET = settings.secret
 JWT_ALGORITHM = settings.algorithm
@@ -23,6 +31,60 @@ JWT_LEEWAY = settings.leeway
 
 logger = logging.getLogger(__name__)
 
+# The claims of the tokens already verified, keyed by the token's fingerprint
+verified_tokens = TTLCache(maxsize=settings.jwt_cache_size, ttl=0)
+metrics.register_cache("verified_tokens", verified_tokens)
+
+REGISTERED_CLAIMS = ("sub", "iss", "aud", "exp", "nbf", "iat")
+
+
+@dataclass(frozen=True, slots=True)
+class JWTClaims:
+    """
+    The verified claims of the caller's JWT token.
+    The registered claims are attributes, the others are in `extra`.
+    """
+
+    iss: str
+    aud: str | list[str]
+    exp: int
+    nbf: int
+    sub: str | None = None
+    iat: int | None = None
+    extra: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "JWTClaims":
+        """
+        Builds the claims from a decoded token.
+
+        :param payload: The decoded token.
+        :return: a JWTClaims instance
+        """
+        return cls(
+            **{name: payload[name] for name in REGISTERED_CLAIMS if name in payload},
+            extra=MappingProxyType(
+                {
+                    name: value
+                    for name, value in payload.items()
+                    if name not in REGISTERED_CLAIMS
+                }
+            ),
+        )
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """
+        Returns the value of a claim, registered or not.
+
+        :param name: The name of the claim.
+        :param default: The value to return if the claim is missing.
+        :return: The value of the claim or the default.
+        """
+        if name in REGISTERED_CLAIMS:
+            value = getattr(self, name)
+            return default if value is None else value
+        return self.extra.get(name, default)
+
 
 def decode_jwt(token: str) -> Optional[dict]:  # noqa: UP007
     """
@@ -63,6 +125,30 @@ def decode_jwt(token: str) -> Optional[dict]:  # noqa: UP007
     return None
 
 
+def decode_jwt_cached(token: str) -> JWTClaims | None:
+    """
+    Decodes a JWT token like `decode_jwt`, reusing the result for tokens
+    that have already been verified.
+    A verified token is kept until its `exp` minus the leeway, so the
+    signature and the claims of a reused token aren't validated again.
+
+    :param token: The JWT token to decode.
+    :return: The claims of the token if valid, or `None`
+    if the token is invalid or expired.
+    """
+    cache_key = fingerprint(token)
+    claims = verified_tokens.get(cache_key)
+    if claims is None:
+        payload = decode_jwt(token)
+        if payload is None:
+            return None
+        claims = JWTClaims.from_payload(payload)
+        verified_tokens.set(
+            cache_key, claims, ttl=payload["exp"] - JWT_LEEWAY - time.time()
+        )
+    return claims
+
+
 def verify_jwt(jw_token: str) -> bool:
     """
     Verifies the validity of a JWT token by decoding it and checking its claims.
@@ -73,7 +159,7 @@ def verify_jwt(jw_token: str) -> bool:
 
     """
     is_token_valid = False
-    payload = decode_jwt(jw_token)
+    payload = decode_jwt_cached(jw_token)
     if payload is not None:
         is_token_valid = True
     return is_token_valid
@@ -91,16 +177,33 @@ class JWTBearer(HTTPBearer):
         """
         super().__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+    async def __call__(self, request: Request) -> JWTClaims:
+        """
+        Verifies the bearer token of the request.
+        The claims of the token are returned and attached to the request
+        as `request.state.jwt_claims`, and the request is counted against
+        the rate limit of the caller.
+
+        :param request: The inbound request.
+        :return: The verified claims of the token.
+        :raise: HTTPException 401 if the token is missing, invalid or expired,
+            429 if the caller has exceeded its rate limit.
+        """
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
         if credentials:
-            if not verify_jwt(credentials.credentials):
+            with tracer.start_as_current_span("jwt.verify") as span:
+                claims = decode_jwt_cached(credentials.credentials)
+                if claims is None:
+                    span.set_error("invalid token")
+            if claims is None:
                 raise create_error_response(
                     status_code=http_status.HTTP_401_UNAUTHORIZED,
                     title="Invalid token or expired token.",
                     errors={"reason": "The token is invalid or has expired."},
                 )
-            return credentials.credentials
+            request.state.jwt_claims = claims
+            await enforce_rate_limit(request, claims)
+            return claims
         else:
             # The authentication schema is not Bearer
             raise create_error_response(
@@ -108,3 +211,13 @@ class JWTBearer(HTTPBearer):
                 title="Invalid authorization scheme.",
                 errors={"reason": "Invalid authorization scheme."},
             )
+
+
+def get_jwt_claims(request: Request) -> JWTClaims | None:
+    """
+    Returns the claims verified by JWTBearer for the given request.
+
+    :param request: The inbound request.
+    :return: The claims, or None if the request has not been authenticated.
+    """
+    return getattr(request.state, "jwt_claims", None)
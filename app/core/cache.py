@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+from app.core.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(value: str) -> str:
+    """
+    Returns a short, non-reversible fingerprint of a secret value,
+    suitable to be used as (part of) a cache key.
+
+    :param value: The value to fingerprint, like an API key or a token.
+    :return: The first 32 hex chars of the SHA-256 digest of the value.
+    """
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+class TTLCache:
+    """
+    A bounded in-memory cache where each entry expires after a time to live.
+    When the cache is full, the least recently used entry is evicted.
+    The expiration uses a monotonic clock, so it isn't affected by
+    changes of the system time.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        :param maxsize: The maximum number of entries to keep.
+        :param ttl: The default time to live of an entry, in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the value stored for the given key if it has not expired.
+
+        :param key: The key to look up.
+        :param default: The value to return when the key is missing or expired.
+        :return: The cached value or the default.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        """
+        Stores a value for the given key.
+
+        :param key: The key to store the value for.
+        :param value: The value to store.
+        :param ttl: A custom time to live, in seconds. Defaults to the cache TTL.
+            Non positive values are not stored at all.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Removes the given key from the cache.
+
+        :param key: The key to remove.
+        :param default: The value to return if the key is missing.
+        :return: The removed value or the default.
+        """
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Removes all the entries and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the cache counters.
+        """
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(frozen=True, slots=True)
+class CacheEntry:
+    """
+    A cached value along with the (epoch) time until it is considered fresh.
+    """
+
+    value: Any
+    fresh_until: float
+
+
+class CacheBackend(ABC):
+    """
+    The storage used by the ResponseCache.
+    Keys are strings and entries are CacheEntry instances, whose values are
+    JSON serializable: a shared store like Redis can implement this interface
+    by storing the fields of the entries, and be used by all the workers.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> CacheEntry | None:
+        """
+        Returns the entry stored for the key, or None.
+        """
+
+    @abstractmethod
+    async def set(self, key: str, entry: CacheEntry, ttl: float):
+        """
+        Stores the entry for the key, for `ttl` seconds.
+        """
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """
+        Removes the entry stored for the key.
+        """
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    A CacheBackend keeping the entries in a per-process LRU cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self.entries = TTLCache(maxsize=maxsize, ttl=0)
+
+    async def get(self, key: str) -> CacheEntry | None:
+        return self.entries.get(key)
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float):
+        self.entries.set(key, entry, ttl=ttl)
+
+    async def delete(self, key: str):
+        self.entries.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class ResponseCache:
+    """
+    Caches the result of upstream reads.
+
+    An entry is fresh for `ttl` seconds, then it is served stale for up to
+    `stale_ttl` more seconds while it's refreshed in background, so a slow
+    upstream doesn't stall the readers. Concurrent misses for the same key
+    share a single load.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float, stale_ttl: float = 0):
+        """
+        :param backend: The storage of the entries.
+        :param ttl: For how long an entry is fresh, in seconds. 0 disables the cache.
+        :param stale_ttl: For how long an entry can be served stale, in seconds.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._loads = SingleFlight()
+        self._invalidated_loads: set[str] = set()
+        self._refresh_tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value for the key, loading it if needed.
+
+        :param key: The cache key.
+        :param loader: A callable returning an awaitable that loads the value.
+        :return: The cached or loaded value.
+        :raise: Any exception raised by the loader on a miss.
+        """
+        if not self.enabled:
+            return await loader()
+
+        entry = await self.backend.get(key)
+        if entry is not None:
+            if entry.fresh_until > time.time():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader)
+            return entry.value
+
+        self.misses += 1
+        return await self._loads.do(key, lambda: self._load(key, loader))
+
+    async def invalidate(self, key: str):
+        """
+        Removes the entry for the key, and discards the result of any load
+        of the key that is still in flight.
+
+        :param key: The cache key.
+        """
+        if self._loads.is_in_flight(key):
+            self._invalidated_loads.add(key)
+        await self.backend.delete(key)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the cache counters.
+        """
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+    def reset_stats(self):
+        self.hits = self.stale_hits = self.misses = 0
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        # the single flight guarantees one load at a time for a key
+        self._invalidated_loads.discard(key)
+        try:
+            value = await loader()
+            if key not in self._invalidated_loads:
+                entry = CacheEntry(value=value, fresh_until=time.time() + self.ttl)
+                await self.backend.set(key, entry, ttl=self.ttl + self.stale_ttl)
+            return value
+        finally:
+            self._invalidated_loads.discard(key)
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        task = asyncio.ensure_future(
+            self._loads.do(key, lambda: self._load(key, loader))
+        )
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                "Failed to refresh a stale cache entry: %s", task.exception()
+            )
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import logging
+import time
+from enum import StrEnum
+
+from app import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a request is rejected because the circuit of the upstream is open.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        """
+        :param name: The name of the circuit, the base URL of the upstream.
+        :param retry_after: The seconds left before the upstream is probed again.
+        """
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f} seconds")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to an upstream that keeps failing.
+
+    The circuit starts closed. After `failure_threshold` consecutive failures
+    it opens, and the requests are rejected without reaching the upstream.
+    Once `recovery_timeout` seconds have passed it becomes half-open, letting
+    through up to `half_open_max_calls` probes: the first successful probe
+    closes the circuit, a failed one opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        """
+        :param name: The name of the circuit, used in logs and health checks.
+        :param failure_threshold: The consecutive failures opening the circuit.
+            0 disables the circuit breaker.
+        :param recovery_timeout: How long the circuit stays open, in seconds.
+        :param half_open_max_calls: The concurrent probes allowed when half-open.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(half_open_max_calls, 1)
+        self.failures = 0
+        self.rejected = 0
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probes_started_at = 0.0
+
+    @classmethod
+    def from_settings(cls, name: str) -> CircuitBreaker:
+        return cls(
+            name=name,
+            failure_threshold=settings.circuit_breaker_failure_threshold,
+            recovery_timeout=settings.circuit_breaker_recovery_timeout,
+            half_open_max_calls=settings.circuit_breaker_half_open_max_calls,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state is CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._probes = 0
+            logger.info("Circuit %s is half-open, probing the upstream", self.name)
+        return self._state
+
+    def retry_after(self) -> float:
+        """
+        Returns the seconds left before the upstream is probed again.
+        """
+        if self._state is not CircuitState.OPEN:
+            return 0.0
+        return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow_request(self) -> bool:
+        """
+        Returns True if a request can be sent to the upstream.
+        When half-open, the allowed request is counted as a probe.
+        """
+        if not self.enabled:
+            return True
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN:
+            now = time.monotonic()
+            if self._probes and now - self._probes_started_at >= self.recovery_timeout:
+                # the probes never reported back (e.g. they were cancelled)
+                self._probes = 0
+            if self._probes < self.half_open_max_calls:
+                if not self._probes:
+                    self._probes_started_at = now
+                self._probes += 1
+                return True
+        self.rejected += 1
+        return False
+
+    def check(self):
+        """
+        Ensures that a request can be sent to the upstream.
+
+        :raise: CircuitOpenError if the circuit doesn't allow the request.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        """Records a request answered by the upstream."""
+        if self._state is not CircuitState.CLOSED:
+            logger.info("Circuit %s is closed, the upstream recovered", self.name)
+        self._state = CircuitState.CLOSED
+        self.failures = 0
+        self._probes = 0
+
+    def record_failure(self):
+        """Records a request the upstream failed to answer."""
+        if not self.enabled:
+            return
+        self.failures += 1
+        if self._state is CircuitState.HALF_OPEN or (
+            self._state is CircuitState.CLOSED
+            and self.failures >= self.failure_threshold
+        ):
+            self._open()
+
+    def stats(self) -> dict[str, str | int | float]:
+        """
+        Returns the state of the circuit, for the health checks.
+        """
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+    def _open(self):
+        logger.warning(
+            "Circuit %s is open after %d failures, rejecting the requests for %.0fs",
+            self.name,
+            self.failures,
+            self.recovery_timeout,
+        )
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from typing import Any
+
+
+async def bounded_as_completed(
+    func: Callable[[Any], Awaitable[Any]], items: Iterable[Any], limit: int
+) -> AsyncIterator[tuple[int, Any, Any]]:
+    """
+    Runs `func` for each item, with at most `limit` calls running at once,
+    and yields the outcomes as soon as they are available.
+
+    A failed call doesn't stop the others: its exception is yielded as the
+    outcome. When the iteration is abandoned (e.g. the client disconnected
+    from a streaming response), the calls still running are cancelled.
+
+        async for index, item, outcome in bounded_as_completed(create, users, 10):
+            ...
+
+    :param func: The coroutine function to call with each item.
+    :param items: The items to process.
+    :param limit: The maximum number of concurrent calls.
+    :return: An async iterator of (index, item, result or exception) tuples,
+        in completion order.
+    """
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def run(index: int, item: Any) -> tuple[int, Any, Any]:
+        async with semaphore:
+            try:
+                return index, item, await func(item)
+            except Exception as error:
+                return index, item, error
+
+    tasks = [
+        asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -16,7 +16,73 @@ class Settings(BaseSettings):
     description: str = "Service to provide custom users and org management"
     algorithm: str = "HS256"
     leeway: float = 30.0
-    default_request_timeout: int = 10  # API Client
+    jwt_cache_size: int = 1024  # verified tokens kept, 0 disables the cache
+    log_level: str = "INFO"
+    log_queue_enabled: bool = True  # write the logs from a background thread
+    log_payloads: bool = False  # log the payloads exchanged with OptScale
+    log_payload_max_length: int = 512
+    default_request_timeout: float = 10  # API Client
+    # the connect, read, write and pool timeouts default to default_request_timeout
+    api_client_connect_timeout: float | None = None
+    api_client_read_timeout: float | None = None
+    api_client_write_timeout: float | None = None
+    api_client_pool_timeout: float | None = None
+    # read and write timeouts per endpoint prefix, e.g. {"/auth/v2/tokens": 5}
+    api_client_endpoint_timeouts: dict[str, float] = {}
+    # total time budget of the upstream calls of a request, 0 disables it
+    request_deadline: float = 15.0
+    api_client_max_connections: int = 100
+    api_client_max_keepalive_connections: int = 20
+    api_client_keepalive_expiry: float = 30.0
+    api_client_http2: bool = False  # requires the `h2` package
+    api_client_coalesce_gets: bool = False
+    api_client_retry_attempts: int = 3  # 1 disables the retries
+    api_client_retry_backoff_base: float = 0.2  # seconds
+    api_client_retry_backoff_max: float = 5.0
+    api_client_retry_jitter: bool = True
+    api_client_retry_statuses: list[int] = [502, 503, 504]
+    # the quota of the OptScale requests by endpoint prefix, e.g. {"": "100/s"},
+    # for this worker unless the store is shared (sqlite)
+    api_client_rate_limits: dict[str, str] = {}
+    api_client_rate_limit_max_wait: float = 5.0  # seconds a request waits at most
+    api_client_rate_limit_store: str = "memory"  # memory or sqlite
+    circuit_breaker_failure_threshold: int = 5  # 0 disables the circuit breaker
+    circuit_breaker_recovery_timeout: float = 30.0  # seconds
+    circuit_breaker_half_open_max_calls: int = 1
+    user_access_token_cache_ttl: int = 300  # seconds, 0 disables the cache
+    user_access_token_cache_size: int = 1024
+    # a token is dropped from the cache this many seconds before it expires
+    user_access_token_expiry_margin: int = 60
+    response_cache_ttl: int = 0  # seconds, 0 disables the cache
+    response_cache_stale_ttl: int = 30
+    response_cache_size: int = 4096
+    batch_max_size: int = 500  # items accepted by the batch endpoints
+    batch_concurrency: int = 10  # upstream calls running at once for a batch
+    # shared by the workers to aggregate their metrics, emptied before starting
+    metrics_multiprocess_dir: str | None = None
+    metrics_write_interval: float = 5.0  # seconds
+    tracing_exporter: str = "none"  # none, console or file
+    tracing_file: str = "traces.jsonl"  # the spans written by the file exporter
+    # the responses replayed for the requests sent again with an Idempotency-Key
+    idempotency_store: str = "memory"  # memory or sqlite, shared by the workers
+    idempotency_sqlite_path: str = "idempotency.sqlite3"
+    idempotency_store_size: int = 10000  # keys kept by the memory store
+    idempotency_ttl: int = 3600  # seconds, 0 disables the idempotency support
+    idempotency_lock_ttl: float = 60.0  # a request holds its key at most
+    idempotency_wait_timeout: float = 30.0  # duplicates wait for the first request
+    # requests processed at once per worker, the others wait or get a 503
+    admission_max_in_flight: int = 100  # 0 disables the admission control
+    admission_max_queue: int = 50  # requests waiting for a slot
+    admission_queue_timeout: float = 2.0  # seconds
+    admission_retry_after: float = 1.0  # seconds, sent to the rejected callers
+    # requests per caller, identified by a claim of its JWT (sub, iss, ...)
+    rate_limit_key_claim: str = "sub"
+    rate_limit_default: str | None = None  # e.g. "600/minute", None disables it
+    # limits by route, e.g. {"GET /v1/admin/organizations": "60/minute"}
+    rate_limit_routes: dict[str, str] = {}
+    rate_limit_store: str = "memory"  # memory (per worker) or sqlite (per host)
+    rate_limit_sqlite_path: str = "rate_limits.sqlite3"
+    rate_limit_store_size: int = 10000  # buckets kept by the memory store
 
     class Config:
         env_file = "/app/.env.test"
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The monotonic time by which the upstream calls of the current request must end
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the time budget of the current request is exhausted."""
+
+    pass
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Limits the total time the upstream calls made within the block can take.
+    A nested deadline can only shorten the enclosing one.
+
+        with deadline(15):
+            token = await get_user_access_token(...)
+            response = await api_client.get(...)
+
+    :param seconds: The time budget, in seconds. None or 0 add no limit.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """
+    Returns the seconds left before the current deadline, or None if there is none.
+    The result is negative once the deadline has passed.
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
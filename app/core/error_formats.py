@@ -5,6 +5,9 @@ from typing import Any
 
 from fastapi import HTTPException
 
+from app.core.request_id import get_request_id
+from app.core.tracing import current_trace_id
+
 # Mapping of HTTP status codes to type URLs
 STATUS_TYPE_URLS = {
     400: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.1",
@@ -15,7 +18,11 @@ STATUS_TYPE_URLS = {
     406: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.6",
     408: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.7",
     409: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.8",
+    422: "https://datatracker.ietf.org/doc/html/rfc4918#section-11.2",
+    429: "https://datatracker.ietf.org/doc/html/rfc6585#section-4",
     500: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.6.1",
+    503: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.6.4",
+    504: "https://datatracker.ietf.org/doc/html/rfc7231#section-6.6.5",
 }
 
 DEFAULT_TYPE_URL = "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.4"
@@ -38,8 +45,8 @@ def create_error_response(
     :return: JSONResponse with the standardized error structure.
     """
     type_url = STATUS_TYPE_URLS.get(status_code, DEFAULT_TYPE_URL)  # 400
-    trace_id = uuid.uuid4().hex  # The unique  ID to trace the error
-    # todo: check for a specific format for this traceID
+    # The ID of the request's trace, to find its spans, or a unique ID
+    trace_id = current_trace_id() or uuid.uuid4().hex
 
     # Validate and serialize the `errors` field
     if errors is not None:
@@ -55,6 +62,7 @@ def create_error_response(
         "title": title,
         "status": status_code,
         "traceId": trace_id,
+        "requestId": get_request_id() or trace_id,
         "errors": errors or {},
     }
     # Return the error as an HTTPException
@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 from typing import NoReturn
 
+from fastapi import HTTPException
 from fastapi import status as http_status
 
 from app.core.error_formats import create_error_response
@@ -65,9 +66,20 @@ def handle_exception(error: Exception) -> NoReturn:
     Returns:
         NoReturn: This function does not return; it always raises an exception.
     """
-    logger.error(f"Exception occurred during user creation: {error}")
+    logger.error("Exception occurred during user creation: %s", error)
+    raise format_exception(error)
+
+
+def format_exception(error: Exception) -> HTTPException:
+    """
+    Builds the standardized error response of an exception, for instance
+    to report the outcome of an item of a batch.
+
+    :param error: The exception to format.
+    :return: An HTTPException whose `detail` is the RFC7807 error.
+    """
     error = error.__dict__
-    raise create_error_response(
+    return create_error_response(
         status_code=error.get("status_code", http_status.HTTP_403_FORBIDDEN),
         title=error.get("title", "Exception occurred"),
         errors={"reason": error.get("reason", "No details available")},
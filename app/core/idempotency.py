@@ -0,0 +1,433 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from fastapi import status as http_status
+from starlette.responses import Response
+
+from app import settings
+from app.core.cache import TTLCache, fingerprint
+from app.core.error_formats import create_error_response
+from app.core.retry import IDEMPOTENCY_KEY_HEADER
+from app.core.single_flight import SingleFlight
+from app.core.sqlite_db import SQLiteDatabase
+
+if TYPE_CHECKING:
+    from app.core.auth_jwt_bearer import JWTClaims
+
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+# printable ASCII, as the key is part of the store keys and of the logs
+_VALID_IDEMPOTENCY_KEY = re.compile(r"^[\x21-\x7e]{1,255}$")
+
+
+def caller_identity(claims: JWTClaims) -> str:
+    """
+    Returns the identity of a caller that its idempotency keys are scoped to,
+    a fingerprint of the issuer and the subject of its verified JWT token.
+
+    :param claims: The verified claims of the caller.
+    """
+    return fingerprint(json.dumps([claims.iss, claims.sub]))
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResponse:
+    """
+    The response of a request, as replayed to its duplicates.
+    """
+
+    status_code: int
+    body: bytes
+    media_type: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class IdempotencyRecord:
+    """
+    The state of an idempotency key: the fingerprint of the payload of the
+    first request sent with it, and its response once it has completed.
+    """
+
+    fingerprint: str
+    response: StoredResponse | None = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self.response is None
+
+
+class IdempotencyStore(ABC):
+    """
+    The storage of the idempotency keys.
+    A key is either in progress, while the first request sent with it runs,
+    or completed, with the response to replay.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> IdempotencyRecord | None:
+        """
+        Returns the record of the key, or None if it's unknown or expired.
+        """
+
+    @abstractmethod
+    async def acquire(self, key: str, fingerprint: str, ttl: float) -> bool:
+        """
+        Marks the key as in progress, for at most `ttl` seconds, unless
+        there is already a record for it.
+
+        :return: True if the key was acquired, False if it's already known.
+        """
+
+    @abstractmethod
+    async def complete(self, key: str, response: StoredResponse, ttl: float):
+        """
+        Stores the response of an acquired key, to be replayed for `ttl` seconds.
+        """
+
+    @abstractmethod
+    async def release(self, key: str):
+        """
+        Forgets an acquired key that has not completed, so that it can be retried.
+        """
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """
+    An IdempotencyStore keeping the keys in a per-process LRU cache.
+    The duplicates are only recognized when they reach the same worker.
+    """
+
+    def __init__(self, maxsize: int):
+        """
+        :param maxsize: The completed keys to keep. The keys in progress are
+            not evicted, they are bounded by the requests running.
+        """
+        self.records = TTLCache(maxsize=maxsize, ttl=0)
+        self.in_progress: dict[str, tuple[float, IdempotencyRecord]] = {}
+
+    async def get(self, key: str) -> IdempotencyRecord | None:
+        return self._get_in_progress(key) or self.records.get(key)
+
+    async def acquire(self, key: str, fingerprint: str, ttl: float) -> bool:
+        if await self.get(key) is not None:
+            return False
+        self.in_progress[key] = (
+            time.monotonic() + ttl,
+            IdempotencyRecord(fingerprint=fingerprint),
+        )
+        return True
+
+    async def complete(self, key: str, response: StoredResponse, ttl: float):
+        record = self._get_in_progress(key)
+        if record is not None:
+            del self.in_progress[key]
+            self.records.set(
+                key,
+                IdempotencyRecord(fingerprint=record.fingerprint, response=response),
+                ttl=ttl,
+            )
+
+    async def release(self, key: str):
+        self.in_progress.pop(key, None)
+
+    def clear(self):
+        self.records.clear()
+        self.in_progress.clear()
+
+    def _get_in_progress(self, key: str) -> IdempotencyRecord | None:
+        entry = self.in_progress.get(key)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at > time.monotonic():
+            return record
+        del self.in_progress[key]
+        return None
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    An IdempotencyStore keeping the keys in a SQLite file, shared by the
+    workers of a host.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        """
+        :param path: The path of the database file, created if needed.
+        :param timeout: How long to wait for a lock held by another worker, in seconds.
+        """
+        self.db = SQLiteDatabase(
+            path,
+            schema=(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+                "status_code INTEGER, body BLOB, media_type TEXT, "
+                "expires_at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at "
+                "ON idempotency_keys (expires_at)",
+            ),
+            timeout=timeout,
+        )
+
+    async def get(self, key: str) -> IdempotencyRecord | None:
+        row = await self.db.execute(
+            "SELECT fingerprint, status_code, body, media_type "
+            "FROM idempotency_keys WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+            fetch=True,
+        )
+        if row is None:
+            return None
+        key_fingerprint, status_code, body, media_type = row
+        if status_code is None:
+            return IdempotencyRecord(fingerprint=key_fingerprint)
+        return IdempotencyRecord(
+            fingerprint=key_fingerprint,
+            response=StoredResponse(
+                status_code=status_code, body=bytes(body), media_type=media_type
+            ),
+        )
+
+    async def acquire(self, key: str, fingerprint: str, ttl: float) -> bool:
+        now = time.time()
+        # the record of an expired key is taken over in the same statement,
+        # so that only one of the workers can acquire the key
+        acquired = await self.db.execute(
+            "INSERT INTO idempotency_keys (key, fingerprint, expires_at) "
+            "VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, "
+            "status_code = NULL, body = NULL, media_type = NULL, "
+            "expires_at = excluded.expires_at "
+            "WHERE idempotency_keys.expires_at <= ?",
+            (key, fingerprint, now + ttl, now),
+        )
+        return acquired == 1
+
+    async def complete(self, key: str, response: StoredResponse, ttl: float):
+        now = time.time()
+        await self.db.execute(
+            "UPDATE idempotency_keys SET status_code = ?, body = ?, media_type = ?, "
+            "expires_at = ? WHERE key = ?",
+            (response.status_code, response.body, response.media_type, now + ttl, key),
+        )
+        await self.db.execute(
+            "DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,)
+        )
+
+    async def release(self, key: str):
+        await self.db.execute(
+            "DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL",
+            (key,),
+        )
+
+    def close(self):
+        self.db.close()
+
+
+class IdempotentRequests:
+    """
+    Runs the requests carrying an `Idempotency-Key` header at most once.
+
+    The successful response of the first request sent with a key is stored
+    and replayed, with the `Idempotent-Replayed: true` header, to the
+    requests sent again by the same caller with the same key and payload.
+    The keys of different callers never collide. The duplicates arriving
+    while the first request runs wait for its response instead of running
+    it again. A failed request is not stored, so that it can be retried.
+
+    The credentials a response carries, like the token of a new user, are
+    not meant to be stored: a handler can redact them from the stored
+    response and restore fresh ones when it's replayed.
+    """
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        ttl: float = 3600,
+        lock_ttl: float = 60.0,
+        wait_timeout: float = 30.0,
+        poll_interval: float = 0.1,
+    ):
+        """
+        :param store: The storage of the keys.
+        :param ttl: For how long a response is replayed, in seconds. 0 disables
+            the idempotency support.
+        :param lock_ttl: For how long a key stays in progress at most, in case
+            the worker running the request dies, in seconds.
+        :param wait_timeout: For how long a duplicate waits for the first
+            request to complete, in seconds.
+        :param poll_interval: How often a duplicate checks the store while a
+            request with the same key runs in another worker, in seconds.
+        """
+        self.store = store
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._flights = SingleFlight()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def run(
+        self,
+        idempotency_key: str | None,
+        scope: str,
+        payload: Any,
+        handler: Callable[[], Awaitable[Response]],
+        claims: JWTClaims | None,
+        redact: Callable[[StoredResponse], StoredResponse] | None = None,
+        restore: Callable[[StoredResponse], Awaitable[StoredResponse]] | None = None,
+    ) -> Response:
+        """
+        Runs the handler of a request, unless a request with the same key
+        has already run.
+
+        :param idempotency_key: The value of the `Idempotency-Key` header, if any.
+        :param scope: The operation the key is used for, e.g. `POST /users`.
+        :param payload: The JSON serializable payload of the request.
+        :param handler: A callable returning the awaitable building the response.
+        :param claims: The verified claims of the caller, see `caller_identity`.
+        :param redact: Removes the secrets from a response before it's stored.
+        :param restore: Completes a stored response before it's replayed.
+        :return: The response of the handler, or the stored one for a duplicate.
+        :raise: HTTPException if the key is invalid or sent by an anonymous
+            caller, is being used with a different payload or the first
+            request doesn't complete in time.
+            Any exception raised by the handler or by `restore`.
+        """
+        if idempotency_key is None or not self.enabled:
+            return await handler()
+        if not _VALID_IDEMPOTENCY_KEY.match(idempotency_key):
+            raise create_error_response(
+                status_code=http_status.HTTP_400_BAD_REQUEST,
+                title=f"Invalid {IDEMPOTENCY_KEY_HEADER} header",
+                errors={
+                    "reason": "The key must be 1 to 255 printable ASCII characters"
+                },
+            )
+
+        if claims is None:
+            # the keys are scoped to their caller
+            raise create_error_response(
+                status_code=http_status.HTTP_401_UNAUTHORIZED,
+                title=f"{IDEMPOTENCY_KEY_HEADER} requires authentication",
+                errors={
+                    "reason": "The key can only be used by an authenticated caller"
+                },
+            )
+
+        key = f"{scope}:{caller_identity(claims)}:{idempotency_key}"
+        payload_fingerprint = fingerprint(
+            json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        )
+        # the concurrent duplicates reaching this worker share the first
+        # request; a payload mismatch is detected by the store instead
+        flight_key = (key, payload_fingerprint)
+        duplicate = self._flights.is_in_flight(flight_key)
+        response, replayed = await self._flights.do(
+            flight_key,
+            lambda: self._run_once(key, payload_fingerprint, handler, redact),
+        )
+        if replayed and restore is not None:
+            response = await restore(response)
+        headers = (
+            {IDEMPOTENT_REPLAYED_HEADER: "true"} if replayed or duplicate else None
+        )
+        return Response(
+            content=response.body,
+            status_code=response.status_code,
+            media_type=response.media_type,
+            headers=headers,
+        )
+
+    async def _run_once(
+        self,
+        key: str,
+        payload_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+        redact: Callable[[StoredResponse], StoredResponse] | None,
+    ) -> tuple[StoredResponse, bool]:
+        wait_until = time.monotonic() + self.wait_timeout
+        while not await self.store.acquire(key, payload_fingerprint, self.lock_ttl):
+            record = await self.store.get(key)
+            # None if it has expired or failed meanwhile, acquired again below
+            if record is not None:
+                if record.fingerprint != payload_fingerprint:
+                    raise create_error_response(
+                        status_code=http_status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        title=f"{IDEMPOTENCY_KEY_HEADER} already used",
+                        errors={
+                            "reason": "The key was used for a request with a "
+                            "different payload"
+                        },
+                    )
+                if not record.in_progress:
+                    return record.response, True
+            if time.monotonic() >= wait_until:
+                raise create_error_response(
+                    status_code=http_status.HTTP_409_CONFLICT,
+                    title=f"{IDEMPOTENCY_KEY_HEADER} in use",
+                    errors={
+                        "reason": "A request with the same key is still in progress"
+                    },
+                )
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            response = await handler()
+        except BaseException:
+            await self.store.release(key)
+            raise
+        stored = StoredResponse(
+            status_code=response.status_code,
+            body=bytes(response.body),
+            media_type=response.media_type,
+        )
+        if 200 <= stored.status_code < 300:
+            await self.store.complete(
+                key, stored if redact is None else redact(stored), self.ttl
+            )
+        else:
+            await self.store.release(key)
+        return stored, False
+
+
+def create_idempotency_store(
+    kind: str, sqlite_path: str, maxsize: int
+) -> IdempotencyStore:
+    """
+    Creates the store of the idempotency keys.
+
+    :param kind: `memory` for a per-worker store or `sqlite` for a file
+        shared by the workers of the host.
+    :param sqlite_path: The database file of the `sqlite` store.
+    :param maxsize: The keys kept by the `memory` store.
+    :raise: ValueError if the kind is unknown.
+    """
+    if kind == "memory":
+        return InMemoryIdempotencyStore(maxsize=maxsize)
+    if kind == "sqlite":
+        return SQLiteIdempotencyStore(path=sqlite_path)
+    raise ValueError(f"Unknown idempotency store: {kind}")
+
+
+idempotent_requests = IdempotentRequests(
+    store=create_idempotency_store(
+        settings.idempotency_store,
+        settings.idempotency_sqlite_path,
+        settings.idempotency_store_size,
+    ),
+    ttl=settings.idempotency_ttl,
+    lock_ttl=settings.idempotency_lock_ttl,
+    wait_timeout=settings.idempotency_wait_timeout,
+)
@@ -8,6 +8,19 @@ logger = logging.getLogger(__name__)
 DEFAULT_CURRENCY = "USD"
 
 
+def is_valid_currency(currency: str) -> bool:
+    """
+    Returns True if the currency is a known ISO 4217 code.
+
+    :param currency: The currency code, like `USD`.
+    """
+    try:
+        get_currency_by_code(currency)
+    except CurrencyNotFoundError:
+        return False
+    return True
+
+
 def validate_currency(func):
     """
     Validates the currency code
@@ -17,9 +30,7 @@ def validate_currency(func):
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
         currency = kwargs.get("currency", DEFAULT_CURRENCY)
-        try:
-            get_currency_by_code(currency)
-        except CurrencyNotFoundError:
+        if not is_valid_currency(currency):
             logger.error(f"Invalid currency: {currency}.")
             return None
         return await func(*args, **kwargs)
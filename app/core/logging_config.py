@@ -1,7 +1,16 @@
+import atexit
+import copy
+import functools
 import logging.config
+import queue
+import reprlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
 
 from pythonjsonlogger import jsonlogger  # noqa
 
+from app.core.request_id import RequestIDLogFilter
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -11,15 +20,130 @@ LOGGING = {
             "class": "pythonjsonlogger.jsonlogger.JsonFormatter",
         }
     },
+    "filters": {"request_id": {"()": RequestIDLogFilter}},
     "handlers": {
         "stdout": {
             "class": "logging.StreamHandler",
             "stream": "ext://sys.stdout",
             "formatter": "json",
+            "filters": ["request_id"],
         }
     },
     "loggers": {"": {"handlers": ["stdout"], "level": "DEBUG"}},
 }
 
+# How the payloads exchanged with OptScale are logged, see `LogPayload`
+PAYLOADS_LOGGING = {"enabled": False, "max_length": 512}
+
+_queue_listener: QueueListener | None = None
+
+
+def configure_logging(
+    level: str = "INFO",
+    use_queue: bool = True,
+    log_payloads: bool = False,
+    payload_max_length: int = 512,
+):
+    """
+    Configures the JSON logging of the application.
+
+    With `use_queue`, the log records are only put in a queue by the logging
+    calls, while a background thread formats them and writes them to stdout,
+    so the event loop is never blocked by the log output.
+
+    :param level: The level of the root logger.
+    :param use_queue: Whether to hand the records over to a background thread.
+    :param log_payloads: Whether the payloads wrapped in `LogPayload` are logged.
+    :param payload_max_length: The length the logged payloads are truncated to.
+    """
+    global _queue_listener
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+    config = copy.deepcopy(LOGGING)
+    config["loggers"][""]["level"] = level.upper()
+    logging.config.dictConfig(config)
+
+    PAYLOADS_LOGGING["enabled"] = log_payloads
+    PAYLOADS_LOGGING["max_length"] = payload_max_length
+
+    if use_queue:
+        root_logger = logging.getLogger()
+        handlers = list(root_logger.handlers)
+        log_queue = queue.SimpleQueue()
+        for handler in handlers:
+            root_logger.removeHandler(handler)
+        queue_handler = QueueHandler(log_queue)
+        # the request ID must be read before the record leaves the request's context
+        queue_handler.addFilter(RequestIDLogFilter())
+        root_logger.addHandler(queue_handler)
+        _queue_listener = QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        _queue_listener.start()
+
+
+def stop_logging():
+    """
+    Flushes the queued log records and stops the background logging thread.
+    """
+    global _queue_listener
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(stop_logging)
+
+
+class LogPayload:
+    """
+    Wraps a payload passed as argument of a logging call, so that it is
+    rendered only if the record is emitted, and according to the settings:
+    omitted unless the payloads logging is enabled, truncated otherwise.
+    A truncated payload is rendered with a bounded repr, so that a large
+    one is never rendered in full on the event loop.
+
+    logger.info("User created: %s", LogPayload(response))
+    """
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        if not PAYLOADS_LOGGING["enabled"]:
+            return "<omitted>"
+        max_length = PAYLOADS_LOGGING["max_length"]
+        if not max_length:
+            return str(self.payload)
+        if isinstance(self.payload, str):
+            text = self.payload[: max_length + 1]
+        else:
+            text = _payload_repr(max_length).repr(self.payload)
+        if len(text) > max_length:
+            return f"{text[:max_length]}..."
+        return text
+
+
+class _PayloadRepr(reprlib.Repr):
+    def repr_bytes(self, value: bytes, level: int) -> str:
+        # the default one renders the whole value before truncating it
+        if len(value) <= self.maxstring:
+            return repr(value)
+        return f"{value[: self.maxstring]!r}..."
+
 
-logging.config.dictConfig(LOGGING)
+@functools.lru_cache(maxsize=4)
+def _payload_repr(max_length: int) -> reprlib.Repr:
+    payload_repr = _PayloadRepr()
+    payload_repr.maxstring = payload_repr.maxlong = payload_repr.maxother = max_length
+    # every item takes a few characters at least
+    max_items = max(max_length // 4, 1)
+    payload_repr.maxdict = payload_repr.maxlist = payload_repr.maxtuple = max_items
+    payload_repr.maxset = payload_repr.maxfrozenset = payload_repr.maxdeque = max_items
+    return payload_repr
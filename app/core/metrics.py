@@ -0,0 +1,444 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ID_SEGMENT = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}|\d+)$",
+    re.IGNORECASE,
+)
+
+
+def endpoint_label(endpoint: str) -> str:
+    """
+    Returns the endpoint without its query string and with the ids it
+    contains replaced by `:id`, so that it can be used as a label value
+    without creating a time series per resource.
+
+    :param endpoint: The path of an upstream request, like `/auth/v2/users/<uuid>`.
+    :return: The templated path, like `/auth/v2/users/:id`.
+    """
+    path = endpoint.split("?", 1)[0]
+    return "/".join(
+        ":id" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")
+    )
+
+
+class Metric:
+    """
+    The values of a metric, for each combination of its label values.
+    The label values are passed as a tuple, in the order of the label names.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple[str, ...], Any] = {}
+
+    def clear(self):
+        self.values.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(labels), value] for labels, value in self.values.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: tuple[str, ...] = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, labels: tuple[str, ...], value: float):
+        """
+        Sets the total, for the counters collected from existing counters
+        like the hits of a cache.
+        """
+        self.values[labels] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, labels: tuple[str, ...] = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple[str, ...] = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: tuple[str, ...], value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: tuple[str, ...], value: float):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = {
+                # the last bucket counts the values above the highest bound
+                "buckets": [0] * (len(self.buckets) + 1),
+                "sum": 0.0,
+                "count": 0,
+            }
+        state["buckets"][bisect_left(self.buckets, value)] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of the process.
+
+    The values that are already tracked elsewhere, like the counters of the
+    caches or the connections of the pools, are read by collectors when the
+    metrics are collected instead of being updated on each event.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def _register(self, metric: Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Iterable[str] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Iterable[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Adds a function called each time the metrics are collected,
+        to update the metrics it's responsible for.
+        """
+        self._collectors.append(collector)
+
+    def collect(self) -> dict[str, dict[str, Any]]:
+        """
+        Runs the collectors and returns a JSON serializable snapshot of the
+        metrics.
+        """
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Failed to collect metrics with %r", collector)
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+def merge_snapshots(
+    snapshots: Iterable[tuple[dict[str, dict[str, Any]], bool]],
+) -> dict[str, dict[str, Any]]:
+    """
+    Merges the snapshots of several processes.
+
+    The counters and the histograms are summed, so that the totals of the
+    processes that exited are kept. The gauges are summed for the processes
+    that are still alive only.
+
+    :param snapshots: The snapshots along with whether their process is alive.
+    :return: The merged snapshot.
+    """
+    merged: dict[str, dict[str, Any]] = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": []})
+            values = target.setdefault("values", {})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = values.get(key)
+                if current is None:
+                    values[key] = (
+                        {**value, "buckets": list(value["buckets"])}
+                        if isinstance(value, dict)
+                        else value
+                    )
+                elif isinstance(value, dict):
+                    current["buckets"] = [
+                        a + b
+                        for a, b in zip(
+                            current["buckets"], value["buckets"], strict=True
+                        )
+                    ]
+                    current["sum"] += value["sum"]
+                    current["count"] += value["count"]
+                else:
+                    values[key] = current + value
+    for metric in merged.values():
+        metric["samples"] = [
+            [list(labels), value] for labels, value in metric.pop("values").items()
+        ]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"'
+        for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_text(snapshot: dict[str, dict[str, Any]]) -> str:
+    """
+    Renders a snapshot in the Prometheus text exposition format (0.0.4).
+    """
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"]):
+            if metric["type"] != "histogram":
+                lines.append(
+                    f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}"
+                )
+                continue
+            cumulative = 0
+            bounds = [*metric["buckets"], float("inf")]
+            for bound, count in zip(bounds, value["buckets"], strict=True):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    [*labelnames, "le"], [*labels, _format_value(bound)]
+                )
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            labels_text = _format_labels(labelnames, labels)
+            lines.append(f"{name}_sum{labels_text} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{labels_text} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiProcessCollector:
+    """
+    Aggregates the metrics of the worker processes of a server like gunicorn,
+    where each scrape is answered by a single worker.
+
+    Each worker periodically writes a snapshot of its metrics to a file of the
+    shared directory, and the worker answering a scrape merges them all.
+    The metrics of the other workers are as old as their last write, at most
+    `interval` seconds. The directory must be emptied before the server
+    starts, otherwise the counters of the previous run are added to the new ones.
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float):
+        """
+        :param registry: The registry of the process.
+        :param directory: The directory shared by the workers.
+        :param interval: The number of seconds between two writes of a worker.
+        """
+        self.registry = registry
+        self.directory = Path(directory)
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def write(self, snapshot: dict[str, dict[str, Any]] | None = None):
+        """
+        Writes the snapshot of the current process, atomically so that
+        a reader never sees a partial file.
+        This blocks on the file system: the event loop calls it in a thread.
+
+        :param snapshot: The snapshot to write, collected from the registry
+            if omitted.
+        """
+        if snapshot is None:
+            snapshot = self.registry.collect()
+        pid = os.getpid()
+        path = self.directory / f"metrics_{pid}.json"
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(snapshot))
+        os.replace(temp_path, path)
+
+    def collect(
+        self, snapshot: dict[str, dict[str, Any]] | None = None
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Writes the snapshot of the current process and returns the merged
+        snapshots of all the processes.
+        This blocks on the file system: the event loop calls it in a thread.
+
+        :param snapshot: The snapshot of the current process, collected from
+            the registry if omitted.
+        """
+        self.write(snapshot)
+        snapshots = []
+        for path in self.directory.glob("metrics_*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+                pid = int(path.stem.removeprefix("metrics_"))
+            except (OSError, ValueError):
+                logger.warning("Skipped the unreadable metrics file %s", path)
+                continue
+            snapshots.append((snapshot, _is_alive(pid)))
+        return merge_snapshots(snapshots)
+
+    async def write_async(self):
+        """
+        Writes the snapshot of the current process without blocking the event
+        loop: the snapshot is collected on the loop, where the metrics are
+        updated, and written in a thread.
+        """
+        await asyncio.to_thread(self.write, self.registry.collect())
+
+    async def _write_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.write_async()
+            except OSError as error:
+                logger.warning("Failed to write the metrics: %r", error)
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.ensure_future(self._write_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.write_async()
+
+
+registry = MetricsRegistry()
+multiprocess_collector: MultiProcessCollector | None = None
+
+cache_lookups = registry.counter(
+    "cache_lookups_total",
+    "Lookups of the in-process caches, by result.",
+    ("cache", "result"),
+)
+
+
+def register_cache(name: str, cache: Any):
+    """
+    Exposes the counters returned by the `stats()` method of a cache
+    as `cache_lookups_total{cache=<name>, result="hit"|"miss"|"stale"}`.
+
+    :param name: The name of the cache.
+    :param cache: A TTLCache or a ResponseCache.
+    """
+
+    def collect():
+        stats = cache.stats()
+        for key, result in (
+            ("hits", "hit"),
+            ("misses", "miss"),
+            ("stale_hits", "stale"),
+        ):
+            if key in stats:
+                cache_lookups.set((name, result), stats[key])
+
+    registry.add_collector(collect)
+
+
+def configure_multiprocess(
+    directory: str | None, interval: float
+) -> MultiProcessCollector | None:
+    """
+    Enables the aggregation of the metrics of the worker processes
+    when a directory is set.
+
+    :param directory: The directory shared by the workers, or None.
+    :param interval: The number of seconds between two writes of a worker.
+    :return: The collector to start and stop with the application, if any.
+    """
+    global multiprocess_collector
+    multiprocess_collector = (
+        MultiProcessCollector(registry, directory, interval) if directory else None
+    )
+    return multiprocess_collector
+
+
+async def render_metrics() -> str:
+    """
+    Returns the metrics of the service in the Prometheus text format,
+    aggregated across the worker processes in multiprocess mode.
+
+    The snapshot of the process is collected on the event loop, where the
+    metrics are updated, so that it's consistent. The files of the workers
+    are written, read and merged in a thread, not to block the event loop.
+    """
+    snapshot = registry.collect()
+    if multiprocess_collector is None:
+        return render_text(snapshot)
+    collector = multiprocess_collector
+    return await asyncio.to_thread(lambda: render_text(collector.collect(snapshot)))
@@ -0,0 +1,278 @@
+import logging
+import math
+import os
+import time
+
+from starlette.datastructures import URL
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+from app.core.admission import AdmissionController, AdmissionRejectedError
+from app.core.error_formats import create_error_response
+from app.core.request_id import REQUEST_ID_HEADER, parse_request_id, request_id_context
+from app.core.responses import FastJSONResponse
+from app.core.tracing import TRACEPARENT_HEADER, SpanContext, current_trace_id, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class LogRequestMiddleware:
+    """
+    Logs every HTTP request along with its response status and processing time.
+
+    It's a pure ASGI middleware: unlike the ones based on Starlette's
+    BaseHTTPMiddleware, it doesn't run the application in a separate task
+    nor buffer the response through a memory stream.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Request: %s %s", scope["method"], URL(scope=scope))
+        start_time = time.monotonic()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time = time.monotonic() - start_time
+            logger.info(
+                "Response: status_code=%s, process_time=%.2fs",
+                status_code,
+                process_time,
+            )
+
+
+http_requests_in_flight = metrics.registry.gauge(
+    "http_requests_in_flight", "Inbound requests being processed."
+)
+http_request_duration = metrics.registry.histogram(
+    "http_request_duration_seconds",
+    "Processing time of the inbound requests, by route and status code.",
+    ("method", "route", "status"),
+)
+
+
+class MetricsMiddleware:
+    """
+    Records the in-flight inbound requests and their processing time, by
+    route template (e.g. `/v1/admin/organizations`) rather than by path,
+    so that the ids of the resources don't create a time series each.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.monotonic()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # set by the router when a route matched
+            route = scope.get("route")
+            http_request_duration.observe(
+                (
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    str(status_code),
+                ),
+                time.monotonic() - start_time,
+            )
+
+
+class TracingMiddleware:
+    """
+    Runs each HTTP request in a server span, child of the caller's span when
+    the request carries a `traceparent` header. The span is named after the
+    route template once the request has been routed.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER.encode():
+                traceparent = value.decode("latin-1")
+                break
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            kind="server",
+            attributes={
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+            },
+            remote_parent=SpanContext.from_traceparent(traceparent),
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
+                span.set_attribute("http.response.status_code", status_code)
+                if status_code >= 500:
+                    span.set_error()
+
+
+class RequestIDMiddleware:
+    """
+    Sets the ID of each HTTP request, the one sent by the caller in the
+    `X-Request-ID` header if it's acceptable, the ID of its trace otherwise,
+    and returns it in the `X-Request-ID` header of the response.
+    The ID is added to the log records, the error responses and the
+    OptScale requests made while processing the request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        header_name = REQUEST_ID_HEADER.lower().encode()
+        for name, value in scope["headers"]:
+            if name == header_name:
+                request_id = parse_request_id(value.decode("latin-1"))
+                break
+        request_id = request_id or current_trace_id() or os.urandom(16).hex()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [
+                    *message["headers"],
+                    (header_name, request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        with request_id_context(request_id):
+            await self.app(scope, receive, send_wrapper)
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds the HTTP requests the worker can't process in time: when the
+    admission controller has no slot left for a request, it's rejected with
+    a 503 and a `Retry-After` header, before reaching the application.
+    The exempt paths, like the health check, are always processed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionController,
+        exempt_paths: tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.controller = controller
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or not self.controller.enabled
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire()
+        except AdmissionRejectedError as error:
+            logger.warning("Request rejected: %s", error.reason)
+            exception = create_error_response(
+                status_code=503,
+                title="Service overloaded",
+                errors={"reason": error.reason},
+            )
+            response = FastJSONResponse(
+                content={"detail": exception.detail},
+                status_code=exception.status_code,
+                headers={"Retry-After": str(math.ceil(error.retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Adds the `RateLimit-*` headers to the responses of the requests counted
+    against a rate limit, whose outcome is set in `request.state.rate_limit`
+    once the request has been authenticated.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                result = scope.get("state", {}).get("rate_limit")
+                if result is not None:
+                    headers = message.get("headers", [])
+                    present = {name.lower() for name, _ in headers}
+                    message["headers"] = [
+                        *headers,
+                        *(
+                            (name.lower().encode(), value.encode())
+                            for name, value in result.headers().items()
+                            if name.lower().encode() not in present
+                        ),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
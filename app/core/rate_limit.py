@@ -0,0 +1,556 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from fastapi import Request
+from fastapi import status as http_status
+
+from app import settings
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.deadline import remaining
+from app.core.error_formats import create_error_response
+from app.core.sqlite_db import SQLiteDatabase
+
+if TYPE_CHECKING:
+    from app.core.auth_jwt_bearer import JWTClaims
+
+logger = logging.getLogger(__name__)
+
+# the pause of an upstream answering 429 without a Retry-After header
+DEFAULT_THROTTLE_PAUSE = 1.0
+
+_RATE_LIMIT = re.compile(
+    r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day|s|m|h|d)\s*$"
+)
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class UpstreamRateLimitError(Exception):
+    """
+    Raised when a request to an upstream can't be sent within its quota in time.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        """
+        :param name: The name of the upstream, its base URL.
+        :param retry_after: The seconds before the request could be sent.
+        """
+        super().__init__(
+            f"The rate limit of {name} is exhausted, retry in {retry_after:.1f} seconds"
+        )
+        self.name = name
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimit:
+    """
+    Allows `limit` requests per `window` seconds, with bursts of up to
+    `limit` requests: the bucket holds `limit` tokens, refilled continuously.
+    """
+
+    limit: int
+    window: float
+
+    @property
+    def rate(self) -> float:
+        """The tokens refilled per second."""
+        return self.limit / self.window
+
+    @property
+    def policy(self) -> str:
+        """The value of the `RateLimit-Policy` header."""
+        return f"{self.limit};w={self.window:g}"
+
+    @classmethod
+    def parse(cls, value: str) -> RateLimit:
+        """
+        Parses a rate limit like `100/minute`, `10/s` or `500/15m`.
+
+        :param value: The number of requests per period.
+        :return: The rate limit.
+        :raise: ValueError if the value is not a valid rate limit.
+        """
+        match = _RATE_LIMIT.match(value)
+        if match is None or int(match.group(1)) <= 0:
+            raise ValueError(f"Invalid rate limit: {value}")
+        count, periods, unit = match.groups()
+        window = int(periods or 1) * _PERIODS[unit[0]]
+        if window <= 0:
+            raise ValueError(f"Invalid rate limit: {value}")
+        return cls(limit=int(count), window=window)
+
+    def expiry(self, tokens: float) -> float:
+        """
+        Returns for how long a bucket holding `tokens` must be kept, in seconds:
+        until it's full again, and at least a window.
+        A bucket forgotten earlier would come back full, forgiving its debt.
+        """
+        return max((self.limit - tokens) / self.rate, self.window)
+
+    def take(self, tokens: float, updated_at: float, now: float) -> tuple[bool, float]:
+        """
+        Refills a bucket for the time elapsed and takes a token from it.
+
+        :param tokens: The tokens of the bucket when it was last updated.
+        :param updated_at: When the bucket was last updated, in seconds.
+        :param now: The current time, in seconds.
+        :return: Whether a token was taken, and the tokens left.
+        """
+        tokens = min(self.limit, tokens + max(now - updated_at, 0) * self.rate)
+        if tokens >= 1:
+            return True, tokens - 1
+        return False, tokens
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimitResult:
+    """
+    The outcome of a request against the bucket of its caller.
+    """
+
+    allowed: bool
+    limit: RateLimit
+    tokens: float
+
+    @property
+    def remaining(self) -> int:
+        return max(math.floor(self.tokens), 0)
+
+    @property
+    def reset(self) -> int:
+        """The seconds before the bucket is full again."""
+        return math.ceil((self.limit.limit - self.tokens) / self.limit.rate)
+
+    @property
+    def wait_time(self) -> float:
+        """The seconds before the next token is available."""
+        return max((1 - self.tokens) / self.limit.rate, 0.0)
+
+    @property
+    def retry_after(self) -> int:
+        """The seconds before the next token is available, rounded up."""
+        return max(math.ceil(self.wait_time), 1)
+
+    def headers(self) -> dict[str, str]:
+        """
+        Returns the `RateLimit-*` headers of the response, plus `Retry-After`
+        when the request is rejected.
+        """
+        headers = {
+            "RateLimit-Limit": str(self.limit.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+            "RateLimit-Policy": self.limit.policy,
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class RateLimitBackend(ABC):
+    """
+    The storage of the token buckets of the callers.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, limit: RateLimit) -> RateLimitResult:
+        """
+        Takes a token from the bucket of the key, a full bucket if it's unknown.
+        """
+
+    @abstractmethod
+    async def drain(self, key: str, limit: RateLimit, seconds: float):
+        """
+        Empties the bucket of the key so that the next token is available in
+        `seconds`, as if the tokens refilled meanwhile were already taken.
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    A RateLimitBackend keeping the buckets in a per-process LRU cache,
+    so each worker enforces the limits on its own share of the traffic.
+    A bucket is forgotten once it would be full again, and a window at least.
+    """
+
+    def __init__(self, maxsize: int):
+        self.buckets = TTLCache(maxsize=maxsize, ttl=0)
+
+    async def take(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (limit.limit, now))
+        allowed, tokens = limit.take(tokens, updated_at, now)
+        self.buckets.set(key, (tokens, now), ttl=limit.expiry(tokens))
+        return RateLimitResult(allowed=allowed, limit=limit, tokens=tokens)
+
+    async def drain(self, key: str, limit: RateLimit, seconds: float):
+        tokens = 1 - seconds * limit.rate
+        self.buckets.set(key, (tokens, time.monotonic()), ttl=limit.expiry(tokens))
+
+    def clear(self):
+        self.buckets.clear()
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    A RateLimitBackend keeping the buckets in a SQLite file, shared by the
+    workers of a host, so that the limits apply to the host as a whole.
+    """
+
+    # the expired buckets are purged every `purge_interval` requests
+    purge_interval = 1000
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        """
+        :param path: The path of the database file, created if needed.
+        :param timeout: How long to wait for a lock held by another worker, in seconds.
+        """
+        self.db = SQLiteDatabase(
+            path,
+            schema=(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                "updated_at REAL NOT NULL, expires_at REAL NOT NULL)",
+            ),
+            timeout=timeout,
+        )
+        self._takes = 0
+
+    async def take(self, key: str, limit: RateLimit) -> RateLimitResult:
+        self._takes += 1
+        purge = self._takes % self.purge_interval == 0
+
+        def take(connection: sqlite3.Connection) -> tuple[bool, float]:
+            now = time.time()
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            tokens, updated_at = row or (limit.limit, now)
+            allowed, tokens = limit.take(tokens, updated_at, now)
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets "
+                "(key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + limit.expiry(tokens)),
+            )
+            if purge:
+                connection.execute(
+                    "DELETE FROM rate_limit_buckets WHERE expires_at <= ?", (now,)
+                )
+            return allowed, tokens
+
+        allowed, tokens = await self.db.run(take, transaction=True)
+        return RateLimitResult(allowed=allowed, limit=limit, tokens=tokens)
+
+    async def drain(self, key: str, limit: RateLimit, seconds: float):
+        now = time.time()
+        tokens = 1 - seconds * limit.rate
+        await self.db.execute(
+            "INSERT OR REPLACE INTO rate_limit_buckets "
+            "(key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, tokens, now, now + limit.expiry(tokens)),
+        )
+
+    def close(self):
+        self.db.close()
+
+
+class RateLimiter:
+    """
+    Limits the requests of each caller, identified by a claim of its JWT
+    token, with a token bucket per caller and route.
+
+    The limit of a route is the one configured for its `METHOD /path`
+    template, e.g. `GET /v1/admin/organizations`, or the default limit.
+    The routes without limit are not limited.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        key_claim: str = "sub",
+        default: RateLimit | None = None,
+        routes: dict[str, RateLimit] | None = None,
+    ):
+        """
+        :param backend: The storage of the buckets.
+        :param key_claim: The claim identifying the caller, e.g. `sub` or `iss`.
+        :param default: The limit of the routes not in `routes`, if any.
+        :param routes: The limits by route, like `GET /v1/admin/organizations`.
+        """
+        self.backend = backend
+        self.key_claim = key_claim
+        self.default = default
+        self.routes = routes or {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.default is not None or bool(self.routes)
+
+    def limit_for(self, route: str) -> RateLimit | None:
+        """
+        Returns the limit of a route, if any.
+
+        :param route: The method and path template of the route.
+        """
+        return self.routes.get(route, self.default)
+
+    async def hit(self, claims: JWTClaims, route: str) -> RateLimitResult | None:
+        """
+        Counts a request of a caller to a route.
+
+        :param claims: The verified claims of the caller.
+        :param route: The method and path template of the route.
+        :return: The outcome, or None if the route is not limited.
+        """
+        limit = self.limit_for(route)
+        if limit is None:
+            return None
+        caller = claims.get(self.key_claim, "-")
+        result = await self.backend.take(f"{route}:{caller}", limit)
+        if not result.allowed:
+            rate_limited_requests.inc((route,))
+        return result
+
+
+class OutboundRateLimiter:
+    """
+    Keeps the requests sent to an upstream under its quota, with a token
+    bucket per group of endpoints, identified by their common prefix.
+
+    A request waits for a token of its group for up to `max_wait` seconds,
+    or the time left before the deadline of the inbound request if shorter,
+    then it's abandoned. When the upstream throttles a request anyway, with
+    a 429 response, the bucket of the group is emptied for the `Retry-After`
+    delay, so that the following requests wait instead of being throttled too.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        backend: RateLimitBackend,
+        limits: dict[str, RateLimit] | None = None,
+        max_wait: float = 5.0,
+    ):
+        """
+        :param name: The name of the upstream, its base URL.
+        :param backend: The storage of the buckets, shared by the workers
+            to enforce the quota of the host.
+        :param limits: The limits by endpoint prefix, like `{"/restapi/v2": RateLimit(50, 1)}`.
+            An empty prefix matches all the endpoints.
+        :param max_wait: How long a request waits for a token at most, in seconds.
+        """
+        self.name = name
+        self.backend = backend
+        # the longest prefix first, so that it wins
+        self.limits = sorted((limits or {}).items(), key=lambda item: -len(item[0]))
+        self.max_wait = max_wait
+        self.delayed = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_settings(cls, name: str) -> OutboundRateLimiter:
+        return cls(
+            name=name,
+            backend=create_rate_limit_backend(
+                settings.api_client_rate_limit_store,
+                settings.rate_limit_sqlite_path,
+                settings.rate_limit_store_size,
+            ),
+            limits={
+                prefix: RateLimit.parse(limit)
+                for prefix, limit in settings.api_client_rate_limits.items()
+            },
+            max_wait=settings.api_client_rate_limit_max_wait,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def group_for(self, endpoint: str) -> tuple[str, RateLimit] | None:
+        """
+        Returns the prefix and the limit of the group of an endpoint, if any.
+
+        :param endpoint: The requested endpoint.
+        """
+        for prefix, limit in self.limits:
+            if endpoint.startswith(prefix):
+                return prefix, limit
+        return None
+
+    async def acquire(self, endpoint: str):
+        """
+        Waits until a request to the endpoint can be sent.
+
+        :param endpoint: The requested endpoint.
+        :raise: UpstreamRateLimitError if no token is available in time.
+        """
+        group = self.group_for(endpoint)
+        if group is None:
+            return
+        prefix, limit = group
+        max_wait = self.max_wait
+        time_left = remaining()
+        if time_left is not None:
+            max_wait = min(max_wait, time_left)
+        wait_until = time.monotonic() + max_wait
+        delayed = False
+        while True:
+            result = await self.backend.take(f"{self.name}:{prefix}", limit)
+            if result.allowed:
+                return
+            if time.monotonic() + result.wait_time > wait_until:
+                self.rejected += 1
+                upstream_rate_limited.inc((self.name, prefix, "rejected"))
+                raise UpstreamRateLimitError(self.name, result.wait_time)
+            if not delayed:
+                delayed = True
+                self.delayed += 1
+                upstream_rate_limited.inc((self.name, prefix, "delayed"))
+            # another worker may take the token first, hence the loop
+            await asyncio.sleep(result.wait_time)
+
+    async def throttle(self, endpoint: str, retry_after: float | None):
+        """
+        Pauses the group of an endpoint the upstream has throttled.
+
+        :param endpoint: The throttled endpoint.
+        :param retry_after: The delay requested by the upstream, in seconds, if any.
+        """
+        group = self.group_for(endpoint)
+        if group is None:
+            return
+        prefix, limit = group
+        pause = DEFAULT_THROTTLE_PAUSE if retry_after is None else retry_after
+        self.throttled += 1
+        upstream_rate_limited.inc((self.name, prefix, "throttled"))
+        logger.warning(
+            "%s throttled the requests to %s, pausing them for %.1fs",
+            self.name,
+            prefix or "/",
+            pause,
+        )
+        await self.backend.drain(f"{self.name}:{prefix}", limit, pause)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of requests delayed, rejected and throttled.
+        """
+        return {
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+        }
+
+
+def create_rate_limit_backend(
+    store: str, sqlite_path: str, maxsize: int
+) -> RateLimitBackend:
+    """
+    Creates the storage of the token buckets.
+
+    :param store: `memory` for buckets per worker, or `sqlite` to share them
+        between the workers of the host.
+    :param sqlite_path: The database file of the `sqlite` store.
+    :param maxsize: The buckets kept by the `memory` store.
+    :raise: ValueError if the store is unknown.
+    """
+    if store == "memory":
+        return InMemoryRateLimitBackend(maxsize=maxsize)
+    if store == "sqlite":
+        return SQLiteRateLimitBackend(path=sqlite_path)
+    raise ValueError(f"Unknown rate limit store: {store}")
+
+
+def create_rate_limiter(
+    key_claim: str,
+    default: str | None,
+    routes: dict[str, str],
+    store: str,
+    sqlite_path: str,
+    maxsize: int,
+) -> RateLimiter:
+    """
+    Creates the rate limiter from the settings.
+
+    :param key_claim: The claim identifying the caller.
+    :param default: The limit of the routes, like `600/minute`, if any.
+    :param routes: The limits by route, like `{"GET /v1/admin/organizations": "60/minute"}`.
+    :param store: `memory` to limit each worker on its own, or `sqlite` to
+        share the buckets between the workers of the host.
+    :param sqlite_path: The database file of the `sqlite` store.
+    :param maxsize: The buckets kept by the `memory` store.
+    :raise: ValueError if a limit or the store is not valid.
+    """
+    return RateLimiter(
+        backend=create_rate_limit_backend(store, sqlite_path, maxsize),
+        key_claim=key_claim,
+        default=RateLimit.parse(default) if default else None,
+        routes={route: RateLimit.parse(limit) for route, limit in routes.items()},
+    )
+
+
+rate_limited_requests = metrics.registry.counter(
+    "rate_limited_requests_total",
+    "Inbound requests rejected by the per-caller rate limits, by route.",
+    ("route",),
+)
+upstream_rate_limited = metrics.registry.counter(
+    "optscale_rate_limited_total",
+    "Upstream requests delayed or rejected by the outbound rate limits, and "
+    "throttled by the upstream, by endpoint group.",
+    ("upstream", "group", "outcome"),
+)
+
+rate_limiter = create_rate_limiter(
+    key_claim=settings.rate_limit_key_claim,
+    default=settings.rate_limit_default,
+    routes=settings.rate_limit_routes,
+    store=settings.rate_limit_store,
+    sqlite_path=settings.rate_limit_sqlite_path,
+    maxsize=settings.rate_limit_store_size,
+)
+
+
+async def enforce_rate_limit(request: Request, claims: JWTClaims):
+    """
+    Counts an authenticated request against the limit of its caller and route.
+    The outcome is attached to the request as `request.state.rate_limit`,
+    for its `RateLimit-*` headers to be added to the response.
+
+    :param request: The inbound request, once routed.
+    :param claims: The verified claims of the caller.
+    :raise: HTTPException 429 if the caller has exceeded the limit.
+    """
+    if not rate_limiter.enabled:
+        return
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    result = await rate_limiter.hit(claims, f"{request.method} {path}")
+    if result is None:
+        return
+    request.state.rate_limit = result
+    if not result.allowed:
+        error = create_error_response(
+            status_code=http_status.HTTP_429_TOO_MANY_REQUESTS,
+            title="Too many requests",
+            errors={
+                "reason": f"Rate limit of {result.limit.limit} requests per "
+                f"{result.limit.window:g}s exceeded"
+            },
+        )
+        error.headers = result.headers()
+        raise error
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# what we accept from the callers, as the value ends up in the logs
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:+=/-]{1,128}$")
+
+_request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+def get_request_id() -> str | None:
+    """
+    Returns the ID of the request being processed, if any.
+    """
+    return _request_id.get()
+
+
+@contextmanager
+def request_id_context(request_id: str) -> Iterator[str]:
+    """
+    Sets the ID of the request being processed while the block runs,
+    including in the tasks it creates.
+
+    :param request_id: The ID of the request.
+    :return: The ID of the request.
+    """
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+def parse_request_id(value: str | None) -> str | None:
+    """
+    Validates a request ID sent by a caller.
+
+    :param value: The value of the `X-Request-ID` header.
+    :return: The request ID, or None if it's missing or not acceptable.
+    """
+    if value and _VALID_REQUEST_ID.match(value):
+        return value
+    return None
+
+
+class RequestIDLogFilter(logging.Filter):
+    """
+    Adds the `request_id` of the request being processed to the log records,
+    so that the JSON formatter outputs it along with the message.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # the record may be filtered again, out of the request's context,
+        # by a handler of the logging thread
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
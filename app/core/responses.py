@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse, Response
+
+
+def json_dumps(content: Any) -> bytes:
+    """
+    Serializes the content to compact JSON, with orjson.
+
+    :param content: The JSON serializable content.
+    :return: The UTF-8 encoded JSON.
+    """
+    return orjson.dumps(content)
+
+
+def json_loads(content: bytes | str) -> Any:
+    """
+    Parses JSON content, with orjson.
+
+    :param content: The JSON to parse.
+    :return: The parsed content.
+    :raise: ValueError if the content is not valid JSON.
+    """
+    return orjson.loads(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSONResponse serializing the content with orjson,
+    for the responses whose content is built or transformed by the handler.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+class RawJSONResponse(Response):
+    """
+    A response forwarding an already serialized JSON body as is.
+    """
+
+    media_type = "application/json"
+
+
+def build_json_response(response: dict[str, Any], status_code: int) -> Response:
+    """
+    Builds the response of a handler from the response of an APIClient call.
+
+    The raw upstream body of a pass-through call (see `APIClient.get` and
+    `APIClient.post`) is forwarded without being parsed nor serialized again,
+    the parsed data is serialized with `FastJSONResponse` otherwise.
+
+    :param response: The response dict returned by the API wrapper.
+    :param status_code: The status code to use if the response has none.
+    :return: The response to return to the client.
+    """
+    status_code = response.get("status_code", status_code)
+    if "content" in response:
+        return RawJSONResponse(content=response["content"], status_code=status_code)
+    return FastJSONResponse(content=response.get("data", {}), status_code=status_code)
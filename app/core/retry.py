@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+from app import settings
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parses the value of a Retry-After header.
+
+    :param value: The header value, either a number of seconds or an HTTP date.
+    :return: The number of seconds to wait, or None if missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Describes when and how a failed request to an upstream API is retried.
+
+    Only the idempotent methods are retried, plus any request carrying an
+    Idempotency-Key header. A request is retried on connection errors and
+    on the `retry_statuses` responses, waiting an exponential backoff with
+    full jitter, or the Retry-After sent by the upstream if any.
+    """
+
+    max_attempts: int = 3
+    backoff_base: float = 0.2
+    backoff_max: float = 5.0
+    jitter: bool = True
+    retry_statuses: frozenset[int] = frozenset({502, 503, 504})
+    retry_methods: frozenset[str] = frozenset({"GET", "DELETE"})
+
+    @classmethod
+    def from_settings(cls) -> RetryPolicy:
+        return cls(
+            max_attempts=settings.api_client_retry_attempts,
+            backoff_base=settings.api_client_retry_backoff_base,
+            backoff_max=settings.api_client_retry_backoff_max,
+            jitter=settings.api_client_retry_jitter,
+            retry_statuses=frozenset(settings.api_client_retry_statuses),
+        )
+
+    def attempts_for(self, method: str, headers: dict[str, Any] | None = None) -> int:
+        """
+        Returns how many times a request can be attempted.
+
+        :param method: The HTTP method of the request.
+        :param headers: The headers of the request.
+        :return: `max_attempts` if the request can be retried safely, otherwise 1.
+        """
+        if method.upper() in self.retry_methods:
+            return max(self.max_attempts, 1)
+        if headers and any(
+            name.lower() == IDEMPOTENCY_KEY_HEADER.lower() for name in headers
+        ):
+            return max(self.max_attempts, 1)
+        return 1
+
+    def backoff_delay(
+        self, attempt: int, retry_after: str | None = None
+    ) -> float | None:
+        """
+        Returns how long to wait before the next attempt.
+
+        :param attempt: The number of the attempt that just failed, starting from 1.
+        :param retry_after: The Retry-After header of the failed response, if any.
+        :return: The delay in seconds, or None if the upstream asked to wait
+            longer than `backoff_max`, in which case the request is not retried.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            return delay if delay <= self.backoff_max else None
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)  # nosec B311
+        return delay
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from functools import partial
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls sharing the same key: the first caller runs
+    the call, the others wait for its outcome instead of running it again.
+
+    The call runs in its own task, so when the first caller is cancelled
+    (e.g. the client went away) the remaining callers still get the result.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.collapsed = 0
+        self._tasks: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `func` unless a call for the same key is already in flight,
+        in which case the in-flight result is awaited.
+
+        :param key: The key identifying the call.
+        :param func: A callable returning the awaitable to run.
+        :return: The result of the call.
+        :raise: Any exception raised by the call.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(partial(self._forget, key))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        """
+        Returns True if a call for the given key is running.
+        """
+        return key in self._tasks
+
+    def in_flight(self) -> int:
+        """
+        Returns the number of calls currently running.
+        """
+        return len(self._tasks)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of calls actually run and collapsed.
+        """
+        return {"calls": self.calls, "collapsed": self.collapsed}
+
+    def _forget(self, key: Hashable, task: asyncio.Future[Any]):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # the outcome is consumed by the waiters, if any are left
+            task.exception()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class SQLiteDatabase:
+    """
+    A SQLite file shared by the worker processes of a host, to keep state
+    like the idempotency keys or the rate limits consistent between them.
+
+    The queries run in a thread, not to block the event loop, on a single
+    connection per process opened on first use. The database is in WAL mode,
+    so that the readers don't block the writer.
+    """
+
+    def __init__(self, path: str, schema: Iterable[str] = (), timeout: float = 5.0):
+        """
+        :param path: The path of the database file, created if needed.
+        :param schema: The statements creating the tables, if they don't exist.
+        :param timeout: How long to wait for a lock held by another process, in seconds.
+        """
+        self.path = path
+        self.schema = tuple(schema)
+        self.timeout = timeout
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    async def execute(
+        self, query: str, parameters: tuple[Any, ...] = (), fetch: bool = False
+    ) -> Any:
+        """
+        Runs a single statement.
+
+        :param query: The SQL statement.
+        :param parameters: The values of its placeholders.
+        :param fetch: Whether to return the first row rather than the row count.
+        :return: The first row, or None, if `fetch`, the modified rows otherwise.
+        """
+
+        def execute(connection: sqlite3.Connection) -> Any:
+            cursor = connection.execute(query, parameters)
+            return cursor.fetchone() if fetch else cursor.rowcount
+
+        return await self.run(execute)
+
+    async def run(
+        self, func: Callable[[sqlite3.Connection], T], transaction: bool = False
+    ) -> T:
+        """
+        Calls a function with the connection.
+
+        :param func: The function running the statements.
+        :param transaction: Whether to run the function in a write transaction,
+            started before reading so that the other processes wait for it.
+        :return: The result of the function.
+        """
+        return await asyncio.to_thread(self._run, func, transaction)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _run(self, func: Callable[[sqlite3.Connection], T], transaction: bool) -> T:
+        with self._lock:
+            connection = self._connect()
+            if not transaction:
+                return func(connection)
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            self._connection = connection
+        return self._connection
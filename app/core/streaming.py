@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from typing import Any
+
+from fastapi import Request
+
+from app.core.responses import json_dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def accepts_ndjson(request: Request) -> bool:
+    """
+    Returns True if the client asked for a newline delimited JSON response
+    through the Accept header.
+
+    :param request: The inbound request.
+    """
+    accept = request.headers.get("Accept", "")
+    return any(
+        media_range.split(";", 1)[0].strip().lower() == NDJSON_MEDIA_TYPE
+        for media_range in accept.split(",")
+    )
+
+
+async def _iterate(
+    records: AsyncIterable[Any] | Iterable[Any],
+) -> AsyncIterator[Any]:
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
+
+
+async def stream_json_array(
+    records: AsyncIterable[Any] | Iterable[Any],
+) -> AsyncIterator[bytes]:
+    """
+    Serializes the records as a JSON array, one record at a time,
+    so that a client can start reading the results before all of them
+    are available and the whole array is never held in memory.
+
+    :param records: The JSON serializable records, or an async iterable of them.
+    :return: An async iterator of the encoded chunks of the array.
+    """
+    separator = b"["
+    async for record in _iterate(records):
+        yield separator + json_dumps(record)
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+async def stream_ndjson(
+    records: AsyncIterable[Any] | Iterable[Any],
+) -> AsyncIterator[bytes]:
+    """
+    Serializes the records as newline delimited JSON, one line per record.
+
+    :param records: The JSON serializable records, or an async iterable of them.
+    :return: An async iterator of the encoded lines.
+    """
+    async for record in _iterate(records):
+        yield json_dumps(record) + b"\n"
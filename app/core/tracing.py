@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+TRACEPARENT_HEADER = "traceparent"
+
+_TRACEPARENT = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$"
+)
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+
+@dataclass(frozen=True, slots=True)
+class SpanContext:
+    """
+    The identifiers propagated between services with the W3C `traceparent`
+    header: `00-<trace id>-<parent span id>-<flags>`.
+    """
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, value: str | None) -> SpanContext | None:
+        """
+        Parses a `traceparent` header.
+
+        :param value: The value of the header.
+        :return: The remote span context, or None if the header is missing or invalid.
+        """
+        match = _TRACEPARENT.match(value.strip().lower()) if value else None
+        if match is None:
+            return None
+        version, trace_id, span_id, flags = match.groups()
+        if (
+            version == "ff"
+            or trace_id == _INVALID_TRACE_ID
+            or span_id == _INVALID_SPAN_ID
+        ):
+            return None
+        return cls(trace_id=trace_id, span_id=span_id, sampled=bool(int(flags, 16) & 1))
+
+
+@dataclass(slots=True)
+class Span:
+    """
+    A timed operation of a trace.
+    """
+
+    name: str
+    context: SpanContext
+    parent_id: str | None = None
+    kind: str = "internal"
+    attributes: dict[str, Any] = field(default_factory=dict)
+    start_time: float = field(default_factory=time.time)
+    end_time: float | None = None
+    status: str = "unset"
+    status_message: str | None = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.context.trace_id
+
+    @property
+    def span_id(self) -> str:
+        return self.context.span_id
+
+    @property
+    def traceparent(self) -> str:
+        """The `traceparent` header to send to propagate the trace downstream."""
+        return self.context.traceparent
+
+    def set_attribute(self, name: str, value: Any):
+        self.attributes[name] = value
+
+    def set_error(self, message: str | None = None):
+        self.status = "error"
+        self.status_message = message
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": None
+            if self.end_time is None
+            else round(self.end_time - self.start_time, 6),
+            "status": self.status,
+            "status_message": self.status_message,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter(ABC):
+    """
+    Receives the spans when they end.
+    """
+
+    @abstractmethod
+    def export(self, span: Span):
+        """
+        Exports an ended span. It's called on the event loop, so it must not block
+        for long.
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Releases the resources of the exporter, once no span is exported anymore.
+        """
+
+
+class NoOpExporter(SpanExporter):
+    """
+    Discards the spans. The trace context is still propagated.
+    """
+
+    def export(self, span: Span):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConsoleExporter(SpanExporter):
+    """
+    Writes each span as a JSON line to a stream, stdout by default.
+    """
+
+    def __init__(self, stream: TextIO | None = None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def close(self):
+        # the stream isn't ours, only the file of the FileExporter is
+        pass
+
+
+class FileExporter(ConsoleExporter):
+    """
+    Appends each span as a JSON line to a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._files = ExitStack()
+        super().__init__(
+            stream=self._files.enter_context(open(path, "a", encoding="utf-8"))
+        )
+
+    def close(self):
+        with self._lock:
+            self._files.close()
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Creates the spans of the service and hands them to the exporter when
+    they end. The span being executed is kept in a context variable, so that
+    the spans started while it runs, in the same task or in the tasks it
+    creates, become its children.
+    """
+
+    def __init__(self, exporter: SpanExporter | None = None):
+        self.exporter = exporter or NoOpExporter()
+
+    @contextmanager
+    def start_as_current_span(
+        self,
+        name: str,
+        kind: str = "internal",
+        attributes: dict[str, Any] | None = None,
+        remote_parent: SpanContext | None = None,
+    ) -> Iterator[Span]:
+        """
+        Runs the block in a new span, child of the current span, or of the
+        remote parent when there is none (e.g. from an inbound `traceparent`).
+        An exception escaping the block marks the span as failed.
+
+            with tracer.start_as_current_span("jwt.verify") as span:
+                ...
+
+        :param name: The name of the operation.
+        :param kind: `server`, `client` or `internal`.
+        :param attributes: The initial attributes of the span.
+        :param remote_parent: The parent span of the caller.
+        :return: The span, current while the block runs.
+        """
+        parent = _current_span.get()
+        parent_context = parent.context if parent is not None else remote_parent
+        span = Span(
+            name=name,
+            context=SpanContext(
+                trace_id=parent_context.trace_id if parent_context else _new_id(16),
+                span_id=_new_id(8),
+                sampled=parent_context.sampled if parent_context else True,
+            ),
+            parent_id=parent_context.span_id if parent_context else None,
+            kind=kind,
+            attributes=attributes or {},
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.set_error(repr(error))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time = time.time()
+            if span.context.sampled:
+                self.exporter.export(span)
+
+
+tracer = Tracer()
+
+
+def current_span() -> Span | None:
+    """
+    Returns the span being executed, if any.
+    """
+    return _current_span.get()
+
+
+def current_trace_id() -> str | None:
+    """
+    Returns the ID of the trace being executed, if any.
+    """
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def configure_tracing(exporter: str = "none", file_path: str = "traces.jsonl"):
+    """
+    Sets the exporter of the spans, closing the previous one.
+
+    :param exporter: `none` to discard the spans, `console` to write them to
+        stdout or `file` to append them to `file_path`, as JSON lines.
+    :param file_path: The file the spans are written to by the `file` exporter.
+    :raise: ValueError if the exporter is unknown.
+    """
+    if exporter == "none":
+        new_exporter = NoOpExporter()
+    elif exporter == "console":
+        new_exporter = ConsoleExporter()
+    elif exporter == "file":
+        new_exporter = FileExporter(file_path)
+    else:
+        raise ValueError(f"Unknown tracing exporter: {exporter}")
+    previous, tracer.exporter = tracer.exporter, new_exporter
+    previous.close()
+
+
+def stop_tracing():
+    """
+    Closes the exporter of the spans. The spans ending later are discarded.
+    """
+    previous, tracer.exporter = tracer.exporter, NoOpExporter()
+    previous.close()
+
+
+atexit.register(stop_tracing)
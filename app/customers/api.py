@@ -0,0 +1,129 @@
+import logging
+
+from fastapi import APIRouter, Depends
+from fastapi import status as http_status
+
+from app import settings
+from app.core.auth_jwt_bearer import JWTBearer
+from app.core.error_formats import create_error_response
+from app.core.exceptions import format_exception, handle_exception
+from app.core.input_validation import is_valid_currency
+from app.core.responses import FastJSONResponse
+from app.customers.model import CreateCustomerData, CreateCustomerResponse
+from app.optscale_api.auth_api import OptScaleAuth
+from app.optscale_api.helpers.auth_tokens_dependency import get_auth_client
+from app.optscale_api.orgs_api import OptScaleOrgAPI
+from app.optscale_api.users_api import OptScaleUserAPI
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.post(
+    path="",
+    status_code=http_status.HTTP_201_CREATED,
+    response_model=CreateCustomerResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+async def create_customer(
+    data: CreateCustomerData,
+    user_api: OptScaleUserAPI = Depends(),
+    org_api: OptScaleOrgAPI = Depends(),
+    auth_client: OptScaleAuth = Depends(get_auth_client),
+):
+    """
+    Provision a FinOps customer: a user and its organization.
+    It's the equivalent of `POST /users` followed by `POST /organizations`,
+    in two OptScale calls only, as the organization is created with the
+    token returned by OptScale along with the new user.
+
+    :param data: The user to create and the name and currency of its organization.
+    :param user_api: An instance of OptScaleUserAPI.
+                    Dependency injection via `Depends()`.
+    :param org_api: An instance of OptScaleOrgAPI.
+                    Dependency injection via `Depends()`.
+    :param auth_client: An instance of OptScaleAuth, used if OptScale
+                    didn't return a token for the new user.
+                    Dependency injection via Depends(get_auth_client)`.
+
+    :return: The created user and organization.
+    Example
+
+        {
+            "user": {
+                "id": "f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+                "display_name": "Spider Man",
+                "email": "peter.parker@iamspiderman.com",
+                ...
+                "token": "token_here"
+            },
+            "organization": {
+                "id": "64a7424c-0745-4926-bb6d-2125b16c91f9",
+                "pool_id": "f9c65ff7-fa7a-4d91-b2ca-60dcac5422da",
+                "name": "Daily Bugle",
+                ...
+                "currency": "USD"
+            }
+        }
+
+    The errors are formatted like the ones of `POST /users` and
+    `POST /organizations`. If the user has been created but not its
+    organization, the error has the ID of the user under `errors.user_id`,
+    so that the organization can be created with `POST /organizations`:
+
+        {
+            "detail": {
+                "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.6.1",
+                "title": "Error response from OptScale",
+                "status": 500,
+                "traceId": "c4bd62b3fe154456af99380796fb669c",
+                "requestId": "c4bd62b3fe154456af99380796fb669c",
+                "errors": {
+                    "reason": "Oh no, I made a mistake!",
+                    "user_id": "f0bd0c4a-7c55-45b7-8b58-27740e38789a"
+                }
+            }
+        }
+    :dependencies:
+        JWTBearer: Ensures that the request is authenticated using a valid JWT.
+    """
+    # checked first, as the user couldn't be rolled back
+    if not is_valid_currency(data.currency):
+        raise create_error_response(
+            status_code=http_status.HTTP_400_BAD_REQUEST,
+            title="Invalid currency",
+            errors={"reason": f"Unknown currency: {data.currency}"},
+        )
+
+    try:
+        user_response = await user_api.create_user(
+            email=str(data.email),
+            display_name=data.display_name,
+            password=data.password,
+            admin_api_key=settings.admin_token,
+        )
+    except Exception as error:
+        handle_exception(error=error)
+
+    user = user_response.get("data", {})
+    try:
+        org_response = await org_api.create_user_org(
+            org_name=data.org_name,
+            currency=data.currency,
+            user_id=user["id"],
+            admin_api_key=settings.admin_token,
+            auth_client=auth_client,
+            user_access_token=user.get("token"),
+        )
+    except Exception as error:
+        logger.error(
+            "The organization of the new user %s was not created: %s", user["id"], error
+        )
+        exception = format_exception(error)
+        exception.detail["errors"]["user_id"] = user["id"]
+        raise exception from error
+
+    return FastJSONResponse(
+        status_code=http_status.HTTP_201_CREATED,
+        content={"user": user, "organization": org_response.get("data", {})},
+    )
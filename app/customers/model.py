@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, EmailStr, constr
+
+from app.organizations.model import OptScaleOrganization
+from app.users.model import CreateUserResponse
+
+
+class CreateCustomerData(BaseModel):
+    email: EmailStr
+    display_name: str
+    password: constr(min_length=8)
+    org_name: str
+    currency: str
+
+
+class CreateCustomerResponse(BaseModel):
+    user: CreateUserResponse
+    organization: OptScaleOrganization
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "user": {
+                        "created_at": 1730126521,
+                        "deleted_at": 0,
+                        "id": "f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+                        "display_name": "Spider Man",
+                        "is_active": True,
+                        "type_id": 1,
+                        "email": "peter.parker@iamspiderman.com",
+                        "scope_id": None,
+                        "slack_connected": False,
+                        "is_password_autogenerated": False,
+                        "jira_connected": False,
+                        "token": "JTW_TOKEN",
+                    },
+                    "organization": {
+                        "id": "64a7424c-0745-4926-bb6d-2125b16c91f9",
+                        "pool_id": "f9c65ff7-fa7a-4d91-b2ca-60dcac5422da",
+                        "name": "Daily Bugle",
+                        "created_at": 1730126521,
+                        "deleted_at": 0,
+                        "is_demo": False,
+                        "currency": "USD",
+                    },
+                }
+            ]
+        }
+    }
@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Depends
+from fastapi import status as http_status
+
+from app.core.admission import admission_controller
+from app.core.api_client import api_clients
+from app.core.auth_jwt_bearer import JWTBearer
+from app.core.circuit_breaker import CircuitState
+from app.health.model import HealthDetailsResponse, HealthResponse
+
+router = APIRouter()
+
+
+def _is_degraded(upstreams: dict[str, dict]) -> bool:
+    return any(
+        upstream["state"] != CircuitState.CLOSED.value
+        for upstream in upstreams.values()
+    )
+
+
+@router.get(
+    path="",
+    status_code=http_status.HTTP_200_OK,
+    response_model=HealthResponse,
+)
+async def get_health():
+    """
+    Reports the health of the service, without authentication.
+    The status is `degraded` when the circuit of any upstream is not closed,
+    which means that the requests depending on it fail fast with a 503.
+    The endpoint always answers 200, as the service itself is up.
+    The details are reported to the authenticated callers by `GET /health/details`.
+
+    Example
+
+        {
+            "status": "ok"
+        }
+    """
+    return {"status": "degraded" if _is_degraded(api_clients.health()) else "ok"}
+
+
+@router.get(
+    path="/details",
+    status_code=http_status.HTTP_200_OK,
+    response_model=HealthDetailsResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+async def get_health_details():
+    """
+    Reports the health of the service and the state of the circuits of its
+    upstreams, to the authenticated callers.
+    `admission` reports the limits and the occupancy of the worker that
+    answered: the requests being processed, waiting for a slot, and the
+    counts of the admitted and rejected (503) ones.
+
+    Example
+
+        {
+            "status": "degraded",
+            "upstreams": {
+                "https://optscale.example.com": {
+                    "state": "open",
+                    "failures": 5,
+                    "rejected": 42,
+                    "retry_after": 12.5
+                }
+            },
+            "admission": {
+                "max_in_flight": 100,
+                "max_queue": 50,
+                "in_flight": 100,
+                "queued": 12,
+                "admitted": 1250,
+                "rejected": 7
+            }
+        }
+    """
+    upstreams = api_clients.health()
+    return {
+        "status": "degraded" if _is_degraded(upstreams) else "ok",
+        "upstreams": upstreams,
+        "admission": admission_controller.stats(),
+    }
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+
+
+class UpstreamHealth(BaseModel):
+    state: str
+    failures: int
+    rejected: int
+    retry_after: float
+
+
+class AdmissionStats(BaseModel):
+    max_in_flight: int
+    max_queue: int
+    in_flight: int
+    queued: int
+    admitted: int
+    rejected: int
+
+
+class HealthResponse(BaseModel):
+    status: str
+    model_config = {"json_schema_extra": {"examples": [{"status": "ok"}]}}
+
+
+class HealthDetailsResponse(BaseModel):
+    status: str
+    upstreams: dict[str, UpstreamHealth]
+    admission: AdmissionStats
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "status": "ok",
+                    "upstreams": {
+                        "https://optscale.example.com": {
+                            "state": "closed",
+                            "failures": 0,
+                            "rejected": 0,
+                            "retry_after": 0.0,
+                        }
+                    },
+                    "admission": {
+                        "max_in_flight": 100,
+                        "max_queue": 50,
+                        "in_flight": 3,
+                        "queued": 0,
+                        "admitted": 1250,
+                        "rejected": 0,
+                    },
+                }
+            ]
+        }
+    }
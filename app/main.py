@@ -1,32 +1,85 @@
 import logging
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from app import settings
-from app.core.api_client import LogRequestMiddleware
+from app.core.admission import admission_controller
+from app.core.api_client import api_clients
+from app.core.metrics import configure_multiprocess
+from app.core.middleware import (
+    AdmissionControlMiddleware,
+    LogRequestMiddleware,
+    MetricsMiddleware,
+    RateLimitHeadersMiddleware,
+    RequestIDMiddleware,
+    TracingMiddleware,
+)
+from app.metrics.api import router as metrics_router
 from app.router.api_v1.endpoints import api_router
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open the pooled OptScale client shared by all the API wrappers
+    api_clients.get(settings.opt_scale_api_url)
+    metrics_collector = configure_multiprocess(
+        settings.metrics_multiprocess_dir, settings.metrics_write_interval
+    )
+    if metrics_collector is not None:
+        metrics_collector.start()
+    yield
+    if metrics_collector is not None:
+        await metrics_collector.stop()
+    await api_clients.close()
+    logger.info("API clients closed")
+
+
 app = FastAPI(
     title=settings.project_name,
     version=settings.version,
     openapi_url=f"{settings.api_v1_prefix}/openapi.json",
     debug=settings.debug,
+    lifespan=lifespan,
 )
 
+app.include_router(api_router, prefix=settings.api_v1_prefix)
+app.include_router(metrics_router)
+# the innermost middleware, so that its rejections get the CORS headers and
+# are logged, measured and traced like the other responses
+app.add_middleware(
+    AdmissionControlMiddleware,
+    controller=admission_controller,
+    exempt_paths=(
+        f"{settings.api_v1_prefix}/health",
+        f"{settings.api_v1_prefix}/health/details",
+        "/metrics",
+    ),
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # for the browser clients to back off when rejected or rate limited
+    expose_headers=[
+        "Retry-After",
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "RateLimit-Policy",
+    ],
 )
-
-app.include_router(api_router, prefix=settings.api_v1_prefix)
+app.add_middleware(RateLimitHeadersMiddleware)
 app.add_middleware(LogRequestMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIDMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 if __name__ == "__main__":
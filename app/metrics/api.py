@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter()
+
+
+@router.get(path="/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Exposes the metrics of the service in the Prometheus text format:
+
+    - `http_requests_in_flight` and `http_request_duration_seconds`, by method,
+      route template and status code, whose `_count` is the number of requests,
+    - `optscale_request_duration_seconds`, for each attempt of the upstream
+      requests, by method, endpoint and status code,
+    - `optscale_requests_in_flight`, `optscale_pool_connections` and
+      `optscale_pool_max_connections`, by upstream,
+    - `cache_lookups_total`, by cache and result (hit, miss or stale),
+    - `admission_in_flight`, `admission_queued`, `admission_max_in_flight` and
+      `admission_rejected_total`, by reason, for the admission control,
+    - `rate_limited_requests_total`, by route, and `optscale_rate_limited_total`,
+      the upstream requests delayed, rejected or throttled by OptScale, by
+      upstream and endpoint group.
+
+    When `METRICS_MULTIPROCESS_DIR` is set, the metrics of all the worker
+    processes are aggregated, whichever worker answers.
+    """
+    return Response(content=await render_metrics(), media_type=CONTENT_TYPE)
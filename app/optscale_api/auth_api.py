@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import logging
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
 
 from fastapi import status as http_status
 
-from app import settings
-from app.core.api_client import APIClient
+from app.core.api_client import get_optscale_api_client
 from app.core.exceptions import OptScaleAPIResponseError, UserAccessTokenError
 
 AUTH_TOKEN_ENDPOINT = "/auth/v2/tokens"  # nosec B105
@@ -32,9 +34,49 @@ def build_bearer_token_header(bearer_token: str) -> dict[str, str]:
     return {"Authorization": f"Bearer {bearer_token}"}
 
 
+@dataclass(frozen=True, slots=True)
+class UserAccessToken:
+    """
+    An Access Token of a user, with the (epoch) time until it is valid, if known.
+    """
+
+    token: str
+    valid_until: float | None = None
+
+    def expires_in(self) -> float | None:
+        """
+        Returns the seconds before the token expires, or None if it's unknown.
+        """
+        if self.valid_until is None:
+            return None
+        return self.valid_until - time.time()
+
+
+def parse_valid_until(value: str | float | None) -> float | None:
+    """
+    Parses the `valid_until` of an OptScale token, a naive UTC datetime
+    like `2024-11-04T18:38:21` or an epoch timestamp.
+
+    :param value: The value returned by OptScale.
+    :return: The epoch timestamp, or None if the value is missing or invalid.
+    """
+    if isinstance(value, int | float):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        valid_until = datetime.fromisoformat(value)
+    except ValueError:
+        logger.warning("Invalid token expiration: %s", value)
+        return None
+    if valid_until.tzinfo is None:
+        valid_until = valid_until.replace(tzinfo=UTC)
+    return valid_until.timestamp()
+
+
 class OptScaleAuth:
     def __init__(self):
-        self.api_client = APIClient(base_url=settings.opt_scale_api_url)
+        self.api_client = get_optscale_api_client()
 
     async def obtain_user_auth_token_with_admin_api_key(
         self, user_id: str, admin_api_key: str
@@ -48,6 +90,23 @@ class OptScaleAuth:
         :return: The user authentication token if successfully obtained and verified,
         otherwise a UserAccessTokenError exception
 
+        """
+        user_access_token = await self.obtain_user_access_token(
+            user_id=user_id, admin_api_key=admin_api_key
+        )
+        return user_access_token.token
+
+    async def obtain_user_access_token(
+        self, user_id: str, admin_api_key: str
+    ) -> UserAccessToken:
+        """
+        Obtains an authentication token for the given user_id using the admin API key,
+        along with its expiration.
+        :param user_id: the user's ID for whom the access token will be generated
+        :param admin_api_key: the secret API key
+        :return: The user access token if successfully obtained and verified
+        :raise: OptScaleAPIResponseError if OptScale returns an error,
+        UserAccessTokenError if the response doesn't carry the user's token
         """
         payload = {"user_id": user_id}
         headers = build_admin_api_key_header(admin_api_key=admin_api_key)
@@ -55,7 +114,7 @@ class OptScaleAuth:
             endpoint=AUTH_TOKEN_ENDPOINT, headers=headers, data=payload
         )
         if response.get("error"):
-            logger.error(f"Failed to get an admin access token for user {user_id}")
+            logger.error("Failed to get an admin access token for user %s", user_id)
             raise OptScaleAPIResponseError(
                 title="Error response from OptScale",
                 reason=response.get("data", {})
@@ -67,8 +126,9 @@ class OptScaleAuth:
         if response.get("data", {}).get("user_id", 0) != user_id:
             unmatched_user_id = response.get("data", {}).get("user_id", 0)
             logger.error(
-                f"User ID mismatch: requested {user_id}, "
-                f"received {unmatched_user_id}"
+                "User ID mismatch: requested %s, received %s",
+                user_id,
+                unmatched_user_id,
             )
             raise UserAccessTokenError("Access Token User ID mismatch")
         token = response.get("data", {}).get("token")
@@ -76,4 +136,7 @@ class OptScaleAuth:
             logger.error("Token not found in the response.")
             raise UserAccessTokenError("Token not found in the response.")
         logger.info("Admin Access Token successfully obtained")
-        return token
+        return UserAccessToken(
+            token=token,
+            valid_until=parse_valid_until(response.get("data", {}).get("valid_until")),
+        )
@@ -2,21 +2,80 @@ from __future__ import annotations
 
 import logging
 
+from app import settings
+from app.core import metrics
+from app.core.cache import TTLCache, fingerprint
 from app.core.exceptions import UserAccessTokenError
-from app.optscale_api.auth_api import OptScaleAuth
+from app.core.single_flight import SingleFlight
+from app.optscale_api.auth_api import OptScaleAuth, UserAccessToken
 
 logger = logging.getLogger("helper")
 
+# A token is kept for the configured TTL, or until shortly before it expires
+# if that's sooner, so that a cached token is never sent once expired.
+user_access_tokens = TTLCache(
+    maxsize=settings.user_access_token_cache_size,
+    ttl=settings.user_access_token_cache_ttl,
+)
+metrics.register_cache("user_access_tokens", user_access_tokens)
+user_access_token_requests = SingleFlight()
+
 
 def get_auth_client() -> OptScaleAuth:
     return OptScaleAuth()
 
 
+def _token_cache_key(user_id: str, admin_api_key: str) -> tuple[str, str]:
+    return user_id, fingerprint(admin_api_key)
+
+
+def _token_cache_ttl(user_access_token: UserAccessToken) -> float:
+    expires_in = user_access_token.expires_in()
+    if expires_in is None:
+        return user_access_tokens.ttl
+    return min(
+        user_access_tokens.ttl,
+        expires_in - settings.user_access_token_expiry_margin,
+    )
+
+
+def invalidate_user_access_token(user_id: str, admin_api_key: str):
+    """
+    Removes the cached Access Token of the given user, for instance
+    when OptScale rejected it.
+    :param user_id: The unique identifier of the user
+    :param admin_api_key: The admin API key used to obtain the token.
+    """
+    user_access_tokens.pop(_token_cache_key(user_id, admin_api_key))
+
+
+def cache_user_access_token(
+    user_id: str, admin_api_key: str, token: str, valid_until: float | None = None
+):
+    """
+    Caches an Access Token of the given user obtained otherwise, like the
+    one returned by OptScale when the user is created, so that the next
+    calls made on behalf of the user don't have to request one.
+    :param user_id: The unique identifier of the user
+    :param admin_api_key: The admin API key the token is cached for.
+    :param token: The Access Token of the user.
+    :param valid_until: The (epoch) time until the token is valid, if known.
+    """
+    user_access_tokens.set(
+        _token_cache_key(user_id, admin_api_key),
+        token,
+        ttl=_token_cache_ttl(UserAccessToken(token=token, valid_until=valid_until)),
+    )
+
+
 async def get_user_access_token(
     user_id: str, admin_api_key: str, auth_client: OptScaleAuth
 ) -> str | Exception:
     """
-    Obtains an Access Token for the given user, using the admin api key
+    Obtains an Access Token for the given user, using the admin api key.
+    The tokens are cached for `user_access_token_cache_ttl` seconds, or
+    until `user_access_token_expiry_margin` seconds before they expire if
+    that's sooner, and concurrent requests for the same user share a single call to OptScale.
     :param user_id: The unique identifier of the user for whom the access token
     is being requested.
     :param admin_api_key: The admin API key used for authenticating the request to
@@ -26,14 +85,24 @@ async def get_user_access_token(
     :return: The access token for the specified user.
     :raise: UserAccessTokenError If an error occurs while obtaining the access token.
     """
-    try:
-        # request user's access token
-        user_access_token = await auth_client.obtain_user_auth_token_with_admin_api_key(
+    cache_key = _token_cache_key(user_id, admin_api_key)
+    user_access_token = user_access_tokens.get(cache_key)
+    if user_access_token is not None:
+        return user_access_token
+
+    async def obtain_token() -> str:
+        token = await auth_client.obtain_user_access_token(
             user_id=user_id, admin_api_key=admin_api_key
         )
-        logger.info(f"Successfully created organization for user: {user_id}")
+        user_access_tokens.set(cache_key, token.token, ttl=_token_cache_ttl(token))
+        return token.token
+
+    try:
+        # request user's access token
+        user_access_token = await user_access_token_requests.do(cache_key, obtain_token)
+        logger.info("Successfully obtained an access token for user: %s", user_id)
         return user_access_token
 
     except UserAccessTokenError as error:
-        logger.error(f"Failed to get access token for user {user_id}: {error}")
+        logger.error("Failed to get access token for user %s: %s", user_id, error)
         raise
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from app import settings
+from app.core import metrics
+from app.core.cache import InMemoryCacheBackend, ResponseCache, fingerprint
+
+# The in-memory backend is per worker: an entry invalidated by a write on
+# one worker may still be served by the others until it expires.
+response_cache = ResponseCache(
+    backend=InMemoryCacheBackend(maxsize=settings.response_cache_size),
+    ttl=settings.response_cache_ttl,
+    stale_ttl=settings.response_cache_stale_ttl,
+)
+metrics.register_cache("responses", response_cache)
+
+
+def user_cache_key(user_id: str, admin_api_key: str) -> str:
+    """
+    Builds the cache key of a user's data
+    :param user_id: The user's ID
+    :param admin_api_key: The admin API key used to read the user
+    :return: the cache key
+    """
+    return f"optscale:user:{fingerprint(admin_api_key)}:{user_id}"
+
+
+def user_org_cache_key(user_id: str, admin_api_key: str) -> str:
+    """
+    Builds the cache key of a user's organizations
+    :param user_id: The user's ID
+    :param admin_api_key: The admin API key used to get the user's token
+    :return: the cache key
+    """
+    return f"optscale:user_org:{fingerprint(admin_api_key)}:{user_id}"
@@ -5,18 +5,25 @@ import logging
 from fastapi import status as http_status
 
 from app import settings
-from app.core.api_client import APIClient
+from app.core.api_client import get_optscale_api_client
+from app.core.deadline import deadline
 from app.core.exceptions import (
     OptScaleAPIResponseError,
     UserAccessTokenError,
 )
 from app.core.input_validation import validate_currency
+from app.core.logging_config import LogPayload
 from app.optscale_api.auth_api import (
     OptScaleAuth,
     build_bearer_token_header,
 )
 from app.optscale_api.helpers.auth_tokens_dependency import (
     get_user_access_token,
+    invalidate_user_access_token,
+)
+from app.optscale_api.helpers.response_cache import (
+    response_cache,
+    user_org_cache_key,
 )
 
 ORG_ENDPOINT = "/restapi/v2/organizations"
@@ -29,18 +36,28 @@ ORG_FETCHING_ERROR = "An error occurred getting organizations for user {}."
 
 class OptScaleOrgAPI:
     def __init__(self):
-        self.api_client = APIClient(base_url=settings.opt_scale_api_url)
+        self.api_client = get_optscale_api_client()
 
     async def get_user_org(
-        self, user_id: str, admin_api_key: str, auth_client: OptScaleAuth
+        self,
+        user_id: str,
+        admin_api_key: str,
+        auth_client: OptScaleAuth,
+        raw: bool = False,
     ) -> dict:
         """
-        Retrieves the organization for a given user
+        Retrieves the organization for a given user.
+        The result is cached according to the `response_cache` settings.
+        The token fetch and the organization call share the
+        `request_deadline` time budget.
 
         :param auth_client: An instance of the `OptScaleAuth` class used to interact
             with the authentication service.
         :param user_id: the user's id for whom we want to retrieve the organization
         :param admin_api_key: the secret admin API key
+        :param raw: Return the OptScale response body unparsed under the
+            `content` key, to forward it as is. Ignored when the response
+            cache is enabled, as the cache keeps the parsed responses.
         :return: The organization data or None if there is an error.
         An empty list if no organization exists
         :raise:
@@ -63,20 +80,49 @@ class OptScaleOrgAPI:
             ]
         }
         """
+        with deadline(settings.request_deadline):
+            if raw and not response_cache.enabled:
+                return await self._fetch_user_org(
+                    user_id=user_id,
+                    admin_api_key=admin_api_key,
+                    auth_client=auth_client,
+                    raw=True,
+                )
+            return await response_cache.get_or_load(
+                user_org_cache_key(user_id=user_id, admin_api_key=admin_api_key),
+                lambda: self._fetch_user_org(
+                    user_id=user_id,
+                    admin_api_key=admin_api_key,
+                    auth_client=auth_client,
+                ),
+            )
+
+    async def _fetch_user_org(
+        self,
+        user_id: str,
+        admin_api_key: str,
+        auth_client: OptScaleAuth,
+        raw: bool = False,
+    ) -> dict:
         try:
             # get the user's org
             user_access_token = await get_user_access_token(
                 user_id=user_id, admin_api_key=admin_api_key, auth_client=auth_client
             )
-            response = await self.api_client.get(
+            get = self.api_client.get_raw if raw else self.api_client.get
+            response = await get(
                 endpoint=ORG_ENDPOINT,
                 headers=build_bearer_token_header(bearer_token=user_access_token),
             )
 
             if response.get("error"):
                 logger.error(
-                    f"Failed to get the org data from OptScale for the user {user_id}"
+                    "Failed to get the org data from OptScale for the user %s", user_id
                 )
+                if response.get("status_code") == http_status.HTTP_401_UNAUTHORIZED:
+                    invalidate_user_access_token(
+                        user_id=user_id, admin_api_key=admin_api_key
+                    )
                 raise OptScaleAPIResponseError(
                     title="Error response from OptScale",
                     reason=response.get("data", {}).get("error", {}).get("reason", ""),
@@ -84,15 +130,15 @@ class OptScaleOrgAPI:
                         "status_code", http_status.HTTP_403_FORBIDDEN
                     ),
                 )
-            logger.info(f"Successfully fetched user's org {response}")
+            logger.info("Successfully fetched user's org %s", LogPayload(response))
             return response
 
         except UserAccessTokenError as error:
-            logger.error(f"Failed to get access token for user {user_id}: {error}")
+            logger.error("Failed to get access token for user %s: %s", user_id, error)
             raise
         except Exception as error:
             logger.error(
-                f"Exception occurred accessing an organization on OptScale: {error}"
+                "Exception occurred accessing an organization on OptScale: %s", error
             )
             raise
 
@@ -104,9 +150,12 @@ class OptScaleOrgAPI:
         user_id: str,
         admin_api_key: str,
         auth_client: OptScaleAuth,
+        user_access_token: str | None = None,
     ) -> dict | Exception:
         """
-        Creates a new organization for a given user
+        Creates a new organization for a given user.
+        The token fetch and the organization creation share the
+        `request_deadline` time budget.
 
         :param auth_client: An instance of the `OptScaleAuth` class used to interact
         with the authentication service.
@@ -114,6 +163,8 @@ class OptScaleOrgAPI:
         :param currency: The currency to use
         :param user_id: The user's id for whom we want to create the organization
         :param admin_api_key: The Secret admin API key
+        :param user_access_token: The access token of the user if it's already
+        known, like the one returned by the user creation, to skip fetching it.
         :return: The created organization data or None if there is an error.
         :raise:
             UserAccessTokenError If an error occurs while obtaining the access token.
@@ -132,16 +183,38 @@ class OptScaleOrgAPI:
         }
         """
 
-        try:
-            logger.info(f"Fetching access token for user: {user_id}")
-            user_access_token = await get_user_access_token(
-                user_id=user_id, admin_api_key=admin_api_key, auth_client=auth_client
+        with deadline(settings.request_deadline):
+            return await self._create_user_org(
+                org_name=org_name,
+                currency=currency,
+                user_id=user_id,
+                admin_api_key=admin_api_key,
+                auth_client=auth_client,
+                user_access_token=user_access_token,
             )
+
+    async def _create_user_org(
+        self,
+        org_name: str,
+        currency: str,
+        user_id: str,
+        admin_api_key: str,
+        auth_client: OptScaleAuth,
+        user_access_token: str | None = None,
+    ) -> dict:
+        try:
+            if user_access_token is None:
+                logger.info("Fetching access token for user: %s", user_id)
+                user_access_token = await get_user_access_token(
+                    user_id=user_id,
+                    admin_api_key=admin_api_key,
+                    auth_client=auth_client,
+                )
             # Create the user's organization
             payload = {"name": org_name, "currency": currency}
             headers = build_bearer_token_header(bearer_token=user_access_token)
             logger.info(
-                f"Creating organization for user: {user_id} with payload {payload}"
+                "Creating organization for user: %s with payload %s", user_id, payload
             )
             response = await self.api_client.post(
                 endpoint=ORG_ENDPOINT, headers=headers, data=payload
@@ -149,6 +222,10 @@ class OptScaleOrgAPI:
 
             if response.get("error"):
                 logger.error(ORG_CREATION_ERROR.format(user_id))
+                if response.get("status_code") == http_status.HTTP_401_UNAUTHORIZED:
+                    invalidate_user_access_token(
+                        user_id=user_id, admin_api_key=admin_api_key
+                    )
                 raise OptScaleAPIResponseError(
                     title="Error response from OptScale",
                     reason=response.get("data", {})
@@ -159,15 +236,18 @@ class OptScaleOrgAPI:
                     ),
                 )
 
-            logger.info(f"Successfully created organization for user: {user_id}")
+            logger.info("Successfully created organization for user: %s", user_id)
+            await response_cache.invalidate(
+                user_org_cache_key(user_id=user_id, admin_api_key=admin_api_key)
+            )
             return response
 
         except UserAccessTokenError as error:
-            logger.error(f"Failed to get access token for user {user_id}: {error}")
+            logger.error("Failed to get access token for user %s: %s", user_id, error)
             raise
 
         except Exception as error:
             logger.error(
-                f"Exception occurred creating an organization on OptScale: {error}"
+                "Exception occurred creating an organization on OptScale: %s", error
             )
             raise
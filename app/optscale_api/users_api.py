@@ -4,11 +4,14 @@ import logging
 
 from fastapi import status as http_status
 
-from app import settings
-from app.core.api_client import APIClient
+from app.core.api_client import get_optscale_api_client
 from app.core.exceptions import OptScaleAPIResponseError
+from app.core.logging_config import LogPayload
+from app.core.responses import json_loads
 
 from .auth_api import build_admin_api_key_header
+from .helpers.auth_tokens_dependency import cache_user_access_token
+from .helpers.response_cache import response_cache, user_cache_key
 
 AUTH_USERS_ENDPOINT = "/auth/v2/users"
 logger = logging.getLogger(__name__)
@@ -16,7 +19,7 @@ logger = logging.getLogger(__name__)
 
 class OptScaleUserAPI:
     def __init__(self):
-        self.api_client = APIClient(base_url=settings.opt_scale_api_url)
+        self.api_client = get_optscale_api_client()
 
     # todo: check the password lenght and strength
     async def create_user(
@@ -25,6 +28,7 @@ class OptScaleUserAPI:
         display_name: str,
         password: str,
         admin_api_key: str,
+        raw: bool = False,
     ) -> dict[str, str] | Exception:
         """
         Creates a new user in the system.
@@ -33,6 +37,10 @@ class OptScaleUserAPI:
         :param email: The email of the user.
         :param display_name: The display name of the user
         :param password: The password of the user.
+        :param raw: Return the OptScale response body unparsed under the
+            `content` key, to forward it as is. The body is still parsed once,
+            to get the id and the token of the new user, but it is not
+            serialized again.
         :return:dict[str, str] : User information.
         :raises OptScaleAPIResponseError if any error occurs
         contacting the OptScale APIs
@@ -45,7 +53,8 @@ class OptScaleUserAPI:
             "verified": True,
         }
         headers = build_admin_api_key_header(admin_api_key=admin_api_key)
-        response = await self.api_client.post(
+        post = self.api_client.post_raw if raw else self.api_client.post
+        response = await post(
             endpoint=AUTH_USERS_ENDPOINT, data=payload, headers=headers
         )
         if response.get("error"):
@@ -55,14 +64,27 @@ class OptScaleUserAPI:
                 reason=response.get("data", {}).get("error", {}).get("reason", ""),
                 status_code=response.get("status_code", http_status.HTTP_403_FORBIDDEN),
             )
-        logger.info(f"User successfully created: {response}")
+        logger.info("User successfully created: %s", LogPayload(response))
+        # the raw body is parsed only to read the id and the token of the user
+        user = json_loads(response["content"]) if raw else response.get("data", {})
+        user_id = user.get("id")
+        if user_id:
+            await response_cache.invalidate(
+                user_cache_key(user_id=user_id, admin_api_key=admin_api_key)
+            )
+            if user.get("token"):
+                # the new user's token saves a token request to the next calls
+                cache_user_access_token(
+                    user_id=user_id, admin_api_key=admin_api_key, token=user["token"]
+                )
         return response
 
     async def get_user_by_id(
         self, admin_api_key: str, user_id: str
     ) -> dict[str, str] | None:
         """
-        Retrieves a user's information
+        Retrieves a user's information.
+        The result is cached according to the `response_cache` settings.
 
         :param admin_api_key: the secret admin API key
         :param user_id: the user's ID for whom we want to retrieve the information
@@ -86,17 +108,26 @@ class OptScaleUserAPI:
         }
 
         """
+        return await response_cache.get_or_load(
+            user_cache_key(user_id=user_id, admin_api_key=admin_api_key),
+            lambda: self._fetch_user_by_id(
+                admin_api_key=admin_api_key, user_id=user_id
+            ),
+        )
 
+    async def _fetch_user_by_id(
+        self, admin_api_key: str, user_id: str
+    ) -> dict[str, str] | None:
         headers = build_admin_api_key_header(admin_api_key=admin_api_key)
         response = await self.api_client.get(
             endpoint=AUTH_USERS_ENDPOINT + "/" + user_id, headers=headers
         )
         if response.get("error"):
-            logger.info(f"Failed to get the user {user_id} data from OptScale")
+            logger.info("Failed to get the user %s data from OptScale", user_id)
             raise OptScaleAPIResponseError(
                 title="Error response from OptScale",
                 reason=response.get("data", {}).get("error", {}).get("reason", ""),
                 status_code=response.get("status_code", http_status.HTTP_404_NOT_FOUND),
             )
-        logger.info(f"User Successfully fetched : {response}")
+        logger.info("User Successfully fetched : %s", LogPayload(response))
         return response
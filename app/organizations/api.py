@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends
+import logging
+
+from fastapi import APIRouter, Depends, Header, Request
 from fastapi import status as http_status
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 
 from app import settings
-from app.core.auth_jwt_bearer import JWTBearer
+from app.core.auth_jwt_bearer import JWTBearer, get_jwt_claims
+from app.core.concurrency import bounded_as_completed
 from app.core.exceptions import (
+    format_exception,
     handle_exception,
 )
+from app.core.idempotency import idempotent_requests
+from app.core.responses import FastJSONResponse, build_json_response
+from app.core.streaming import NDJSON_MEDIA_TYPE, accepts_ndjson, stream_ndjson
 from app.optscale_api.auth_api import OptScaleAuth
 from app.optscale_api.helpers.auth_tokens_dependency import get_auth_client
 from app.optscale_api.orgs_api import OptScaleOrgAPI
@@ -14,8 +21,11 @@ from app.organizations.model import (
     CreateOrgData,
     OptScaleOrganization,
     OptScaleOrganizationResponse,
+    OrgLookupData,
+    OrgLookupResponse,
 )
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
@@ -36,6 +46,8 @@ async def get_orgs(
     This endpoint fetches the organization(s) for the specified user by interacting
     with the OptScale API.
     It returns the organization data as a JSON response.
+    Unlike `POST /organizations:lookup`, it doesn't stream NDJSON: OptScale
+    answers with a single JSON document, which is forwarded as is.
 
     :param user_id:  The ID of the user whose organization data is to be retrieved.
     :param optscale_api: An instance of OptScaleOrgAPI for interacting with the organization API.
@@ -61,6 +73,7 @@ async def get_orgs(
                 "title": "Error response from OptScale",
                 "status": 403,
                 "traceId": "c4bd62b3fe154456af99380796fb669c",
+                "requestId": "c4bd62b3fe154456af99380796fb669c",
                 "errors": {
                     "reason": "Oh no, I made a mistake!"0
                 }
@@ -74,12 +87,13 @@ async def get_orgs(
     try:
         # send request with the Secret token to the OptScale API
         response = await optscale_api.get_user_org(
-            user_id=user_id, admin_api_key=settings.admin_token, auth_client=auth_client
-        )
-        return JSONResponse(
-            status_code=response.get("status_code", http_status.HTTP_200_OK),
-            content=response.get("data", {}),
+            user_id=user_id,
+            admin_api_key=settings.admin_token,
+            auth_client=auth_client,
+            raw=True,
         )
+        # the OptScale response is forwarded as is, unless it's cached
+        return build_json_response(response, http_status.HTTP_200_OK)
 
     except Exception as error:
         handle_exception(error=error)
@@ -92,20 +106,25 @@ async def get_orgs(
     dependencies=[Depends(JWTBearer())],
 )
 async def create_orgs(
+    request: Request,
     data: CreateOrgData,
     org_api: OptScaleOrgAPI = Depends(),
     auth_client: OptScaleAuth = Depends(get_auth_client),
+    idempotency_key: str | None = Header(default=None),
 ):
     """
     Create a new FinOPs organization.
 
-    .
+    With an `Idempotency-Key` header, the request can be retried safely,
+    like the `POST /users` one.
 
+    :param request: The inbound request, authenticated by JWTBearer.
     :param data: The input data required to create an organization,including the user_id
     :param org_api: An instance of OptScaleOrgAPI for managing organization operations.
                     Dependency injection via `Depends()`.
     :param auth_client: An instance of OptScaleAuth for authentication.
                         Dependency injection via `Depends(get_auth_client)`.
+    :param idempotency_key: The optional `Idempotency-Key` header.
 
     :return: A response model containing the details of the created organization.
     Example
@@ -129,6 +148,7 @@ async def create_orgs(
                 "title": "Error response from OptScale",
                 "status": 403,
                 "traceId": "c4bd62b3fe154456af99380796fb669c",
+                "requestId": "c4bd62b3fe154456af99380796fb669c",
                 "errors": {
                     "reason": "Oh no, I made a mistake!"
                 }
@@ -140,18 +160,133 @@ async def create_orgs(
 
     """
 
-    try:
-        response = await org_api.create_user_org(
-            org_name=data.org_name,
-            user_id=data.user_id,
-            currency=data.currency,
-            admin_api_key=settings.admin_token,
-            auth_client=auth_client,
+    async def create():
+        try:
+            response = await org_api.create_user_org(
+                org_name=data.org_name,
+                user_id=data.user_id,
+                currency=data.currency,
+                admin_api_key=settings.admin_token,
+                auth_client=auth_client,
+            )
+            return JSONResponse(
+                status_code=response.get("status_code", http_status.HTTP_201_CREATED),
+                content=response.get("data", {}),
+            )
+
+        except Exception as error:
+            handle_exception(error=error)
+
+    return await idempotent_requests.run(
+        idempotency_key,
+        scope="POST /organizations",
+        payload=data.model_dump(mode="json"),
+        handler=create,
+        claims=get_jwt_claims(request),
+    )
+
+
+@router.post(
+    path=":lookup",
+    status_code=http_status.HTTP_200_OK,
+    response_model=OrgLookupResponse,
+    dependencies=[Depends(JWTBearer())],
+)
+async def lookup_orgs(
+    request: Request,
+    data: OrgLookupData,
+    optscale_api: OptScaleOrgAPI = Depends(),
+    auth_client: OptScaleAuth = Depends(get_auth_client),
+):
+    """
+    Retrieve the organizations of many users at once.
+
+    The organizations of each user are fetched like the `GET /organizations`
+    endpoint does, concurrently for up to `batch_concurrency` users at a time.
+    A failure for a user doesn't fail the whole lookup: the result of that user
+    carries the status and the formatted error object, and `failed` counts them.
+
+    With `Accept: application/x-ndjson`, the results are streamed as soon as
+    they are available, one line per user with its `user_id`, and without
+    the `failed` count.
+
+    :param request: The inbound request.
+    :param data: The IDs of the users, up to `batch_max_size`.
+    :param optscale_api: An instance of OptScaleOrgAPI for interacting with the organization API.
+                        Dependency injection via `Depends()`.
+    :param auth_client: An instance of OptScaleAuth for authentication.
+                        Dependency injection via Depends(get_auth_client)`.
+
+    :return: The map of user_id to the organizations or the error of the user.
+    Example
+
+        {
+            "results": {
+                "f0bd0c4a-7c55-45b7-8b58-27740e38789a": {
+                    "status": 200,
+                    "organizations": [{"id": "64a7424c-...", "name": "test name", ...}]
+                },
+                "2d4d1a55-dd5d-4bd4-8e4e-9bb07f3a8e1c": {
+                    "status": 403,
+                    "error": {
+                        "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.3",
+                        "title": "Error response from OptScale",
+                        "status": 403,
+                        "traceId": "c4bd62b3fe154456af99380796fb669c",
+                        "requestId": "c4bd62b3fe154456af99380796fb669c",
+                        "errors": {"reason": "Oh no, I made a mistake!"}
+                    }
+                }
+            },
+            "failed": 1
+        }
+
+    :dependencies:
+        JWTBearer: Ensures that the request is authenticated using a valid JWT.
+    """
+
+    async def get_user_org(user_id: str) -> dict:
+        return await optscale_api.get_user_org(
+            user_id=user_id, admin_api_key=settings.admin_token, auth_client=auth_client
         )
-        return JSONResponse(
-            status_code=response.get("status_code", http_status.HTTP_201_CREATED),
-            content=response.get("data", {}),
+
+    # the duplicates are looked up once
+    user_ids = list(dict.fromkeys(data.user_ids))
+    # the users whose lookup failed, counted as the results are produced
+    failed: list[str] = []
+
+    async def lookup():
+        async for _, user_id, outcome in bounded_as_completed(
+            get_user_org, user_ids, limit=settings.batch_concurrency
+        ):
+            if isinstance(outcome, Exception):
+                failed.append(user_id)
+                error = format_exception(outcome)
+                yield user_id, {"status": error.status_code, "error": error.detail}
+            else:
+                yield (
+                    user_id,
+                    {
+                        "status": outcome.get("status_code", http_status.HTTP_200_OK),
+                        "organizations": outcome.get("data", {}).get(
+                            "organizations", []
+                        ),
+                    },
+                )
+        logger.info(
+            "Organizations of %d users looked up, %d failed", len(user_ids), len(failed)
         )
 
-    except Exception as error:
-        handle_exception(error=error)
+    if accepts_ndjson(request):
+        return StreamingResponse(
+            stream_ndjson(
+                {"user_id": user_id, **result} async for user_id, result in lookup()
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    results = {user_id: result async for user_id, result in lookup()}
+    return FastJSONResponse(
+        status_code=http_status.HTTP_200_OK,
+        content={"results": results, "failed": len(failed)},
+    )
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from typing import Any
+
+from pydantic import BaseModel, conlist
+
+from app import settings
 
 
 class CreateOrgData(BaseModel):
@@ -36,3 +40,54 @@ class OptScaleOrganization(BaseModel):
 
 class OptScaleOrganizationResponse(BaseModel):
     organizations: list[OptScaleOrganization] | None = None
+
+
+class OrgLookupData(BaseModel):
+    user_ids: conlist(str, min_length=1, max_length=settings.batch_max_size)
+
+
+class UserOrgLookupResult(BaseModel):
+    status: int
+    organizations: list[OptScaleOrganization] | None = None
+    error: dict[str, Any] | None = None
+
+
+class OrgLookupResponse(BaseModel):
+    results: dict[str, UserOrgLookupResult]
+    failed: int
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "results": {
+                        "f0bd0c4a-7c55-45b7-8b58-27740e38789a": {
+                            "status": 200,
+                            "organizations": [
+                                {
+                                    "id": "64a7424c-0745-4926-bb6d-2125b16c91f9",
+                                    "pool_id": "f9c65ff7-fa7a-4d91-b2ca-60dcac5422da",
+                                    "name": "test name",
+                                    "created_at": 1585680056,
+                                    "deleted_at": 0,
+                                    "is_demo": False,
+                                    "currency": "USD",
+                                }
+                            ],
+                        },
+                        "2d4d1a55-dd5d-4bd4-8e4e-9bb07f3a8e1c": {
+                            "status": 403,
+                            "error": {
+                                "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.3",
+                                "title": "Error response from OptScale",
+                                "status": 403,
+                                "traceId": "c4bd62b3fe154456af99380796fb669c",
+                                "requestId": "c4bd62b3fe154456af99380796fb669c",
+                                "errors": {"reason": "Forbidden"},
+                            },
+                        },
+                    },
+                    "failed": 1,
+                }
+            ]
+        }
+    }
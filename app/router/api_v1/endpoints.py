@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 
+from app.customers.api import router as customer_router
+from app.health.api import router as health_router
 from app.organizations.api import router as org_router
 from app.users.api import router as user_router
 
@@ -9,6 +11,8 @@ include_api = api_router.include_router
 routers = (
     (user_router, "users", "users"),
     (org_router, "organizations", "organizations"),
+    (customer_router, "customers", "customers"),
+    (health_router, "health", "health"),
 )
 
 for router_item in routers:
@@ -1,13 +1,40 @@
-from fastapi import APIRouter, Depends
+import logging
+from dataclasses import replace
+
+from fastapi import APIRouter, Depends, Header, Request
 from fastapi import status as http_status
-from starlette.responses import JSONResponse
+from starlette.responses import StreamingResponse
 
 from app import settings
-from app.core.auth_jwt_bearer import JWTBearer
-from app.core.exceptions import OptScaleAPIResponseError, handle_exception
+from app.core.auth_jwt_bearer import JWTBearer, get_jwt_claims
+from app.core.concurrency import bounded_as_completed
+from app.core.exceptions import (
+    OptScaleAPIResponseError,
+    format_exception,
+    handle_exception,
+)
+from app.core.idempotency import StoredResponse, idempotent_requests
+from app.core.responses import build_json_response, json_dumps, json_loads
+from app.core.streaming import (
+    NDJSON_MEDIA_TYPE,
+    accepts_ndjson,
+    stream_json_array,
+    stream_ndjson,
+)
+from app.optscale_api.auth_api import OptScaleAuth
+from app.optscale_api.helpers.auth_tokens_dependency import (
+    get_auth_client,
+    get_user_access_token,
+)
 from app.optscale_api.users_api import OptScaleUserAPI
-from app.users.model import CreateUserData, CreateUserResponse
+from app.users.model import (
+    CreateUserBatchResult,
+    CreateUserData,
+    CreateUserResponse,
+    CreateUsersBatchData,
+)
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
@@ -17,15 +44,33 @@ router = APIRouter()
     response_model=CreateUserResponse,
     dependencies=[Depends(JWTBearer())],
 )
-async def create_user(data: CreateUserData, user_api: OptScaleUserAPI = Depends()):
+async def create_user(
+    request: Request,
+    data: CreateUserData,
+    user_api: OptScaleUserAPI = Depends(),
+    auth_client: OptScaleAuth = Depends(get_auth_client),
+    idempotency_key: str | None = Header(default=None),
+):
     """
     Create a FinOps user
     This endpoint allows the creation of a new user by interacting with the OptScale API.
     It returns the created user's details.
 
+    With an `Idempotency-Key` header, the request can be retried safely:
+    the response of the first successful request is replayed, with the
+    `Idempotent-Replayed: true` header, for the same key and payload, and
+    the duplicates sent while it runs wait for it. The user's token is not
+    stored along with the response: a replayed response carries a token
+    obtained for the user when it's replayed.
+
+    :param request: The inbound request, authenticated by JWTBearer.
     :param data: The input data required to create a user.
     :param user_api: An instance of OptScaleOrgAPI for managing organization operations.
                     Dependency injection via `Depends()`.
+    :param auth_client: An instance of OptScaleAuth, to obtain the token of
+                        the user when the response is replayed.
+                        Dependency injection via `Depends(get_auth_client)`.
+    :param idempotency_key: The optional `Idempotency-Key` header.
 
     :return: A response model containing the details of the newly created user.
     Example
@@ -53,6 +98,7 @@ async def create_user(data: CreateUserData, user_api: OptScaleUserAPI = Depends(
                 "title": "Error response from OptScale",
                 "status": 403,
                 "traceId": "c4bd62b3fe154456af99380796fb669c",
+                "requestId": "c4bd62b3fe154456af99380796fb669c",
                 "errors": {
                     "reason": "Oh no, I made a mistake!"
                 }
@@ -61,17 +107,135 @@ async def create_user(data: CreateUserData, user_api: OptScaleUserAPI = Depends(
     :dependencies:
         JWTBearer: Ensures that the request is authenticated using a valid JWT.
     """
-    try:
-        response = await user_api.create_user(
-            email=str(data.email),
-            display_name=data.display_name,
-            password=data.password,
+
+    async def create():
+        try:
+            response = await user_api.create_user(
+                email=str(data.email),
+                display_name=data.display_name,
+                password=data.password,
+                admin_api_key=settings.admin_token,
+                raw=True,
+            )
+            return build_json_response(response, http_status.HTTP_201_CREATED)
+
+        except OptScaleAPIResponseError as error:
+            handle_exception(error=error)
+
+    async def with_fresh_token(response: StoredResponse) -> StoredResponse:
+        user = json_loads(response.body)
+        try:
+            user["token"] = await get_user_access_token(
+                user_id=user["id"],
+                admin_api_key=settings.admin_token,
+                auth_client=auth_client,
+            )
+        except Exception as error:
+            handle_exception(error=error)
+        return replace(response, body=json_dumps(user))
+
+    return await idempotent_requests.run(
+        idempotency_key,
+        scope="POST /users",
+        payload=data.model_dump(mode="json"),
+        handler=create,
+        claims=get_jwt_claims(request),
+        redact=_without_token,
+        restore=with_fresh_token,
+    )
+
+
+def _without_token(response: StoredResponse) -> StoredResponse:
+    user = json_loads(response.body)
+    user.pop("token", None)
+    return replace(response, body=json_dumps(user))
+
+
+@router.post(
+    path=":batch",
+    status_code=http_status.HTTP_200_OK,
+    response_model=list[CreateUserBatchResult],
+    dependencies=[Depends(JWTBearer())],
+)
+async def create_users_batch(
+    request: Request,
+    data: CreateUsersBatchData,
+    user_api: OptScaleUserAPI = Depends(),
+):
+    """
+    Create many FinOps users at once
+    The users are created concurrently, up to `batch_concurrency` at a time,
+    and the result of each one is streamed as soon as it's available, so the
+    items of the returned JSON array are in completion order: the `index`
+    field refers to the position of the user in the request.
+
+    A failure doesn't stop the batch: the failed item has the status and the
+    formatted error object the `POST /users` endpoint would have returned.
+
+    With `Accept: application/x-ndjson`, the results are streamed as newline
+    delimited JSON, one result per line, instead of a JSON array.
+
+    :param request: The inbound request.
+    :param data: The list of users to create, up to `batch_max_size`.
+    :param user_api: An instance of OptScaleUserAPI.
+                    Dependency injection via `Depends()`.
+
+    :return: A streamed array of results like the following ones:
+    Example
+
+        [
+            {
+                "index": 1,
+                "email": "bruce.banner@iamhulk.com",
+                "status": 409,
+                "error": {
+                    "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.8",
+                    "title": "Error response from OptScale",
+                    "status": 409,
+                    "traceId": "c4bd62b3fe154456af99380796fb669c",
+                    "requestId": "c4bd62b3fe154456af99380796fb669c",
+                    "errors": {"reason": "User already exists"}
+                }
+            },
+            {
+                "index": 0,
+                "email": "peter.parker@iamspiderman.com",
+                "status": 201,
+                "data": {"id": "f0bd0c4a-7c55-45b7-8b58-27740e38789a", ...}
+            }
+        ]
+    :dependencies:
+        JWTBearer: Ensures that the request is authenticated using a valid JWT.
+    """
+
+    async def create(user: CreateUserData) -> dict:
+        return await user_api.create_user(
+            email=str(user.email),
+            display_name=user.display_name,
+            password=user.password,
             admin_api_key=settings.admin_token,
         )
-        return JSONResponse(
-            status_code=response.get("status_code", http_status.HTTP_201_CREATED),
-            content=response.get("data", {}),
-        )
 
-    except OptScaleAPIResponseError as error:
-        handle_exception(error=error)
+    async def results():
+        failed = 0
+        async for index, user, outcome in bounded_as_completed(
+            create, data, limit=settings.batch_concurrency
+        ):
+            result = {"index": index, "email": str(user.email)}
+            if isinstance(outcome, Exception):
+                failed += 1
+                error = format_exception(outcome)
+                result.update(status=error.status_code, error=error.detail)
+            else:
+                result.update(
+                    status=outcome.get("status_code", http_status.HTTP_201_CREATED),
+                    data=outcome.get("data", {}),
+                )
+            yield result
+        logger.info("Batch of %d users created, %d failed", len(data), failed)
+
+    if accepts_ndjson(request):
+        return StreamingResponse(stream_ndjson(results()), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(
+        stream_json_array(results()), media_type="application/json"
+    )
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from pydantic import BaseModel, EmailStr, constr
+from typing import Any
+
+from pydantic import BaseModel, EmailStr, conlist, constr
+
+from app import settings
 
 
 class CreateUserData(BaseModel):
@@ -40,3 +44,35 @@ class CreateUserResponse(BaseModel):
             ]
         }
     }
+
+
+CreateUsersBatchData = conlist(
+    CreateUserData, min_length=1, max_length=settings.batch_max_size
+)
+
+
+class CreateUserBatchResult(BaseModel):
+    index: int
+    email: EmailStr
+    status: int
+    data: CreateUserResponse | None = None
+    error: dict[str, Any] | None = None
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "index": 1,
+                    "email": "bruce.banner@iamhulk.com",
+                    "status": 409,
+                    "error": {
+                        "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.5.8",
+                        "title": "Error response from OptScale",
+                        "status": 409,
+                        "traceId": "c4bd62b3fe154456af99380796fb669c",
+                        "requestId": "c4bd62b3fe154456af99380796fb669c",
+                        "errors": {"reason": "User already exists"},
+                    },
+                }
+            ]
+        }
+    }
@@ -0,0 +1,409 @@
+"""
+Load tests the modifier endpoints against the OptScale stand-in of
+`tests.helpers.fake_optscale`, and reports for each scenario the throughput,
+the p50/p95/p99 latencies, the errors and the upstream calls made.
+
+The scenarios are `POST /users`, `GET /organizations` and `POST /organizations`.
+The application runs either:
+
+- in-process (the default): the requests go straight to `app.main:app`
+  through the ASGI transport of httpx, and so do its OptScale requests to the
+  stand-in, so the numbers reflect the CPU cost of the modifier alone,
+- as a server: the stand-in and the application are started on local ports,
+  the latter with uvicorn or gunicorn, and driven over TCP.
+
+The results are printed and can be written as JSON, with the current commit,
+to compare them across commits:
+
+    python -m tests.benchmarks.bench_endpoints --requests 2000 --concurrency 50
+    python -m tests.benchmarks.bench_endpoints --mode server --server gunicorn \\
+        --workers 4 --upstream-latency 0.02 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess  # nosec B404
+import sys
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+
+import httpx
+
+from app import settings
+from app.core.api_client import APIClient, api_clients
+from tests.helpers.fake_optscale import FakeOptScale, Fault, Latency
+from tests.helpers.jwt import create_jwt_token
+
+SCENARIOS = ("create_user", "get_organizations", "create_organization")
+APP_PORT = 8765
+UPSTREAM_PORT = 8766
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    concurrency: int
+    errors: int
+    duration: float
+    throughput: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    status_codes: dict[str, int] = field(default_factory=dict)
+    upstream_calls: dict[str, int] = field(default_factory=dict)
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Returns the percentile of the sorted values, with the nearest-rank method.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def drive(
+    send: Callable[[int], Awaitable[httpx.Response]], requests: int, concurrency: int
+) -> tuple[list[float], dict[str, int], float]:
+    """
+    Sends `requests` requests with `concurrency` workers.
+
+    :param send: Sends the request of the given number.
+    :return: The sorted latencies, the count of each status code and the duration.
+    """
+    latencies = []
+    status_codes: dict[str, int] = {}
+    next_request = iter(range(requests))
+
+    async def worker():
+        for number in next_request:
+            start = time.perf_counter()
+            try:
+                status_code = str((await send(number)).status_code)
+            except httpx.HTTPError as error:
+                status_code = type(error).__name__
+            latencies.append(time.perf_counter() - start)
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    return sorted(latencies), status_codes, duration
+
+
+def build_senders(
+    client: httpx.AsyncClient, user_ids: list[str]
+) -> dict[str, Callable[[int], Awaitable[httpx.Response]]]:
+    run_id = uuid.uuid4().hex[:8]
+    # the warm up and the measured run send the same numbers, but each user
+    # needs a new email
+    user_numbers = itertools.count()
+
+    async def create_user(number: int) -> httpx.Response:
+        number = next(user_numbers)
+        return await client.post(
+            "/users",
+            json={
+                "email": f"load-{run_id}-{number}@example.com",
+                "display_name": f"Load Test {number}",
+                "password": "load-test-password",
+            },
+        )
+
+    async def get_organizations(number: int) -> httpx.Response:
+        user_id = user_ids[number % len(user_ids)]
+        return await client.get("/organizations", params={"user_id": user_id})
+
+    async def create_organization(number: int) -> httpx.Response:
+        return await client.post(
+            "/organizations",
+            json={
+                "org_name": f"Organization {number}",
+                "user_id": user_ids[number % len(user_ids)],
+                "currency": "USD",
+            },
+        )
+
+    return {
+        "create_user": create_user,
+        "get_organizations": get_organizations,
+        "create_organization": create_organization,
+    }
+
+
+async def run_scenarios(
+    client: httpx.AsyncClient,
+    user_ids: list[str],
+    scenarios: list[str],
+    requests: int,
+    concurrency: int,
+    get_upstream_calls: Callable[[], Awaitable[dict[str, int]]],
+    reset_upstream_calls: Callable[[], Awaitable[None]],
+) -> list[ScenarioResult]:
+    senders = build_senders(client, user_ids)
+    results = []
+    for scenario in scenarios:
+        send = senders[scenario]
+        await drive(send, min(requests, 50), concurrency)  # warm up
+        await reset_upstream_calls()
+        latencies, status_codes, duration = await drive(send, requests, concurrency)
+        errors = sum(
+            count
+            for status_code, count in status_codes.items()
+            if not status_code.startswith("2")
+        )
+        results.append(
+            ScenarioResult(
+                scenario=scenario,
+                requests=requests,
+                concurrency=concurrency,
+                errors=errors,
+                duration=round(duration, 3),
+                throughput=round(requests / duration, 1),
+                latency_p50=round(percentile(latencies, 50) * 1000, 2),
+                latency_p95=round(percentile(latencies, 95) * 1000, 2),
+                latency_p99=round(percentile(latencies, 99) * 1000, 2),
+                status_codes=status_codes,
+                upstream_calls=await get_upstream_calls(),
+            )
+        )
+    return results
+
+
+def build_fake(args: argparse.Namespace) -> FakeOptScale:
+    fake = FakeOptScale(admin_api_key=settings.admin_token, seed=args.seed)
+    for endpoint in fake.behaviours:
+        fake.set_latency(
+            endpoint, Latency(args.upstream_latency, args.upstream_distribution)
+        )
+        fake.set_fault(endpoint, Fault(args.upstream_error_rate))
+    return fake
+
+
+async def run_in_process(args: argparse.Namespace) -> list[ScenarioResult]:
+    from app.main import app
+
+    fake = build_fake(args)
+    user_ids = []
+    for index in range(args.users):
+        user = fake.add_user(email=f"user{index}@example.com")
+        fake.add_organization(user["id"], name=f"Organization {index}")
+        user_ids.append(user["id"])
+
+    upstream = APIClient(
+        base_url=settings.opt_scale_api_url, transport=fake.transport()
+    )
+    previous = api_clients.register(upstream)
+
+    async def get_upstream_calls() -> dict[str, int]:
+        return dict(fake.calls)
+
+    async def reset_upstream_calls():
+        fake.reset_stats()
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url=f"http://testserver{settings.api_v1_prefix}",
+            headers={"Authorization": f"Bearer {create_jwt_token()}"},
+        ) as client:
+            return await run_scenarios(
+                client,
+                user_ids,
+                args.scenarios,
+                args.requests,
+                args.concurrency,
+                get_upstream_calls,
+                reset_upstream_calls,
+            )
+    finally:
+        await upstream.close()
+        if previous is not None:
+            api_clients.register(previous)
+
+
+def start_upstream(args: argparse.Namespace) -> tuple[subprocess.Popen, list[str]]:
+    command = [
+        sys.executable,
+        "-m",
+        "tests.helpers.fake_optscale",
+        "--port",
+        str(UPSTREAM_PORT),
+        "--admin-api-key",
+        settings.admin_token,
+        "--latency",
+        str(args.upstream_latency),
+        "--distribution",
+        args.upstream_distribution,
+        "--error-rate",
+        str(args.upstream_error_rate),
+        "--users",
+        str(args.users),
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(  # nosec B603
+        command, stdout=subprocess.PIPE, text=True
+    )
+    user_ids = [process.stdout.readline().strip() for _ in range(args.users)]
+    return process, user_ids
+
+
+def start_app(args: argparse.Namespace) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPT_SCALE_API_URL": f"http://127.0.0.1:{UPSTREAM_PORT}",
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.server == "gunicorn":
+        command = [
+            "gunicorn",
+            "-b",
+            f"127.0.0.1:{APP_PORT}",
+            "--workers",
+            str(args.workers),
+            "--worker-class",
+            "uvicorn_worker.UvicornWorker",
+            "app.main:app",
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(APP_PORT),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+        ]
+    return subprocess.Popen(command, env=env)  # nosec B603
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} is not ready after {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+async def run_servers(args: argparse.Namespace) -> list[ScenarioResult]:
+    upstream_url = f"http://127.0.0.1:{UPSTREAM_PORT}/_stats"
+    app_url = f"http://127.0.0.1:{APP_PORT}{settings.api_v1_prefix}"
+    processes = []
+    try:
+        upstream, user_ids = start_upstream(args)
+        processes.append(upstream)
+        processes.append(start_app(args))
+        await wait_until_ready(upstream_url)
+        await wait_until_ready(f"{app_url}/health")
+        async with httpx.AsyncClient() as stats_client:
+
+            async def get_upstream_calls() -> dict[str, int]:
+                return (await stats_client.get(upstream_url)).json()["calls"]
+
+            async def reset_upstream_calls():
+                await stats_client.delete(upstream_url)
+
+            async with httpx.AsyncClient(
+                base_url=app_url,
+                headers={"Authorization": f"Bearer {create_jwt_token()}"},
+                limits=httpx.Limits(max_connections=args.concurrency),
+                timeout=60,
+            ) as client:
+                return await run_scenarios(
+                    client,
+                    user_ids,
+                    args.scenarios,
+                    args.requests,
+                    args.concurrency,
+                    get_upstream_calls,
+                    reset_upstream_calls,
+                )
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(  # nosec B603 B607
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load tests the modifier endpoints.")
+    parser.add_argument(
+        "--mode", choices=["in-process", "server"], default="in-process"
+    )
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--upstream-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--upstream-distribution",
+        choices=["fixed", "uniform", "exponential", "lognormal"],
+        default="lognormal",
+    )
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="the JSON file to write the results to")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # the errors are counted in the results, logging them would skew the numbers
+    logging.disable(logging.CRITICAL)
+    if args.mode == "server":
+        results = asyncio.run(run_servers(args))
+    else:
+        results = asyncio.run(run_in_process(args))
+
+    report = {
+        "commit": current_commit(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": [asdict(result) for result in results],
+    }
+    for result in results:
+        print(
+            f"{result.scenario}: {result.throughput:,.0f} requests/s, "
+            f"p50 {result.latency_p50:.1f}ms, p95 {result.latency_p95:.1f}ms, "
+            f"p99 {result.latency_p99:.1f}ms, {result.errors} errors, "
+            f"upstream calls {result.upstream_calls}"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Measures the cost of verifying the inbound JWT token of a request, with and
+without the cache of the verified tokens.
+
+Run it with:
+
+    python -m tests.benchmarks.bench_jwt_verification
+"""
+
+import timeit
+
+from app.core.auth_jwt_bearer import decode_jwt, verified_tokens, verify_jwt
+from tests.helpers.jwt import create_jwt_token
+
+ITERATIONS = 20_000
+
+
+def run() -> dict[str, float]:
+    token = create_jwt_token()
+    verified_tokens.clear()
+
+    uncached = timeit.timeit(lambda: decode_jwt(token), number=ITERATIONS)
+    cached = timeit.timeit(lambda: verify_jwt(token), number=ITERATIONS)
+
+    return {
+        "uncached_us_per_request": uncached / ITERATIONS * 1_000_000,
+        "cached_us_per_request": cached / ITERATIONS * 1_000_000,
+    }
+
+
+if __name__ == "__main__":
+    results = run()
+    print(f"JWT verification, {ITERATIONS} requests with the same token")
+    print(f"  full decode: {results['uncached_us_per_request']:.2f} us/request")
+    print(f"  cached:      {results['cached_us_per_request']:.2f} us/request")
@@ -0,0 +1,100 @@
+"""
+Compares the throughput of an ASGI application wrapped by the pure ASGI
+LogRequestMiddleware with the former BaseHTTPMiddleware based implementation.
+
+The requests are sent straight to the ASGI application, with no network nor
+HTTP client involved, and the log records are discarded, so the numbers
+reflect the cost of the middleware machinery.
+
+Run it with:
+
+    python -m tests.benchmarks.bench_request_middleware
+"""
+
+import asyncio
+import logging
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.core.middleware import LogRequestMiddleware
+
+REQUESTS = 20_000
+logger = logging.getLogger("app.core.middleware")
+
+
+class BaseHTTPLogRequestMiddleware(BaseHTTPMiddleware):
+    """The LogRequestMiddleware implementation replaced by the pure ASGI one."""
+
+    async def dispatch(self, request: Request, call_next):
+        logger.info(f"Request: {request.method} {request.url}")
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(
+            f"Response: status_code={response.status_code}, process_time={process_time:.2f}s"
+        )
+        return response
+
+
+async def endpoint(request):
+    return JSONResponse({"organizations": []})
+
+
+def build_app(middleware_class) -> Starlette:
+    app = Starlette(routes=[Route("/organizations", endpoint)])
+    app.add_middleware(middleware_class)
+    return app
+
+
+async def send_requests(app: Starlette, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/organizations",
+        "raw_path": b"/organizations",
+        "query_string": b"user_id=1234",
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("testserver", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+async def run() -> dict[str, float]:
+    logger.setLevel(logging.WARNING)
+    results = {}
+    for name, middleware_class in (
+        ("base_http_middleware", BaseHTTPLogRequestMiddleware),
+        ("pure_asgi_middleware", LogRequestMiddleware),
+    ):
+        app = build_app(middleware_class)
+        await send_requests(app, 500)  # warm up
+        elapsed = await send_requests(app, REQUESTS)
+        results[name] = REQUESTS / elapsed
+    return results
+
+
+if __name__ == "__main__":
+    results = asyncio.run(run())
+    print(f"LogRequestMiddleware, {REQUESTS} requests")
+    for name, requests_per_second in results.items():
+        print(f"  {name}: {requests_per_second:,.0f} requests/s")
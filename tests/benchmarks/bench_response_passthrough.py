@@ -0,0 +1,97 @@
+"""
+Compares the CPU time spent per request to turn an OptScale response into
+the response of a handler, for:
+
+- the parsed path: the body is parsed by `response.json()` and serialized
+  again by `JSONResponse`, as `GET /organizations` used to do,
+- the pass-through path: the raw body is forwarded by `build_json_response`,
+- the transform path: the body is parsed and serialized with the
+  `json_loads` and `FastJSONResponse` helpers, with orjson.
+
+Only the parsing and serialization are measured, not the network.
+`POST /users` forwards the raw body too, but still parses it once to read
+the id and the token of the new user: only the serialization is saved there,
+so its cost is between the pass-through and the transform paths.
+
+Run it with:
+
+    python -m tests.benchmarks.bench_response_passthrough
+"""
+
+import json
+import time
+
+from httpx import Request, Response
+from starlette.responses import JSONResponse
+
+from app.core.responses import FastJSONResponse, build_json_response, json_loads
+
+REQUESTS = 5_000
+ORGANIZATIONS = 50
+
+
+def build_upstream_response() -> Response:
+    organizations = [
+        {
+            "deleted_at": 0,
+            "created_at": 1731919809,
+            "id": f"3e61c772-b78a-4345-b7da-{index:012d}",
+            "name": f"Organization {index}",
+            "pool_id": "0bc61f62-f280-4a03-bf3f-446b14994594",
+            "is_demo": False,
+            "currency": "USD",
+            "cleaned_at": 0,
+        }
+        for index in range(ORGANIZATIONS)
+    ]
+    return Response(
+        status_code=200,
+        headers={"Content-Type": "application/json"},
+        content=json.dumps({"organizations": organizations}).encode(),
+        request=Request("GET", "http://optscale/restapi/v2/organizations"),
+    )
+
+
+def parsed(upstream: Response):
+    data = upstream.json()
+    return JSONResponse(status_code=upstream.status_code, content=data)
+
+
+def pass_through(upstream: Response):
+    content = upstream.content
+    if content.lstrip()[:1] not in (b"{", b"["):
+        raise ValueError("not a JSON document")
+    return build_json_response(
+        {"status_code": upstream.status_code, "content": content}, 200
+    )
+
+
+def transform(upstream: Response):
+    data = json_loads(upstream.content)
+    return FastJSONResponse(status_code=upstream.status_code, content=data)
+
+
+def measure(func, upstream: Response, requests: int) -> float:
+    start = time.process_time()
+    for _ in range(requests):
+        func(upstream)
+    return (time.process_time() - start) / requests
+
+
+def run() -> dict[str, float]:
+    upstream = build_upstream_response()
+    results = {}
+    for name, func in (
+        ("parsed", parsed),
+        ("pass_through", pass_through),
+        ("transform", transform),
+    ):
+        measure(func, upstream, 100)  # warm up
+        results[name] = measure(func, upstream, REQUESTS)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"Response of {ORGANIZATIONS} organizations, {REQUESTS} requests")
+    for name, cpu_time in run().items():
+        print(f"  {name}: {cpu_time * 1_000_000:,.1f} µs of CPU per request")
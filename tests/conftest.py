@@ -6,8 +6,14 @@ import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
 from app import settings
-from app.core.auth_jwt_bearer import JWTBearer
+from app.core.api_client import APIClient, api_clients
+from app.core.auth_jwt_bearer import JWTBearer, verified_tokens
+from app.core.idempotency import idempotent_requests
+from app.core.retry import RetryPolicy
 from app.main import app
+from app.optscale_api.helpers.auth_tokens_dependency import user_access_tokens
+from app.optscale_api.helpers.response_cache import response_cache
+from tests.helpers.fake_optscale import FakeOptScale
 
 
 # Mock dependency to bypass JWTBearer authentication
@@ -28,6 +34,17 @@ def override_jwt_bearer():
     app.dependency_overrides = {}
 
 
+# Don't share the in-process caches between tests
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    verified_tokens.clear()
+    user_access_tokens.clear()
+    response_cache.backend.clear()
+    response_cache.reset_stats()
+    idempotent_requests.store.clear()
+
+
 @pytest_asyncio.fixture
 async def async_client():
     transport = ASGITransport(app=app)
@@ -37,6 +54,24 @@ async def async_client():
         yield client
 
 
+@pytest_asyncio.fixture
+async def fake_optscale():
+    """
+    Sends the OptScale requests of the application to an in-memory stand-in.
+    """
+    fake = FakeOptScale(admin_api_key=settings.admin_token, seed=42)
+    client = APIClient(
+        base_url=settings.opt_scale_api_url,
+        transport=fake.transport(),
+        retry_policy=RetryPolicy(backoff_base=0, jitter=False),
+    )
+    previous = api_clients.register(client)
+    yield fake
+    await client.close()
+    if previous is not None:
+        api_clients.register(previous)
+
+
 @pytest.fixture
 def test_data() -> dict:
     path = os.getenv("PYTEST_CURRENT_TEST")
@@ -0,0 +1,380 @@
+"""
+A stand-in for the OptScale API, implementing the endpoints used by the
+modifier: `/auth/v2/tokens`, `/auth/v2/users` and `/restapi/v2/organizations`.
+
+Each endpoint can be given a latency distribution and a fault injection rate,
+and the number of requests served concurrently can be limited, so that the
+retries, caching and pooling of the modifier can be exercised without network
+access. The state lives in memory and the server counts the calls it receives.
+
+In-process, with the ASGI transport of httpx:
+
+    fake = FakeOptScale(admin_api_key="secret")
+    client = APIClient(base_url="http://optscale", transport=fake.transport())
+
+On a local port:
+
+    python -m tests.helpers.fake_optscale --port 8081 --latency 0.05 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import random
+import secrets
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+TOKENS = "tokens"
+USERS = "users"
+ORGANIZATIONS = "organizations"
+
+
+@dataclass
+class Latency:
+    """
+    The distribution of the time an endpoint takes to answer.
+
+    :param mean: The mean latency, in seconds.
+    :param distribution: One of `fixed`, `uniform` (between 0 and twice the
+        mean), `exponential` or `lognormal` (a long tail, like real services).
+    :param sigma: The standard deviation of the logarithm for `lognormal`.
+    """
+
+    mean: float = 0.0
+    distribution: str = "fixed"
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return rng.uniform(0, 2 * self.mean)
+        if self.distribution == "exponential":
+            return rng.expovariate(1 / self.mean)
+        if self.distribution == "lognormal":
+            # the median is chosen so that the mean is self.mean
+            mu = math.log(self.mean) - self.sigma**2 / 2
+            return rng.lognormvariate(mu, self.sigma)
+        return self.mean
+
+
+@dataclass
+class Fault:
+    """
+    The errors injected in the responses of an endpoint.
+
+    :param rate: The probability of a request to fail, between 0 and 1.
+    :param status_code: The status code of the failed responses.
+    :param retry_after: The Retry-After header of the failed responses, if any.
+    """
+
+    rate: float = 0.0
+    status_code: int = 503
+    retry_after: float | None = None
+
+
+@dataclass
+class Behaviour:
+    latency: Latency = field(default_factory=Latency)
+    fault: Fault = field(default_factory=Fault)
+    # the next calls failing for sure, before the random faults apply
+    scripted_failures: list[int] = field(default_factory=list)
+
+
+def optscale_error(status_code: int, error_code: str, reason: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "error": {
+                "status_code": status_code,
+                "error_code": error_code,
+                "reason": reason,
+                "params": [],
+            }
+        },
+    )
+
+
+class FakeOptScale:
+    """
+    An in-memory OptScale API.
+
+    :param admin_api_key: The secret expected in the `Secret` header.
+    :param max_concurrency: The maximum requests served at once, the others
+        wait for their turn, or get a 503 with `reject_over_limit`.
+    :param reject_over_limit: Reject the requests over the limit instead of queueing.
+    :param seed: The seed of the random latencies and faults, for repeatable runs.
+    """
+
+    def __init__(
+        self,
+        admin_api_key: str,
+        max_concurrency: int | None = None,
+        reject_over_limit: bool = False,
+        seed: int | None = None,
+    ):
+        self.admin_api_key = admin_api_key
+        self.max_concurrency = max_concurrency
+        self.reject_over_limit = reject_over_limit
+        self.behaviours = {name: Behaviour() for name in (TOKENS, USERS, ORGANIZATIONS)}
+        self.users: dict[str, dict] = {}
+        self.organizations: dict[str, list[dict]] = {}
+        self.tokens: dict[str, str] = {}
+        self.calls: Counter[str] = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rejected = 0
+        self._rng = random.Random(seed)  # nosec B311
+        self._semaphore = (
+            asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        )
+        self.app = Starlette(
+            routes=[
+                Route("/auth/v2/tokens", self.create_token, methods=["POST"]),
+                Route("/auth/v2/users", self.create_user, methods=["POST"]),
+                Route("/auth/v2/users/{user_id}", self.get_user, methods=["GET"]),
+                Route(
+                    "/restapi/v2/organizations",
+                    self.list_organizations,
+                    methods=["GET"],
+                ),
+                Route(
+                    "/restapi/v2/organizations",
+                    self.create_organization,
+                    methods=["POST"],
+                ),
+                # to read and reset the counters of a server running on a port
+                Route("/_stats", self.get_stats, methods=["GET"]),
+                Route("/_stats", self.delete_stats, methods=["DELETE"]),
+            ]
+        )
+
+    def transport(self) -> httpx.ASGITransport:
+        """Returns an httpx transport sending the requests to this server."""
+        return httpx.ASGITransport(app=self.app)
+
+    def set_latency(self, endpoint: str, latency: Latency):
+        self.behaviours[endpoint].latency = latency
+
+    def set_fault(self, endpoint: str, fault: Fault):
+        self.behaviours[endpoint].fault = fault
+
+    def fail_next(self, endpoint: str, count: int = 1, status_code: int = 503):
+        """Makes the next `count` calls to the endpoint fail with `status_code`."""
+        self.behaviours[endpoint].scripted_failures.extend([status_code] * count)
+
+    def add_user(self, email: str, display_name: str = "", **fields) -> dict:
+        """Adds a user to the server state and returns it."""
+        user = {
+            "created_at": int(time.time()),
+            "deleted_at": 0,
+            "id": str(uuid.uuid4()),
+            "display_name": display_name or email.split("@")[0],
+            "is_active": True,
+            "type_id": 1,
+            "email": email,
+            "scope_id": None,
+            "slack_connected": False,
+            "is_password_autogenerated": False,
+            "jira_connected": False,
+            **fields,
+        }
+        self.users[user["id"]] = user
+        self.organizations.setdefault(user["id"], [])
+        return user
+
+    def add_organization(self, user_id: str, name: str, currency: str = "USD") -> dict:
+        """Adds an organization managed by the user and returns it."""
+        organization = {
+            "deleted_at": 0,
+            "created_at": int(time.time()),
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "pool_id": str(uuid.uuid4()),
+            "is_demo": False,
+            "currency": currency,
+            "cleaned_at": 0,
+        }
+        self.organizations.setdefault(user_id, []).append(organization)
+        return organization
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "max_in_flight": self.max_in_flight,
+            "rejected": self.rejected,
+        }
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.max_in_flight = self.in_flight
+        self.rejected = 0
+
+    async def _serve(self, endpoint: str, request: Request, handler) -> JSONResponse:
+        self.calls[endpoint] += 1
+        if self._semaphore is not None:
+            if self.reject_over_limit and self._semaphore.locked():
+                self.rejected += 1
+                return optscale_error(503, "OE0503", "Too many connections")
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            behaviour = self.behaviours[endpoint]
+            delay = behaviour.latency.sample(self._rng)
+            if delay:
+                await asyncio.sleep(delay)
+            if behaviour.scripted_failures:
+                return optscale_error(
+                    behaviour.scripted_failures.pop(0), "OE0000", "Injected failure"
+                )
+            if behaviour.fault.rate and self._rng.random() < behaviour.fault.rate:
+                response = optscale_error(
+                    behaviour.fault.status_code, "OE0000", "Injected failure"
+                )
+                if behaviour.fault.retry_after is not None:
+                    response.headers["Retry-After"] = str(behaviour.fault.retry_after)
+                return response
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    async def get_stats(self, request: Request) -> JSONResponse:
+        return JSONResponse(content=self.stats())
+
+    async def delete_stats(self, request: Request) -> JSONResponse:
+        self.reset_stats()
+        return JSONResponse(content=self.stats())
+
+    def _is_admin(self, request: Request) -> bool:
+        return secrets.compare_digest(
+            request.headers.get("Secret", ""), self.admin_api_key
+        )
+
+    def _user_of(self, request: Request) -> str | None:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer":
+            return None
+        return self.tokens.get(token)
+
+    async def create_token(self, request: Request) -> JSONResponse:
+        async def handler(request: Request) -> JSONResponse:
+            if not self._is_admin(request):
+                return optscale_error(403, "OA0006", "Bad secret")
+            user_id = (await request.json()).get("user_id")
+            if user_id not in self.users:
+                return optscale_error(404, "OA0043", f"User {user_id} not found")
+            token = secrets.token_urlsafe(32)
+            self.tokens[token] = user_id
+            return JSONResponse(
+                status_code=201, content={"user_id": user_id, "token": token}
+            )
+
+        return await self._serve(TOKENS, request, handler)
+
+    async def create_user(self, request: Request) -> JSONResponse:
+        async def handler(request: Request) -> JSONResponse:
+            if not self._is_admin(request):
+                return optscale_error(403, "OA0006", "Bad secret")
+            payload = await request.json()
+            email = payload.get("email")
+            if any(user["email"] == email for user in self.users.values()):
+                return optscale_error(409, "OA0042", f"User {email} already exists")
+            user = self.add_user(email=email, display_name=payload.get("display_name"))
+            token = secrets.token_urlsafe(32)
+            self.tokens[token] = user["id"]
+            return JSONResponse(status_code=201, content={**user, "token": token})
+
+        return await self._serve(USERS, request, handler)
+
+    async def get_user(self, request: Request) -> JSONResponse:
+        async def handler(request: Request) -> JSONResponse:
+            if not self._is_admin(request):
+                return optscale_error(403, "OA0006", "Bad secret")
+            user_id = request.path_params["user_id"]
+            user = self.users.get(user_id)
+            if user is None:
+                return optscale_error(404, "OA0043", f"User {user_id} not found")
+            return JSONResponse(content=user)
+
+        return await self._serve(USERS, request, handler)
+
+    async def list_organizations(self, request: Request) -> JSONResponse:
+        async def handler(request: Request) -> JSONResponse:
+            user_id = self._user_of(request)
+            if user_id is None:
+                return optscale_error(401, "OE0235", "Unauthorized")
+            return JSONResponse(
+                content={"organizations": self.organizations.get(user_id, [])}
+            )
+
+        return await self._serve(ORGANIZATIONS, request, handler)
+
+    async def create_organization(self, request: Request) -> JSONResponse:
+        async def handler(request: Request) -> JSONResponse:
+            user_id = self._user_of(request)
+            if user_id is None:
+                return optscale_error(401, "OE0235", "Unauthorized")
+            payload = await request.json()
+            organization = self.add_organization(
+                user_id=user_id,
+                name=payload.get("name"),
+                currency=payload.get("currency", "USD"),
+            )
+            return JSONResponse(status_code=201, content=organization)
+
+        return await self._serve(ORGANIZATIONS, request, handler)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Runs a fake OptScale API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--admin-api-key", default="admin-api-key")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean, in seconds")
+    parser.add_argument(
+        "--distribution",
+        default="lognormal",
+        choices=["fixed", "uniform", "exponential", "lognormal"],
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--reject-over-limit", action="store_true")
+    parser.add_argument("--users", type=int, default=0, help="users to create")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeOptScale(
+        admin_api_key=args.admin_api_key,
+        max_concurrency=args.max_concurrency,
+        reject_over_limit=args.reject_over_limit,
+        seed=args.seed,
+    )
+    for endpoint in fake.behaviours:
+        fake.set_latency(endpoint, Latency(args.latency, args.distribution))
+        fake.set_fault(endpoint, Fault(args.error_rate, args.error_status))
+    for index in range(args.users):
+        user = fake.add_user(email=f"user{index}@example.com")
+        fake.add_organization(user["id"], name=f"Organization {index}")
+        print(user["id"], flush=True)
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,34 @@
+import asyncio
 from unittest.mock import AsyncMock, patch
 
 import pytest
-from httpx import Headers, HTTPStatusError, Request, RequestError, Response
+from httpx import (
+    ConnectError,
+    Headers,
+    HTTPStatusError,
+    Limits,
+    PoolTimeout,
+    ReadTimeout,
+    Request,
+    RequestError,
+    Response,
+    Timeout,
+)
 
-from app.core.api_client import APIClient
+from app import settings
+from app.core.api_client import (
+    APIClient,
+    APIClientRegistry,
+    build_request_key,
+    build_timeout,
+    upstream_coalesced_requests,
+)
+from app.core.circuit_breaker import CircuitBreaker, CircuitState
+from app.core.deadline import deadline
+from app.core.rate_limit import InMemoryRateLimitBackend, OutboundRateLimiter, RateLimit
+from app.core.request_id import request_id_context
+from app.core.retry import RetryPolicy
+from app.core.tracing import tracer
 
 
 @pytest.fixture
@@ -206,3 +231,478 @@ async def test_api_client_close():
 
     # Assert that aclose was called
     client.client.aclose.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_api_client_registry_reuses_client():
+    registry = APIClientRegistry()
+    client = registry.get("http://testserver")
+
+    assert registry.get("http://testserver") is client
+    assert registry.get("http://anotherserver") is not client
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_api_client_registry_close():
+    registry = APIClientRegistry()
+    client = registry.get("http://testserver")
+    client.client.aclose = AsyncMock()
+
+    await registry.close()
+
+    client.client.aclose.assert_called_once()
+    # a new client is created once the registry has been closed
+    assert registry.get("http://testserver") is not client
+    await registry.close()
+
+
+def test_api_client_connection_limits():
+    client = APIClient(
+        base_url="http://testserver",
+        limits=Limits(max_connections=5, max_keepalive_connections=2),
+    )
+    pool = client.client._transport._pool
+
+    assert pool._max_connections == 5
+    assert pool._max_keepalive_connections == 2
+
+
+def test_build_request_key():
+    key = build_request_key(
+        "GET", "/endpoint", headers={"Secret": "key"}, params={"a": 1, "b": 2}
+    )
+    assert key == build_request_key(
+        "GET", "/endpoint", headers={"secret": "key"}, params={"b": 2, "a": 1}
+    )
+    assert key != build_request_key(
+        "GET", "/endpoint", headers={"Secret": "another key"}, params={"a": 1, "b": 2}
+    )
+    assert key != build_request_key("GET", "/endpoint", headers={"Secret": "key"})
+    # the credentials are not part of the key
+    assert "key" not in key[3]
+
+
+@pytest.mark.asyncio
+async def test_api_client_coalesces_concurrent_gets():
+    client = APIClient(base_url="http://testserver", coalesce_gets=True)
+
+    async def make_request(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return {"status_code": 200, "data": {"key": "value"}}
+
+    client._make_request = AsyncMock(side_effect=make_request)
+    coalesced = upstream_coalesced_requests.values.get(("http://testserver",), 0)
+    headers = {"Authorization": "Bearer token"}
+    responses = await asyncio.gather(
+        *(client.get("/endpoint", headers=headers) for _ in range(5)),
+        client.get("/endpoint", headers={"Authorization": "Bearer another token"}),
+    )
+
+    assert all(response["data"] == {"key": "value"} for response in responses)
+    # callers don't share the same dict
+    assert responses[0] is not responses[1]
+    assert client._make_request.call_count == 2
+    assert client.in_flight_gets.stats() == {"calls": 2, "collapsed": 4}
+    assert upstream_coalesced_requests.values[("http://testserver",)] == coalesced + 4
+
+
+@pytest.mark.asyncio
+async def test_api_client_coalescing_opt_in():
+    client = APIClient(base_url="http://testserver")
+    client._make_request = AsyncMock(return_value={"status_code": 200, "data": {}})
+
+    await asyncio.gather(client.get("/endpoint"), client.get("/endpoint"))
+    assert client._make_request.call_count == 2
+
+    await asyncio.gather(
+        client.get("/endpoint", coalesce=True), client.get("/endpoint", coalesce=True)
+    )
+    assert client._make_request.call_count == 3
+
+
+def _response(status_code, headers=None):
+    return Response(
+        status_code=status_code,
+        request=Request(method="GET", url="http://testserver/endpoint"),
+        headers=Headers({"Content-Type": "application/json", **(headers or {})}),
+        json={"status": status_code},
+    )
+
+
+@pytest.fixture
+def retrying_client():
+    return APIClient(
+        base_url="http://testserver",
+        retry_policy=RetryPolicy(max_attempts=3, backoff_base=0, jitter=False),
+    )
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_retries_idempotent_requests(mock_request, retrying_client):
+    mock_request.side_effect = [
+        RequestError("Connection refused"),
+        _response(503),
+        _response(200),
+    ]
+    response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 200
+    assert mock_request.call_count == 3
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_retries_exhausted(mock_request, retrying_client):
+    mock_request.side_effect = [_response(502), _response(502), _response(502)]
+    response = await retrying_client.delete("/endpoint")
+    assert response["status_code"] == 502
+    assert mock_request.call_count == 3
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_does_not_retry_post(mock_request, retrying_client):
+    mock_request.side_effect = [_response(503), _response(200)]
+    response = await retrying_client.post("/endpoint", data={"key": "value"})
+    assert response["status_code"] == 503
+    assert mock_request.call_count == 1
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_retries_post_with_idempotency_key(
+    mock_request, retrying_client
+):
+    mock_request.side_effect = [_response(503), _response(201)]
+    response = await retrying_client.post(
+        "/endpoint", headers={"Secret": "key"}, idempotency_key="request-1"
+    )
+    assert response["status_code"] == 201
+    assert mock_request.call_count == 2
+    headers = mock_request.call_args.kwargs["headers"]
+    assert headers["Secret"] == "key"
+    assert headers["Idempotency-Key"] == "request-1"
+
+
+@pytest.mark.asyncio
+@patch("asyncio.sleep")
+@patch("httpx.AsyncClient.request")
+async def test_api_client_retry_after(mock_request, mock_sleep, retrying_client):
+    mock_request.side_effect = [_response(503, {"Retry-After": "2"}), _response(200)]
+    response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 200
+    mock_sleep.assert_awaited_once_with(2.0)
+
+    # too long to wait
+    mock_request.side_effect = [_response(503, {"Retry-After": "3600"})]
+    response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 503
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_make_request_http_status_error_not_json(
+    mock_request, api_client, mock_request_instance
+):
+    mock_request.return_value = Response(
+        status_code=400,
+        request=mock_request_instance,
+        headers=Headers({"Content-Type": "text/html"}),
+        text="<html>Bad Request</html>",
+    )
+    response = await api_client._make_request("POST", "/endpoint")
+    assert response["status_code"] == 400
+    assert response["data"] == {}
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_circuit_breaker_fails_fast(mock_request):
+    client = APIClient(
+        base_url="http://testserver",
+        retry_policy=RetryPolicy(max_attempts=1),
+        circuit_breaker=CircuitBreaker(
+            "http://testserver", failure_threshold=2, recovery_timeout=60
+        ),
+    )
+    mock_request.side_effect = [
+        _response(502),
+        ConnectError("Connection refused", request=Request("GET", "/endpoint")),
+    ]
+    assert (await client.get("/endpoint"))["status_code"] == 502
+    assert (await client.get("/endpoint"))["status_code"] == 503
+    assert client.circuit_breaker.state is CircuitState.OPEN
+
+    response = await client.get("/endpoint")
+    assert response["status_code"] == 503
+    assert "http://testserver is unavailable" in response["data"]["error"]["reason"]
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_circuit_breaker_ignores_client_errors(mock_request):
+    client = APIClient(
+        base_url="http://testserver",
+        circuit_breaker=CircuitBreaker("http://testserver", failure_threshold=1),
+    )
+    mock_request.return_value = _response(404)
+    await client.get("/endpoint")
+    await client.get("/endpoint")
+    assert client.circuit_breaker.state is CircuitState.CLOSED
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_circuit_breaker_counts_calls(mock_request, retrying_client):
+    mock_request.side_effect = [
+        ConnectError("Connection refused", request=Request("GET", "/endpoint")),
+        _response(503),
+        _response(503),
+    ]
+    response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 503
+    assert mock_request.call_count == 3
+    assert retrying_client.circuit_breaker.failures == 1
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_circuit_breaker_ignores_local_failures(mock_request):
+    client = APIClient(
+        base_url="http://testserver",
+        retry_policy=RetryPolicy(max_attempts=1),
+        circuit_breaker=CircuitBreaker("http://testserver", failure_threshold=1),
+    )
+    mock_request.side_effect = [
+        _response(500),
+        PoolTimeout("No connection available", request=Request("GET", "/endpoint")),
+    ]
+    assert (await client.get("/endpoint"))["status_code"] == 500
+    assert (await client.get("/endpoint"))["status_code"] == 503
+    assert client.circuit_breaker.state is CircuitState.CLOSED
+    assert client.circuit_breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_api_client_registry_health():
+    registry = APIClientRegistry()
+    client = registry.get("http://testserver")
+    client.circuit_breaker.failure_threshold = 1
+    client.circuit_breaker.record_failure()
+
+    health = registry.health()
+    assert health["http://testserver"]["state"] == "open"
+    await registry.close()
+
+
+def test_build_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "default_request_timeout", 10)
+    monkeypatch.setattr(settings, "api_client_connect_timeout", 2)
+    monkeypatch.setattr(settings, "api_client_read_timeout", None)
+    monkeypatch.setattr(settings, "api_client_write_timeout", None)
+    monkeypatch.setattr(settings, "api_client_pool_timeout", 1)
+    assert build_timeout() == Timeout(10, connect=2, pool=1)
+
+
+def test_api_client_timeout_for_endpoint():
+    client = APIClient(
+        base_url="http://testserver",
+        timeout=Timeout(10, connect=2),
+        endpoint_timeouts={"/auth": 8, "/auth/v2/tokens": 3},
+    )
+    assert client.timeout_for("/restapi/v2/organizations") == Timeout(10, connect=2)
+    assert client.timeout_for("/auth/v2/users") == Timeout(8, connect=2, pool=10)
+    assert client.timeout_for("/auth/v2/tokens") == Timeout(3, connect=2, pool=10)
+
+    with deadline(1):
+        timeout = client.timeout_for("/auth/v2/tokens")
+    assert timeout.connect <= 1
+    assert timeout.read <= 1
+    assert timeout.pool <= 1
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_deadline_exceeded(mock_request, retrying_client):
+    with deadline(0.001):
+        await asyncio.sleep(0.01)
+        response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 504
+    assert "No time left" in response["data"]["error"]["reason"]
+    mock_request.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_no_retry_past_deadline(mock_request):
+    client = APIClient(
+        base_url="http://testserver",
+        retry_policy=RetryPolicy(max_attempts=3, backoff_base=2, jitter=False),
+    )
+    mock_request.side_effect = [_response(503), _response(200)]
+    with deadline(1):
+        response = await client.get("/endpoint")
+    assert response["status_code"] == 503
+    assert mock_request.call_count == 1
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_timeout_cut_by_deadline(mock_request, retrying_client):
+    async def timeout(*args, **kwargs):
+        await asyncio.sleep(0.02)
+        raise ReadTimeout("Timed out", request=Request("GET", "/endpoint"))
+
+    mock_request.side_effect = timeout
+    with deadline(0.01):
+        response = await retrying_client.get("/endpoint")
+    assert response["status_code"] == 504
+    # our budget ran out, the upstream isn't to blame
+    assert retrying_client.circuit_breaker.failures == 0
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_get_raw(mock_request, api_client, mock_request_instance):
+    body = b'{"organizations": []}'
+    mock_request.return_value = Response(
+        status_code=200,
+        request=mock_request_instance,
+        headers=Headers({"Content-Type": "application/json"}),
+        content=body,
+    )
+    response = await api_client.get_raw("/endpoint")
+    assert response == {"status_code": 200, "content": body}
+
+    mock_request.return_value = Response(
+        status_code=200,
+        request=mock_request_instance,
+        headers=Headers({"Content-Type": "application/json"}),
+        content=b"Unexpected error",
+    )
+    response = await api_client.get_raw("/endpoint")
+    assert response["status_code"] == 403
+    assert response["error"] == "Invalid JSON format in response"
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_post_raw_error(mock_request, api_client):
+    mock_request.return_value = _response(409)
+    response = await api_client.post_raw("/endpoint", data={"key": "value"})
+    # the errors are parsed to be reported
+    assert response["status_code"] == 409
+    assert response["data"] == {"status": 409}
+    assert "content" not in response
+
+
+@pytest.mark.asyncio
+async def test_api_client_registry_register():
+    registry = APIClientRegistry()
+    client = registry.get("http://testserver")
+    replacement = APIClient(base_url="http://testserver")
+
+    assert registry.register(replacement) is client
+    assert registry.get("http://testserver") is replacement
+    await registry.close()
+    await client.close()
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_make_request_propagates_trace(mock_request, api_client):
+    mock_request.return_value = Response(
+        200,
+        json={"key": "value"},
+        request=Request("GET", "http://testserver/users/1234"),
+    )
+    with tracer.start_as_current_span("inbound") as parent:
+        await api_client._make_request("GET", "/users/1234", headers={"Secret": "key"})
+    headers = mock_request.call_args.kwargs["headers"]
+    assert headers["Secret"] == "key"
+    trace_id, parent_id = headers["traceparent"].split("-")[1:3]
+    assert trace_id == parent.trace_id
+    assert parent_id != parent.span_id
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_make_request_forwards_request_id(mock_request, api_client):
+    mock_request.return_value = Response(
+        200, json={}, request=Request("GET", "http://testserver/endpoint")
+    )
+    await api_client._make_request("GET", "/endpoint")
+    assert "X-Request-ID" not in mock_request.call_args.kwargs["headers"]
+
+    with request_id_context("request-1"):
+        await api_client._make_request("GET", "/endpoint")
+    assert mock_request.call_args.kwargs["headers"]["X-Request-ID"] == "request-1"
+
+
+def _rate_limited_client(limits, max_wait=5.0):
+    return APIClient(
+        base_url="http://testserver",
+        retry_policy=RetryPolicy(max_attempts=1),
+        rate_limiter=OutboundRateLimiter(
+            "http://testserver",
+            InMemoryRateLimitBackend(maxsize=10),
+            limits=limits,
+            max_wait=max_wait,
+        ),
+    )
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_rate_limit(mock_request):
+    mock_request.return_value = _response(200)
+    client = _rate_limited_client({"/restapi": RateLimit(limit=2, window=0.1)})
+
+    start = asyncio.get_running_loop().time()
+    responses = await asyncio.gather(
+        *(client.get("/restapi/v2/pools") for _ in range(4))
+    )
+    elapsed = asyncio.get_running_loop().time() - start
+    await client.get("/auth/v2/tokens")
+
+    assert [response["status_code"] for response in responses] == [200] * 4
+    # two requests at once, then one every 0.05s
+    assert elapsed >= 0.09
+    assert client.rate_limiter.stats()["delayed"] == 2
+    assert mock_request.call_count == 5
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_rate_limit_max_wait(mock_request):
+    mock_request.return_value = _response(200)
+    client = _rate_limited_client({"": RateLimit(limit=1, window=60)}, max_wait=0.5)
+
+    await client.get("/endpoint")
+    response = await client.get("/endpoint")
+
+    assert response["status_code"] == 503
+    assert "rate limit of http://testserver" in response["data"]["error"]["reason"]
+    assert client.rate_limiter.stats()["rejected"] == 1
+    assert mock_request.call_count == 1
+
+
+@pytest.mark.asyncio
+@patch("httpx.AsyncClient.request")
+async def test_api_client_rate_limit_throttled_by_upstream(mock_request):
+    mock_request.side_effect = [
+        _response(429, headers={"Retry-After": "0.2"}),
+        _response(200),
+    ]
+    client = _rate_limited_client({"": RateLimit(limit=100, window=1)})
+
+    assert (await client.get("/endpoint"))["status_code"] == 429
+    start = asyncio.get_running_loop().time()
+    assert (await client.get("/endpoint"))["status_code"] == 200
+
+    # the upstream asked to wait before sending another request
+    assert asyncio.get_running_loop().time() - start >= 0.15
+    assert client.rate_limiter.stats()["throttled"] == 1
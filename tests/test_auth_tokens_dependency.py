@@ -0,0 +1,111 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.core.exceptions import UserAccessTokenError
+from app.optscale_api.auth_api import OptScaleAuth, UserAccessToken
+from app.optscale_api.helpers.auth_tokens_dependency import (
+    get_user_access_token,
+    invalidate_user_access_token,
+    user_access_tokens,
+)
+
+
+@pytest.fixture
+def auth_client(mocker):
+    auth_client = OptScaleAuth()
+    mocker.patch.object(
+        auth_client,
+        "obtain_user_access_token",
+        new=AsyncMock(return_value=UserAccessToken(token="good token")),
+    )
+    return auth_client
+
+
+async def test_get_user_access_token_is_cached(auth_client):
+    for _ in range(3):
+        token = await get_user_access_token(
+            user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+        )
+        assert token == "good token"
+    auth_client.obtain_user_access_token.assert_called_once_with(
+        user_id="test_user", admin_api_key="test_key"
+    )
+
+
+async def test_get_user_access_token_cache_key(auth_client):
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="another_key", auth_client=auth_client
+    )
+    await get_user_access_token(
+        user_id="another_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    assert auth_client.obtain_user_access_token.call_count == 3
+
+
+async def test_get_user_access_token_concurrent_misses(auth_client):
+    async def slow_token(**kwargs):
+        await asyncio.sleep(0.01)
+        return UserAccessToken(token="good token")
+
+    auth_client.obtain_user_access_token.side_effect = slow_token
+    tokens = await asyncio.gather(
+        *(
+            get_user_access_token(
+                user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+            )
+            for _ in range(50)
+        )
+    )
+    assert tokens == ["good token"] * 50
+    auth_client.obtain_user_access_token.assert_called_once()
+
+
+async def test_get_user_access_token_errors_are_not_cached(auth_client):
+    auth_client.obtain_user_access_token.side_effect = UserAccessTokenError(
+        "Token not found in the response."
+    )
+    with pytest.raises(UserAccessTokenError):
+        await get_user_access_token(
+            user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+        )
+    assert len(user_access_tokens) == 0
+
+
+async def test_invalidate_user_access_token(auth_client):
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    invalidate_user_access_token(user_id="test_user", admin_api_key="test_key")
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    assert auth_client.obtain_user_access_token.call_count == 2
+
+
+async def test_get_user_access_token_expires_with_the_token(auth_client, monkeypatch):
+    # the token expires in 90s, before the 300s of the cache TTL
+    monkeypatch.setattr(user_access_tokens, "ttl", 300)
+    auth_client.obtain_user_access_token.return_value = UserAccessToken(
+        token="good token", valid_until=time.time() + 90
+    )
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    expires_at, _ = next(iter(user_access_tokens._entries.values()))
+    assert expires_at - time.monotonic() == pytest.approx(30, abs=1)
+
+    auth_client.obtain_user_access_token.return_value = UserAccessToken(
+        token="expiring token", valid_until=time.time() + 30
+    )
+    invalidate_user_access_token(user_id="test_user", admin_api_key="test_key")
+    await get_user_access_token(
+        user_id="test_user", admin_api_key="test_key", auth_client=auth_client
+    )
+    # within the margin, the token is not cached at all
+    assert len(user_access_tokens) == 0
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejectedError
+
+
+async def test_requests_are_admitted_up_to_the_limit():
+    controller = AdmissionController(max_in_flight=2)
+
+    await controller.acquire()
+    await controller.acquire()
+    with pytest.raises(AdmissionRejectedError) as error:
+        await controller.acquire()
+
+    assert error.value.reason == "Too many requests are waiting to be processed"
+    assert controller.stats() == {
+        "max_in_flight": 2,
+        "max_queue": 0,
+        "in_flight": 2,
+        "queued": 0,
+        "admitted": 2,
+        "rejected": 1,
+    }
+    controller.release()
+    await controller.acquire()
+    assert controller.in_flight == 2
+
+
+async def test_queued_requests_are_admitted_in_order():
+    controller = AdmissionController(max_in_flight=1, max_queue=2)
+    await controller.acquire()
+    admitted = []
+
+    async def request(name):
+        await controller.acquire()
+        admitted.append(name)
+
+    waiting = [asyncio.ensure_future(request(name)) for name in ("first", "second")]
+    await asyncio.sleep(0)
+    assert controller.queued == 2
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire()
+
+    controller.release()
+    await waiting[0]
+    assert admitted == ["first"]
+    controller.release()
+    await waiting[1]
+    assert admitted == ["first", "second"]
+    assert controller.in_flight == 1
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_queue_timeout():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.01)
+    await controller.acquire()
+
+    with pytest.raises(AdmissionRejectedError) as error:
+        await controller.acquire()
+
+    assert error.value.reason == "No request slot was released within 0.01s"
+    assert controller.queued == 0
+    assert controller.rejected == 1
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_cancelled_request_leaves_the_queue():
+    controller = AdmissionController(max_in_flight=1, max_queue=1)
+    await controller.acquire()
+    waiting = asyncio.ensure_future(controller.acquire())
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert controller.queued == 0
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_slot_handed_to_a_cancelled_request_is_passed_on():
+    controller = AdmissionController(max_in_flight=1, max_queue=2)
+    await controller.acquire()
+    cancelled = asyncio.ensure_future(controller.acquire())
+    next_one = asyncio.ensure_future(controller.acquire())
+    await asyncio.sleep(0)
+
+    controller.release()
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    await next_one
+
+    assert controller.in_flight == 1
+    assert controller.queued == 0
@@ -0,0 +1,150 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.cache import InMemoryCacheBackend, ResponseCache, TTLCache, fingerprint
+
+
+def test_fingerprint():
+    assert fingerprint("my secret") == fingerprint("my secret")
+    assert fingerprint("my secret") != fingerprint("another secret")
+    assert "my secret" not in fingerprint("my secret")
+
+
+def test_ttl_cache_get_and_set():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_ttl_cache_expiration():
+    cache = TTLCache(maxsize=10, ttl=60)
+    with patch("app.core.cache.time.monotonic", return_value=1000.0):
+        cache.set("key", "value")
+        cache.set("short", "value", ttl=5)
+    with patch("app.core.cache.time.monotonic", return_value=1010.0):
+        assert cache.get("key") == "value"
+        assert cache.get("short", "expired") == "expired"
+    with patch("app.core.cache.time.monotonic", return_value=1060.0):
+        assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # "a" becomes the most recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+def test_ttl_cache_pop_and_clear():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "missing") == "missing"
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats() == {"size": 0, "hits": 0, "misses": 0}
+
+
+@pytest.fixture
+def response_cache():
+    return ResponseCache(backend=InMemoryCacheBackend(maxsize=10), ttl=60, stale_ttl=60)
+
+
+async def test_response_cache_hit_and_miss(response_cache):
+    loader = AsyncMock(return_value={"id": "1"})
+    assert await response_cache.get_or_load("key", loader) == {"id": "1"}
+    assert await response_cache.get_or_load("key", loader) == {"id": "1"}
+    loader.assert_called_once()
+    assert response_cache.stats() == {"hits": 1, "stale_hits": 0, "misses": 1}
+
+
+async def test_response_cache_disabled():
+    response_cache = ResponseCache(backend=InMemoryCacheBackend(maxsize=10), ttl=0)
+    loader = AsyncMock(return_value={"id": "1"})
+    await response_cache.get_or_load("key", loader)
+    await response_cache.get_or_load("key", loader)
+    assert loader.call_count == 2
+
+
+async def test_response_cache_concurrent_misses(response_cache):
+    async def load():
+        await asyncio.sleep(0.01)
+        return {"id": "1"}
+
+    loader = AsyncMock(side_effect=load)
+    results = await asyncio.gather(
+        *(response_cache.get_or_load("key", loader) for _ in range(10))
+    )
+    assert results == [{"id": "1"}] * 10
+    loader.assert_called_once()
+
+
+async def test_response_cache_errors_are_not_cached(response_cache):
+    loader = AsyncMock(side_effect=ValueError("Oh no!"))
+    with pytest.raises(ValueError, match="Oh no!"):
+        await response_cache.get_or_load("key", loader)
+    assert await response_cache.backend.get("key") is None
+
+
+async def test_response_cache_stale_while_revalidate(response_cache):
+    loader = AsyncMock(side_effect=[{"version": 1}, {"version": 2}])
+    with patch("app.core.cache.time.time", return_value=1000.0):
+        await response_cache.get_or_load("key", loader)
+    with patch("app.core.cache.time.time", return_value=1070.0):
+        # the stale value is served while it's refreshed in background
+        assert await response_cache.get_or_load("key", loader) == {"version": 1}
+        await asyncio.gather(*response_cache._refresh_tasks)
+        assert await response_cache.get_or_load("key", loader) == {"version": 2}
+    assert loader.call_count == 2
+    assert response_cache.stats() == {"hits": 1, "stale_hits": 1, "misses": 1}
+
+
+async def test_response_cache_failed_refresh_keeps_stale_value(response_cache, caplog):
+    loader = AsyncMock(side_effect=[{"version": 1}, ValueError("Oh no!")])
+    with patch("app.core.cache.time.time", return_value=1000.0):
+        await response_cache.get_or_load("key", loader)
+    with patch("app.core.cache.time.time", return_value=1070.0):
+        assert await response_cache.get_or_load("key", loader) == {"version": 1}
+        await asyncio.gather(*response_cache._refresh_tasks, return_exceptions=True)
+    assert await response_cache.backend.get("key") is not None
+    assert "Failed to refresh a stale cache entry: Oh no!" in caplog.text
+
+
+async def test_response_cache_invalidate(response_cache):
+    loader = AsyncMock(side_effect=[{"version": 1}, {"version": 2}])
+    await response_cache.get_or_load("key", loader)
+    await response_cache.invalidate("key")
+    assert await response_cache.get_or_load("key", loader) == {"version": 2}
+
+
+async def test_response_cache_invalidate_during_load(response_cache):
+    load_started = asyncio.Event()
+
+    async def load():
+        load_started.set()
+        await asyncio.sleep(0.01)
+        return {"version": 1}
+
+    loading = asyncio.ensure_future(response_cache.get_or_load("key", load))
+    await load_started.wait()
+    await response_cache.invalidate("key")
+    assert await loading == {"version": 1}
+    # the value read before the invalidation is not stored
+    assert await response_cache.backend.get("key") is None
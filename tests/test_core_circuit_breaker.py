@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+@pytest.fixture
+def clock():
+    with patch("app.core.circuit_breaker.time.monotonic", return_value=100.0) as mock:
+        yield mock
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=3, recovery_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow_request()
+    with pytest.raises(CircuitOpenError, match="upstream is unavailable"):
+        breaker.check()
+    assert breaker.stats() == {
+        "state": "open",
+        "failures": 3,
+        "rejected": 2,
+        "retry_after": 10.0,
+    }
+
+
+def test_circuit_half_open_probe_success(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=1, recovery_timeout=10)
+    breaker.record_failure()
+    clock.return_value = 110.0
+    assert breaker.state is CircuitState.HALF_OPEN
+    # a single probe is let through
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_half_open_probe_failure(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=1, recovery_timeout=10)
+    breaker.record_failure()
+    clock.return_value = 110.0
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.retry_after() == 10.0
+
+
+def test_circuit_half_open_lost_probe(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=1, recovery_timeout=10)
+    breaker.record_failure()
+    clock.return_value = 110.0
+    assert breaker.allow_request()
+    # the probe never reported back
+    clock.return_value = 120.0
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_disabled():
+    breaker = CircuitBreaker("upstream", failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow_request()
@@ -0,0 +1,64 @@
+import asyncio
+
+from app.core.concurrency import bounded_as_completed
+
+
+async def test_bounded_as_completed_limits_concurrency():
+    running = max_running = 0
+
+    async def func(item):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return item * 2
+
+    outcomes = [
+        outcome async for outcome in bounded_as_completed(func, range(10), limit=3)
+    ]
+    assert sorted(outcomes) == [(index, index, index * 2) for index in range(10)]
+    assert max_running == 3
+
+
+async def test_bounded_as_completed_yields_in_completion_order():
+    async def func(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    outcomes = [
+        outcome
+        async for outcome in bounded_as_completed(func, [0.03, 0.01, 0.02], limit=3)
+    ]
+    assert [index for index, _, _ in outcomes] == [1, 2, 0]
+
+
+async def test_bounded_as_completed_returns_the_errors():
+    async def func(item):
+        if item == 1:
+            raise ValueError("bad item")
+        return item
+
+    outcomes = {
+        index: outcome
+        async for index, _, outcome in bounded_as_completed(func, range(3), limit=2)
+    }
+    assert outcomes[0] == 0
+    assert isinstance(outcomes[1], ValueError)
+    assert outcomes[2] == 2
+
+
+async def test_bounded_as_completed_cancels_on_close():
+    started = []
+
+    async def func(item):
+        started.append(item)
+        await asyncio.sleep(0 if item == 0 else 10)
+        return item
+
+    iterator = bounded_as_completed(func, range(3), limit=3)
+    assert await anext(iterator) == (0, 0, 0)
+    await iterator.aclose()
+    await asyncio.sleep(0)
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    assert not tasks
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from app.core.deadline import deadline, remaining
+
+
+def test_no_deadline():
+    assert remaining() is None
+    with deadline(None), deadline(0):
+        assert remaining() is None
+
+
+def test_deadline_is_reset():
+    with deadline(10):
+        assert 9 < remaining() <= 10
+    assert remaining() is None
+
+
+def test_nested_deadline_can_only_shorten():
+    with deadline(5):
+        with deadline(60):
+            assert remaining() <= 5
+        with deadline(1):
+            assert remaining() <= 1
+        assert 4 < remaining() <= 5
+
+
+async def test_deadline_is_propagated_to_tasks():
+    async def get_remaining():
+        return remaining()
+
+    with deadline(10):
+        time_left = await asyncio.ensure_future(get_remaining())
+    assert time_left == pytest.approx(10, abs=0.5)
@@ -0,0 +1,426 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+from starlette.responses import JSONResponse
+
+from app.core.auth_jwt_bearer import JWTClaims
+from app.core.idempotency import (
+    IDEMPOTENT_REPLAYED_HEADER,
+    IdempotencyRecord,
+    IdempotentRequests,
+    InMemoryIdempotencyStore,
+    SQLiteIdempotencyStore,
+    StoredResponse,
+    caller_identity,
+    create_idempotency_store,
+    idempotent_requests,
+)
+from app.optscale_api.helpers.auth_tokens_dependency import user_access_tokens
+from tests.helpers.fake_optscale import ORGANIZATIONS, USERS, Fault, Latency
+from tests.helpers.jwt import create_jwt_token
+
+
+def claims(sub, iss="iss"):
+    return JWTClaims(iss=iss, aud="aud", exp=0, nbf=0, sub=sub)
+
+
+CALLER = claims("caller")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryIdempotencyStore(maxsize=10)
+    else:
+        store = SQLiteIdempotencyStore(str(tmp_path / "idempotency.sqlite3"))
+        yield store
+        store.close()
+
+
+class Handler:
+    def __init__(self, status_code=201, delay=0.0, error=None):
+        self.status_code = status_code
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return JSONResponse({"call": self.calls}, status_code=self.status_code)
+
+
+async def test_store_lifecycle(store):
+    response = StoredResponse(201, b'{"id":1}', "application/json")
+
+    assert await store.acquire("key", "abc", ttl=60)
+    assert not await store.acquire("key", "abc", ttl=60)
+    assert await store.get("key") == IdempotencyRecord(fingerprint="abc")
+
+    await store.complete("key", response, ttl=60)
+    assert await store.get("key") == IdempotencyRecord("abc", response)
+    # a completed key is not released
+    await store.release("key")
+    assert (await store.get("key")).response == response
+
+
+async def test_store_release_and_expiration(store):
+    assert await store.acquire("key", "abc", ttl=60)
+    await store.release("key")
+    assert await store.get("key") is None
+
+    assert await store.acquire("expiring", "abc", ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await store.get("expiring") is None
+    assert await store.acquire("expiring", "def", ttl=60)
+    assert (await store.get("expiring")).fingerprint == "def"
+
+
+async def test_memory_store_keeps_the_keys_in_progress():
+    store = InMemoryIdempotencyStore(maxsize=1)
+    assert await store.acquire("running", "abc", ttl=60)
+    for key in ("first", "second"):
+        assert await store.acquire(key, "abc", ttl=60)
+        await store.complete(key, StoredResponse(201, b"{}"), ttl=60)
+
+    assert await store.get("running") == IdempotencyRecord(fingerprint="abc")
+    assert await store.get("first") is None
+    assert not await store.acquire("running", "abc", ttl=60)
+
+
+async def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+    first, second = SQLiteIdempotencyStore(path), SQLiteIdempotencyStore(path)
+    try:
+        assert await first.acquire("key", "abc", ttl=60)
+        assert not await second.acquire("key", "abc", ttl=60)
+        await first.complete("key", StoredResponse(201, b"{}"), ttl=60)
+        assert (await second.get("key")).response == StoredResponse(201, b"{}")
+    finally:
+        first.close()
+        second.close()
+
+
+def test_create_idempotency_store(tmp_path):
+    assert isinstance(
+        create_idempotency_store("memory", "", 10), InMemoryIdempotencyStore
+    )
+    assert isinstance(
+        create_idempotency_store("sqlite", str(tmp_path / "db"), 10),
+        SQLiteIdempotencyStore,
+    )
+    with pytest.raises(ValueError, match="Unknown idempotency store"):
+        create_idempotency_store("redis", "", 10)
+
+
+async def test_duplicates_are_replayed(store):
+    requests = IdempotentRequests(store)
+    handler = Handler()
+
+    first = await requests.run("key", "POST /users", {"a": 1}, handler, claims=CALLER)
+    second = await requests.run("key", "POST /users", {"a": 1}, handler, claims=CALLER)
+
+    assert handler.calls == 1
+    assert first.status_code == second.status_code == 201
+    assert first.body == second.body == b'{"call":1}'
+    assert second.media_type == "application/json"
+    assert IDEMPOTENT_REPLAYED_HEADER not in first.headers
+    assert second.headers[IDEMPOTENT_REPLAYED_HEADER] == "true"
+
+
+async def test_keys_are_scoped():
+    requests = IdempotentRequests(InMemoryIdempotencyStore(maxsize=10))
+    handler = Handler()
+
+    await requests.run("key", "POST /users", {"a": 1}, handler, claims=CALLER)
+    await requests.run("key", "POST /organizations", {"a": 1}, handler, claims=CALLER)
+
+    assert handler.calls == 2
+
+
+async def test_keys_are_scoped_to_the_caller(store):
+    requests = IdempotentRequests(store)
+    handler = Handler()
+
+    first = await requests.run(
+        "key", "POST /users", {"a": 1}, handler, claims=claims("a")
+    )
+    other = await requests.run(
+        "key", "POST /users", {"a": 2}, handler, claims=claims("b")
+    )
+
+    assert handler.calls == 2
+    assert first.body != other.body
+    assert IDEMPOTENT_REPLAYED_HEADER not in other.headers
+
+
+def test_caller_identity():
+    assert caller_identity(claims("sub")) == caller_identity(claims("sub"))
+    assert caller_identity(claims("sub")) != caller_identity(claims("other"))
+    assert caller_identity(claims("sub")) != caller_identity(claims("sub", "other"))
+
+
+async def test_anonymous_caller():
+    requests = IdempotentRequests(InMemoryIdempotencyStore(maxsize=10))
+    handler = Handler()
+
+    await requests.run(None, "POST /users", {}, handler, claims=None)
+    with pytest.raises(HTTPException) as error:
+        await requests.run("key", "POST /users", {}, handler, claims=None)
+
+    assert error.value.status_code == 401
+    assert handler.calls == 1
+
+
+async def test_concurrent_duplicates_wait_for_the_first_request(store):
+    requests = IdempotentRequests(store)
+    handler = Handler(delay=0.05)
+
+    responses = await asyncio.gather(
+        *(
+            requests.run("key", "POST /users", {"a": 1}, handler, claims=CALLER)
+            for _ in range(5)
+        )
+    )
+
+    assert handler.calls == 1
+    assert {response.body for response in responses} == {b'{"call":1}'}
+    replayed = [IDEMPOTENT_REPLAYED_HEADER in r.headers for r in responses]
+    assert replayed.count(False) == 1
+
+
+async def test_duplicates_wait_for_another_worker(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+    workers = [
+        IdempotentRequests(SQLiteIdempotencyStore(path), poll_interval=0.01)
+        for _ in range(2)
+    ]
+    handler = Handler(delay=0.1)
+
+    first, second = await asyncio.gather(
+        workers[0].run("key", "POST /users", {"a": 1}, handler, claims=CALLER),
+        workers[1].run("key", "POST /users", {"a": 1}, handler, claims=CALLER),
+    )
+
+    assert handler.calls == 1
+    assert first.body == second.body
+    for worker in workers:
+        worker.store.close()
+
+
+async def test_wait_timeout():
+    store = InMemoryIdempotencyStore(maxsize=10)
+    # two workers sharing the store
+    first = IdempotentRequests(store)
+    second = IdempotentRequests(store, wait_timeout=0.05, poll_interval=0.01)
+    slow = asyncio.ensure_future(
+        first.run("key", "POST /users", {"a": 1}, Handler(delay=0.2), claims=CALLER)
+    )
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as error:
+        await second.run("key", "POST /users", {"a": 1}, Handler(), claims=CALLER)
+
+    assert error.value.status_code == 409
+    assert (await slow).status_code == 201
+
+
+async def test_wait_for_a_vanishing_key():
+    class VanishingStore(InMemoryIdempotencyStore):
+        # the key is held by another worker but expires before each lookup
+        async def acquire(self, key, fingerprint, ttl):
+            return False
+
+    requests = IdempotentRequests(
+        VanishingStore(maxsize=10), wait_timeout=0.05, poll_interval=0.01
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await requests.run("key", "POST /users", {}, Handler(), claims=CALLER)
+
+    assert error.value.status_code == 409
+
+
+async def test_secrets_are_redacted_and_restored(store):
+    requests = IdempotentRequests(store)
+
+    def redact(response):
+        return StoredResponse(response.status_code, b'{"call":"redacted"}')
+
+    async def restore(response):
+        assert response.body == b'{"call":"redacted"}'
+        return StoredResponse(response.status_code, b'{"call":"restored"}')
+
+    first = await requests.run(
+        "key", "POST /users", {}, Handler(), claims=CALLER, redact=redact
+    )
+    replayed = await requests.run(
+        "key", "POST /users", {}, Handler(), claims=CALLER, restore=restore
+    )
+
+    assert first.body == b'{"call":1}'
+    assert (
+        await store.get(f"POST /users:{caller_identity(CALLER)}:key")
+    ).response.body == (b'{"call":"redacted"}')
+    assert replayed.body == b'{"call":"restored"}'
+
+
+async def test_key_reused_with_another_payload(store):
+    requests = IdempotentRequests(store)
+    await requests.run("key", "POST /users", {"a": 1}, Handler(), claims=CALLER)
+
+    with pytest.raises(HTTPException) as error:
+        await requests.run("key", "POST /users", {"a": 2}, Handler(), claims=CALLER)
+
+    assert error.value.status_code == 422
+
+
+async def test_failures_are_not_stored(store):
+    requests = IdempotentRequests(store)
+    failing = Handler(error=RuntimeError("Oh no!"))
+    with pytest.raises(RuntimeError):
+        await requests.run("key", "POST /users", {"a": 1}, failing, claims=CALLER)
+    conflict = Handler(status_code=409)
+    await requests.run("key", "POST /users", {"a": 1}, conflict, claims=CALLER)
+
+    handler = Handler()
+    response = await requests.run(
+        "key", "POST /users", {"a": 1}, handler, claims=CALLER
+    )
+
+    assert (failing.calls, conflict.calls, handler.calls) == (1, 1, 1)
+    assert response.status_code == 201
+
+
+@pytest.mark.parametrize("key", ["", "a" * 256, "key with spaces", "clé"])
+async def test_invalid_key(key):
+    requests = IdempotentRequests(InMemoryIdempotencyStore(maxsize=10))
+
+    with pytest.raises(HTTPException) as error:
+        await requests.run(key, "POST /users", {}, Handler(), claims=CALLER)
+
+    assert error.value.status_code == 400
+
+
+async def test_without_key_or_disabled():
+    handler = Handler()
+    await IdempotentRequests(InMemoryIdempotencyStore(10)).run(
+        None, "POST /users", {}, handler, claims=CALLER
+    )
+    disabled = IdempotentRequests(InMemoryIdempotencyStore(10), ttl=0)
+    await disabled.run("key", "POST /users", {}, handler, claims=CALLER)
+    await disabled.run("key", "POST /users", {}, handler, claims=CALLER)
+    assert handler.calls == 3
+
+
+async def test_create_user_retried_with_idempotency_key(
+    async_client: AsyncClient, fake_optscale
+):
+    fake_optscale.set_latency(USERS, Latency(0.05))
+    payload = {
+        "email": "peter.parker@iamspiderman.com",
+        "display_name": "Spider Man",
+        "password": "With great power",
+    }
+    headers = {
+        "Authorization": f"Bearer {create_jwt_token()}",
+        "Idempotency-Key": "5d4b7a5e-1f0a-4b8e-9f6e-0c4a5e0e7b1d",
+    }
+
+    responses = await asyncio.gather(
+        *(async_client.post("/users", json=payload, headers=headers) for _ in range(3))
+    )
+    retried = await async_client.post("/users", json=payload, headers=headers)
+
+    assert fake_optscale.calls[USERS] == 1
+    assert len(fake_optscale.users) == 1
+    for response in [*responses, retried]:
+        assert response.status_code == 201
+        assert response.json() == responses[0].json()
+    assert retried.headers[IDEMPOTENT_REPLAYED_HEADER] == "true"
+
+
+async def test_created_user_token_is_not_stored(
+    async_client: AsyncClient, fake_optscale, tmp_path, monkeypatch
+):
+    store = SQLiteIdempotencyStore(str(tmp_path / "idempotency.sqlite3"))
+    monkeypatch.setattr(idempotent_requests, "store", store)
+    payload = {
+        "email": "peter.parker@iamspiderman.com",
+        "display_name": "Spider Man",
+        "password": "With great power",
+    }
+    headers = {
+        "Authorization": f"Bearer {create_jwt_token()}",
+        "Idempotency-Key": "create-peter",
+    }
+    try:
+        created = await async_client.post("/users", json=payload, headers=headers)
+        # as if the replay was answered by another worker
+        user_access_tokens.clear()
+        replayed = await async_client.post("/users", json=payload, headers=headers)
+        row = await store.db.execute("SELECT body FROM idempotency_keys", fetch=True)
+    finally:
+        store.close()
+
+    user, token = created.json(), created.json()["token"]
+    assert token.encode() not in row[0]
+    assert "token" not in json.loads(row[0])
+    assert replayed.headers[IDEMPOTENT_REPLAYED_HEADER] == "true"
+    assert replayed.json()["id"] == user["id"]
+    # a fresh token, valid for the user
+    assert replayed.json()["token"] != token
+    assert fake_optscale.tokens[replayed.json()["token"]] == user["id"]
+
+
+async def test_callers_sharing_an_idempotency_key(
+    async_client: AsyncClient, fake_optscale
+):
+    async def create_user(subject, email):
+        return await async_client.post(
+            "/users",
+            json={"email": email, "display_name": "Spider", "password": "password"},
+            headers={
+                "Authorization": f"Bearer {create_jwt_token(subject)}",
+                "Idempotency-Key": "create-user-1",
+            },
+        )
+
+    first = await create_user("integration-a", "peter.parker@iamspiderman.com")
+    second = await create_user("integration-b", "miles.morales@iamspiderman.com")
+
+    assert first.status_code == second.status_code == 201
+    assert IDEMPOTENT_REPLAYED_HEADER not in second.headers
+    assert second.json()["email"] == "miles.morales@iamspiderman.com"
+    assert second.json()["token"] != first.json()["token"]
+    assert len(fake_optscale.users) == 2
+
+
+async def test_create_org_failure_is_retried(async_client: AsyncClient, fake_optscale):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    payload = {"org_name": "Daily Bugle", "user_id": user["id"], "currency": "USD"}
+    headers = {
+        "Authorization": f"Bearer {create_jwt_token()}",
+        "Idempotency-Key": "daily-bugle",
+    }
+    fake_optscale.set_fault(ORGANIZATIONS, Fault(rate=1.0, status_code=500))
+
+    failed = await async_client.post("/organizations", json=payload, headers=headers)
+    fake_optscale.set_fault(ORGANIZATIONS, Fault())
+    created = await async_client.post("/organizations", json=payload, headers=headers)
+    replayed = await async_client.post("/organizations", json=payload, headers=headers)
+    reused = await async_client.post(
+        "/organizations", json={**payload, "currency": "EUR"}, headers=headers
+    )
+
+    assert failed.status_code == 500
+    assert created.status_code == replayed.status_code == 201
+    assert replayed.json() == created.json()
+    assert replayed.headers[IDEMPOTENT_REPLAYED_HEADER] == "true"
+    assert reused.status_code == 422
+    assert reused.json()["detail"]["title"] == "Idempotency-Key already used"
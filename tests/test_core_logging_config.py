@@ -0,0 +1,108 @@
+import json
+import logging
+from logging.handlers import QueueHandler
+
+import pytest
+
+from app import settings
+from app.core.logging_config import (
+    PAYLOADS_LOGGING,
+    LogPayload,
+    configure_logging,
+    stop_logging,
+)
+from app.core.request_id import request_id_context
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    configure_logging(
+        level=settings.log_level,
+        use_queue=settings.log_queue_enabled,
+        log_payloads=settings.log_payloads,
+        payload_max_length=settings.log_payload_max_length,
+    )
+
+
+def test_configure_logging_with_queue(restore_logging, capsys):
+    configure_logging(level="info", use_queue=True)
+    root_logger = logging.getLogger()
+    assert root_logger.level == logging.INFO
+    assert [type(handler) for handler in root_logger.handlers] == [QueueHandler]
+
+    logging.getLogger("test").info("Hello %s", "world")
+    logging.getLogger("test").debug("Not logged")
+    stop_logging()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["message"] == "Hello world"
+    assert record["levelname"] == "INFO"
+
+
+def test_configure_logging_without_queue(restore_logging):
+    configure_logging(level="WARNING", use_queue=False)
+    root_logger = logging.getLogger()
+    assert root_logger.level == logging.WARNING
+    assert [type(handler) for handler in root_logger.handlers] == [
+        logging.StreamHandler
+    ]
+
+
+@pytest.mark.parametrize("use_queue", [True, False])
+def test_log_records_have_request_id(restore_logging, capsys, use_queue):
+    configure_logging(level="INFO", use_queue=use_queue)
+
+    with request_id_context("request-1"):
+        logging.getLogger("test").info("In a request")
+    logging.getLogger("test").info("Out of a request")
+    stop_logging()
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["request_id"] for record in records] == ["request-1", None]
+
+
+def test_log_payload_omitted(monkeypatch):
+    monkeypatch.setitem(PAYLOADS_LOGGING, "enabled", False)
+    assert str(LogPayload({"token": "secret"})) == "<omitted>"
+
+
+def test_log_payload_truncated(monkeypatch):
+    monkeypatch.setitem(PAYLOADS_LOGGING, "enabled", True)
+    monkeypatch.setitem(PAYLOADS_LOGGING, "max_length", 10)
+    assert str(LogPayload("a" * 10)) == "a" * 10
+    assert str(LogPayload("a" * 20)) == "aaaaaaaaaa..."
+    assert str(LogPayload({"a": 1})) == "{'a': 1}"
+    assert str(LogPayload({"content": b"a" * 20})) == "{'content'..."
+
+    monkeypatch.setitem(PAYLOADS_LOGGING, "max_length", 0)
+    assert str(LogPayload("a" * 20)) == "a" * 20
+
+
+def test_log_payload_is_bounded(monkeypatch):
+    class Item:
+        def __repr__(self):
+            raise AssertionError("The payload should not be rendered in full")
+
+    monkeypatch.setitem(PAYLOADS_LOGGING, "enabled", True)
+    monkeypatch.setitem(PAYLOADS_LOGGING, "max_length", 40)
+    payload = {
+        "data": {"items": [*range(100), Item()]},
+        "content": b"a" * 10_000,
+        "id": "b" * 10_000,
+    }
+    text = str(LogPayload(payload))
+    assert text == "{'content': b'" + "a" * 26 + "..."
+
+
+def test_log_payload_is_lazy(monkeypatch, caplog):
+    class Payload:
+        def __str__(self):
+            raise AssertionError("The payload should not be rendered")
+
+    monkeypatch.setitem(PAYLOADS_LOGGING, "enabled", True)
+    with caplog.at_level(logging.INFO):
+        logging.getLogger("test").debug("Payload: %s", LogPayload(Payload()))
+    assert caplog.records == []
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+
+import pytest
+
+from app.core import metrics as metrics_module
+from app.core.cache import TTLCache
+from app.core.metrics import (
+    MetricsRegistry,
+    MultiProcessCollector,
+    endpoint_label,
+    merge_snapshots,
+    register_cache,
+    registry,
+    render_metrics,
+    render_text,
+)
+
+
+@pytest.mark.parametrize(
+    ("endpoint", "expected"),
+    [
+        ("/auth/v2/tokens", "/auth/v2/tokens"),
+        (
+            "/auth/v2/users/f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+            "/auth/v2/users/:id",
+        ),
+        ("/restapi/v2/organizations?user_id=1234", "/restapi/v2/organizations"),
+        ("/restapi/v2/pools/42/expenses", "/restapi/v2/pools/:id/expenses"),
+    ],
+)
+def test_endpoint_label(endpoint, expected):
+    assert endpoint_label(endpoint) == expected
+
+
+def test_render_counter_and_gauge():
+    metrics = MetricsRegistry()
+    counter = metrics.counter("jobs_total", "Jobs done.", ("queue",))
+    gauge = metrics.gauge("jobs_running", "Jobs running.")
+    counter.inc(("fast",))
+    counter.inc(("fast",), 2)
+    counter.inc(('say "hi"\n',))
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    text = render_text(metrics.collect())
+
+    assert "# TYPE jobs_total counter\n" in text
+    assert 'jobs_total{queue="fast"} 3\n' in text
+    assert 'jobs_total{queue="say \\"hi\\"\\n"} 1\n' in text
+    assert "# TYPE jobs_running gauge\njobs_running 1\n" in text
+
+
+def test_render_histogram():
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram(
+        "duration_seconds", "Durations.", ("route",), buckets=(0.1, 1)
+    )
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(("/users",), value)
+
+    text = render_text(metrics.collect())
+
+    assert 'duration_seconds_bucket{route="/users",le="0.1"} 2\n' in text
+    assert 'duration_seconds_bucket{route="/users",le="1"} 3\n' in text
+    assert 'duration_seconds_bucket{route="/users",le="+Inf"} 4\n' in text
+    assert 'duration_seconds_sum{route="/users"} 3.65\n' in text
+    assert 'duration_seconds_count{route="/users"} 4\n' in text
+
+
+def test_collectors_are_run_and_errors_are_ignored():
+    metrics = MetricsRegistry()
+    gauge = metrics.gauge("value", "A value.")
+
+    def failing():
+        raise RuntimeError("boom")
+
+    metrics.add_collector(failing)
+    metrics.add_collector(lambda: gauge.set((), 7))
+
+    assert metrics.collect()["value"]["samples"] == [[[], 7]]
+
+
+def test_register_cache():
+    cache = TTLCache(maxsize=10, ttl=60)
+    register_cache("test_cache", cache)
+    cache.set("key", "value")
+    cache.get("key")
+    cache.get("missing")
+
+    text = render_text(registry.collect())
+
+    assert 'cache_lookups_total{cache="test_cache",result="hit"} 1\n' in text
+    assert 'cache_lookups_total{cache="test_cache",result="miss"} 1\n' in text
+
+
+def test_merge_snapshots():
+    def snapshot(requests, in_flight, durations):
+        metrics = MetricsRegistry()
+        metrics.counter("requests_total", "Requests.").inc((), requests)
+        metrics.gauge("in_flight", "In flight.").set((), in_flight)
+        histogram = metrics.histogram("duration", "Durations.", buckets=(1,))
+        for duration in durations:
+            histogram.observe((), duration)
+        return metrics.collect()
+
+    merged = merge_snapshots(
+        [
+            (snapshot(3, 2, [0.5]), True),
+            (snapshot(4, 1, [2]), True),
+            # the counters of an exited worker are kept, its gauges are not
+            (snapshot(5, 9, [0.5, 0.5]), False),
+        ]
+    )
+
+    assert merged["requests_total"]["samples"] == [[[], 12]]
+    assert merged["in_flight"]["samples"] == [[[], 3]]
+    assert merged["duration"]["samples"] == [
+        [[], {"buckets": [3, 1], "sum": 3.5, "count": 4}]
+    ]
+
+
+def test_multiprocess_collector(tmp_path):
+    metrics = MetricsRegistry()
+    metrics.counter("requests_total", "Requests.").inc((), 2)
+    other_worker = MetricsRegistry()
+    other_worker.counter("requests_total", "Requests.").inc((), 3)
+    (tmp_path / "metrics_999999999.json").write_text(json.dumps(other_worker.collect()))
+    (tmp_path / "metrics_garbage.json").write_text("{")
+
+    collector = MultiProcessCollector(metrics, str(tmp_path), interval=5)
+    merged = collector.collect()
+
+    assert (tmp_path / f"metrics_{os.getpid()}.json").exists()
+    assert merged["requests_total"]["samples"] == [[[], 5]]
+
+
+async def test_multiprocess_collector_writes_on_stop(tmp_path):
+    metrics = MetricsRegistry()
+    collector = MultiProcessCollector(metrics, str(tmp_path / "metrics"), interval=60)
+    collector.start()
+    metrics.counter("requests_total", "Requests.").inc()
+    await collector.stop()
+
+    path = tmp_path / "metrics" / f"metrics_{os.getpid()}.json"
+    assert json.loads(path.read_text())["requests_total"]["samples"] == [[[], 1]]
+
+
+async def test_multiprocess_file_io_runs_in_threads(tmp_path, monkeypatch):
+    collector = MultiProcessCollector(registry, str(tmp_path), interval=60)
+    monkeypatch.setattr(metrics_module, "multiprocess_collector", collector)
+    writers = []
+    write = collector.write
+
+    def record_write(snapshot=None):
+        writers.append(threading.current_thread())
+        write(snapshot)
+
+    monkeypatch.setattr(collector, "write", record_write)
+
+    assert "# TYPE cache_lookups_total counter" in await render_metrics()
+    await collector.stop()
+
+    assert len(writers) == 2
+    assert threading.main_thread() not in writers
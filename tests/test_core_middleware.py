@@ -0,0 +1,120 @@
+import asyncio
+import logging
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.core.admission import AdmissionController, admission_controller
+from app.core.middleware import AdmissionControlMiddleware, LogRequestMiddleware
+
+
+async def ok(request):
+    return PlainTextResponse("ok", status_code=201)
+
+
+async def stream(request):
+    async def chunks():
+        for chunk in ("a", "b", "c"):
+            yield chunk
+
+    return StreamingResponse(chunks())
+
+
+async def fail(request):
+    raise RuntimeError("Oh no!")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(
+        routes=[Route("/ok", ok), Route("/stream", stream), Route("/fail", fail)]
+    )
+    app.add_middleware(LogRequestMiddleware)
+    transport = ASGITransport(app=app, raise_app_exceptions=False)
+    return AsyncClient(transport=transport, base_url="http://testserver")
+
+
+async def test_log_request_middleware(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.core.middleware"):
+        response = await client.get("/ok?query=1")
+
+    assert response.status_code == 201
+    assert response.text == "ok"
+    assert caplog.messages[0] == "Request: GET http://testserver/ok?query=1"
+    assert caplog.messages[1].startswith("Response: status_code=201, process_time=")
+
+
+async def test_log_request_middleware_streaming(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.core.middleware"):
+        response = await client.get("/stream")
+
+    assert response.text == "abc"
+    assert caplog.messages[1].startswith("Response: status_code=200")
+
+
+async def test_log_request_middleware_unhandled_error(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.core.middleware"):
+        response = await client.get("/fail")
+
+    assert response.status_code == 500
+    assert caplog.messages[1].startswith("Response: status_code=500")
+
+
+async def test_admission_control_middleware():
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return PlainTextResponse("done")
+
+    controller = AdmissionController(max_in_flight=1, max_queue=1, retry_after=0.5)
+    app = Starlette(routes=[Route("/slow", slow), Route("/ok", ok)])
+    app.add_middleware(
+        AdmissionControlMiddleware, controller=controller, exempt_paths=("/ok",)
+    )
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        first = asyncio.ensure_future(client.get("/slow"))
+        queued = asyncio.ensure_future(client.get("/slow"))
+        while controller.queued == 0:
+            await asyncio.sleep(0.001)
+
+        rejected = await client.get("/slow")
+        exempt = await client.get("/ok")
+        release.set()
+        responses = await asyncio.gather(first, queued)
+
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    detail = rejected.json()["detail"]
+    assert detail["title"] == "Service overloaded"
+    assert detail["errors"] == {
+        "reason": "Too many requests are waiting to be processed"
+    }
+    assert exempt.status_code == 201
+    assert [response.text for response in responses] == ["done", "done"]
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["rejected"] == 1
+
+
+async def test_admission_rejections_have_cors_headers(
+    async_client: AsyncClient, monkeypatch
+):
+    # a saturated worker, without queue
+    monkeypatch.setattr(admission_controller, "max_in_flight", 1)
+    monkeypatch.setattr(admission_controller, "max_queue", 0)
+    monkeypatch.setattr(admission_controller, "in_flight", 1)
+
+    response = await async_client.get(
+        "/organizations",
+        params={"user_id": "1234"},
+        headers={"Origin": "https://portal.example.com"},
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    assert "Retry-After" in response.headers["Access-Control-Expose-Headers"]
+    assert "Retry-After" in response.headers
@@ -0,0 +1,282 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.auth_jwt_bearer import JWTClaims
+from app.core.deadline import deadline
+from app.core.rate_limit import (
+    InMemoryRateLimitBackend,
+    OutboundRateLimiter,
+    RateLimit,
+    RateLimiter,
+    RateLimitResult,
+    SQLiteRateLimitBackend,
+    UpstreamRateLimitError,
+    create_rate_limiter,
+    rate_limiter,
+)
+from tests.helpers.jwt import create_jwt_token
+
+
+def claims(sub="caller", iss="issuer", **extra) -> JWTClaims:
+    return JWTClaims.from_payload(
+        {"sub": sub, "iss": iss, "aud": "aud", "exp": 0, "nbf": 0, **extra}
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryRateLimitBackend(maxsize=10)
+    else:
+        backend = SQLiteRateLimitBackend(str(tmp_path / "rate_limits.sqlite3"))
+        yield backend
+        backend.close()
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("100/minute", RateLimit(100, 60)),
+        ("10/s", RateLimit(10, 1)),
+        (" 500 / 15m ", RateLimit(500, 900)),
+        ("1000/day", RateLimit(1000, 86400)),
+    ],
+)
+def test_parse_rate_limit(value, expected):
+    assert RateLimit.parse(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "100", "0/minute", "10/0s", "10/week"])
+def test_parse_invalid_rate_limit(value):
+    with pytest.raises(ValueError, match="Invalid rate limit"):
+        RateLimit.parse(value)
+
+
+def test_token_bucket():
+    limit = RateLimit(limit=10, window=10)
+
+    assert limit.take(tokens=3, updated_at=0, now=0) == (True, 2)
+    assert limit.take(tokens=0.5, updated_at=0, now=0) == (False, 0.5)
+    # refilled by one token per second, up to the limit
+    assert limit.take(tokens=0.5, updated_at=0, now=2) == (True, 1.5)
+    assert limit.take(tokens=0, updated_at=0, now=60) == (True, 9)
+
+
+def test_bucket_expiry():
+    limit = RateLimit(limit=10, window=10)
+
+    assert limit.expiry(tokens=9) == 10
+    # a bucket in debt is kept until it's refilled
+    assert limit.expiry(tokens=-20) == 30
+
+
+def test_rate_limit_headers():
+    limit = RateLimit(limit=10, window=60)
+    assert RateLimitResult(True, limit, tokens=6.5).headers() == {
+        "RateLimit-Limit": "10",
+        "RateLimit-Remaining": "6",
+        "RateLimit-Reset": "21",
+        "RateLimit-Policy": "10;w=60",
+    }
+    rejected = RateLimitResult(False, limit, tokens=0.5).headers()
+    assert rejected["RateLimit-Remaining"] == "0"
+    assert rejected["Retry-After"] == "3"
+
+
+async def test_backend(backend):
+    limit = RateLimit(limit=2, window=60)
+
+    outcomes = [await backend.take("key", limit) for _ in range(3)]
+    other = await backend.take("other key", limit)
+
+    assert [outcome.allowed for outcome in outcomes] == [True, True, False]
+    assert outcomes[1].remaining == 0
+    assert other.allowed
+
+
+async def test_backend_drain(backend):
+    limit = RateLimit(limit=10, window=1)
+
+    await backend.drain("key", limit, seconds=0.2)
+    result = await backend.take("key", limit)
+
+    assert not result.allowed
+    assert result.wait_time == pytest.approx(0.2, abs=0.05)
+
+
+async def test_drained_bucket_outlives_the_window(backend):
+    limit = RateLimit(limit=10, window=0.1)
+
+    await backend.drain("key", limit, seconds=0.3)
+    assert not (await backend.take("key", limit)).allowed
+    await asyncio.sleep(0.15)
+    result = await backend.take("key", limit)
+
+    # the debt is not forgiven when the window has elapsed
+    assert not result.allowed
+    assert result.wait_time == pytest.approx(0.15, abs=0.05)
+
+
+async def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    first, second = SQLiteRateLimitBackend(path), SQLiteRateLimitBackend(path)
+    limit = RateLimit(limit=1, window=60)
+    try:
+        assert (await first.take("key", limit)).allowed
+        assert not (await second.take("key", limit)).allowed
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.parametrize(
+    ("key_claim", "other_caller", "shared"),
+    [
+        ("sub", claims(sub="another caller"), False),
+        ("iss", claims(sub="another caller"), True),
+        ("tenant", claims(tenant="acme"), False),
+    ],
+)
+async def test_callers_are_keyed_by_claim(key_claim, other_caller, shared):
+    limiter = RateLimiter(
+        InMemoryRateLimitBackend(maxsize=10),
+        key_claim=key_claim,
+        default=RateLimit(limit=1, window=60),
+    )
+
+    assert (await limiter.hit(claims(), "GET /users")).allowed
+    assert (await limiter.hit(other_caller, "GET /users")).allowed is not shared
+
+
+async def test_limits_by_route():
+    limiter = RateLimiter(
+        InMemoryRateLimitBackend(maxsize=10),
+        routes={"GET /organizations": RateLimit(limit=1, window=60)},
+    )
+
+    assert (await limiter.hit(claims(), "GET /organizations")).allowed
+    assert not (await limiter.hit(claims(), "GET /organizations")).allowed
+    assert await limiter.hit(claims(), "POST /users") is None
+
+
+def test_create_rate_limiter(tmp_path):
+    limiter = create_rate_limiter(
+        key_claim="iss",
+        default="600/minute",
+        routes={"GET /organizations": "60/minute"},
+        store="sqlite",
+        sqlite_path=str(tmp_path / "rate_limits.sqlite3"),
+        maxsize=10,
+    )
+    assert isinstance(limiter.backend, SQLiteRateLimitBackend)
+    assert limiter.limit_for("POST /users") == RateLimit(600, 60)
+    assert limiter.limit_for("GET /organizations") == RateLimit(60, 60)
+    assert not create_rate_limiter("sub", None, {}, "memory", "", 10).enabled
+    with pytest.raises(ValueError, match="Unknown rate limit store"):
+        create_rate_limiter("sub", None, {}, "redis", "", 10)
+
+
+@pytest.fixture
+def limited_organizations(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "backend", InMemoryRateLimitBackend(10))
+    monkeypatch.setattr(
+        rate_limiter,
+        "routes",
+        {"GET /v1/admin/organizations": RateLimit(limit=2, window=60)},
+    )
+
+
+async def test_rate_limited_endpoint(
+    async_client: AsyncClient, fake_optscale, limited_organizations
+):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+
+    async def get_orgs(subject):
+        return await async_client.get(
+            "/organizations",
+            params={"user_id": user["id"]},
+            headers={"Authorization": f"Bearer {create_jwt_token(subject)}"},
+        )
+
+    responses = [await get_orgs("noisy") for _ in range(3)]
+    other_caller = await get_orgs("quiet")
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[0].headers["RateLimit-Limit"] == "2"
+    assert responses[0].headers["RateLimit-Remaining"] == "1"
+    assert responses[0].headers["RateLimit-Policy"] == "2;w=60"
+    rejected = responses[2]
+    assert rejected.headers["RateLimit-Remaining"] == "0"
+    assert rejected.headers["Retry-After"] == "30"
+    assert rejected.json()["detail"]["title"] == "Too many requests"
+    assert other_caller.status_code == 200
+    assert other_caller.headers["RateLimit-Remaining"] == "1"
+
+
+async def test_routes_without_limit_have_no_headers(
+    async_client: AsyncClient, fake_optscale, limited_organizations
+):
+    response = await async_client.post(
+        "/users",
+        json={
+            "email": "peter.parker@iamspiderman.com",
+            "display_name": "Spider Man",
+            "password": "With great power",
+        },
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+
+    assert response.status_code == 201
+    assert "RateLimit-Limit" not in response.headers
+
+
+def test_outbound_groups():
+    limiter = OutboundRateLimiter(
+        "http://optscale",
+        InMemoryRateLimitBackend(10),
+        limits={"": RateLimit(100, 1), "/auth": RateLimit(10, 1)},
+    )
+
+    assert limiter.group_for("/auth/v2/tokens") == ("/auth", RateLimit(10, 1))
+    assert limiter.group_for("/restapi/v2/pools") == ("", RateLimit(100, 1))
+    assert not OutboundRateLimiter(
+        "http://optscale", InMemoryRateLimitBackend(10)
+    ).enabled
+
+
+async def test_outbound_limiter_shared_by_workers(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    workers = [
+        OutboundRateLimiter(
+            "http://optscale",
+            SQLiteRateLimitBackend(path),
+            limits={"": RateLimit(limit=1, window=60)},
+            max_wait=0.1,
+        )
+        for _ in range(2)
+    ]
+    try:
+        await workers[0].acquire("/restapi/v2/pools")
+        with pytest.raises(UpstreamRateLimitError):
+            await workers[1].acquire("/restapi/v2/pools")
+    finally:
+        for worker in workers:
+            worker.backend.close()
+
+
+async def test_outbound_wait_is_limited_by_the_deadline():
+    limiter = OutboundRateLimiter(
+        "http://optscale",
+        InMemoryRateLimitBackend(10),
+        limits={"": RateLimit(limit=1, window=0.5)},
+        max_wait=5,
+    )
+    await limiter.acquire("/endpoint")
+
+    with deadline(0.1), pytest.raises(UpstreamRateLimitError) as error:
+        await limiter.acquire("/endpoint")
+
+    assert error.value.retry_after == pytest.approx(0.5, abs=0.05)
+    assert limiter.stats() == {"delayed": 0, "rejected": 1, "throttled": 0}
@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.request_id import (
+    RequestIDLogFilter,
+    get_request_id,
+    parse_request_id,
+    request_id_context,
+)
+from tests.helpers.fake_optscale import ORGANIZATIONS, Fault
+from tests.helpers.jwt import create_jwt_token
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (
+            "f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+            "f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+        ),
+        ("req_1.2:3", "req_1.2:3"),
+        (None, None),
+        ("", None),
+        ("a" * 129, None),
+        ("injected\nline", None),
+        ("with space", None),
+    ],
+)
+def test_parse_request_id(value, expected):
+    assert parse_request_id(value) == expected
+
+
+def test_request_id_context():
+    assert get_request_id() is None
+    with request_id_context("request-1"):
+        assert get_request_id() == "request-1"
+        with request_id_context("request-2"):
+            assert get_request_id() == "request-2"
+        assert get_request_id() == "request-1"
+    assert get_request_id() is None
+
+
+def test_log_filter():
+    log_filter = RequestIDLogFilter()
+
+    def make_record():
+        return logging.LogRecord("test", logging.INFO, __file__, 1, "Hello", (), None)
+
+    record = make_record()
+    assert log_filter.filter(record)
+    assert record.request_id is None
+
+    with request_id_context("request-1"):
+        record = make_record()
+        log_filter.filter(record)
+    assert record.request_id == "request-1"
+    # filtered again out of the request's context
+    log_filter.filter(record)
+    assert record.request_id == "request-1"
+
+
+async def test_inbound_request_id(async_client: AsyncClient):
+    response = await async_client.get("/health", headers={"X-Request-ID": "request-1"})
+    assert response.headers["X-Request-ID"] == "request-1"
+
+
+async def test_generated_request_id_is_the_trace_id(async_client: AsyncClient):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = await async_client.get(
+        "/health",
+        headers={
+            "X-Request-ID": "not acceptable",
+            "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01",
+        },
+    )
+    assert response.headers["X-Request-ID"] == trace_id
+
+
+async def test_error_response_request_id(async_client: AsyncClient, fake_optscale):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    fake_optscale.set_fault(ORGANIZATIONS, Fault(rate=1.0, status_code=500))
+
+    response = await async_client.post(
+        "/organizations",
+        json={"org_name": "Daily Bugle", "user_id": user["id"], "currency": "USD"},
+        headers={
+            "Authorization": f"Bearer {create_jwt_token()}",
+            "X-Request-ID": "request-1",
+        },
+    )
+
+    assert response.status_code == 500
+    assert response.headers["X-Request-ID"] == "request-1"
+    assert response.json()["detail"]["requestId"] == "request-1"
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from app.core.responses import (
+    FastJSONResponse,
+    RawJSONResponse,
+    build_json_response,
+    json_dumps,
+    json_loads,
+)
+
+
+def test_json_dumps_and_loads():
+    content = {"name": "Café", "organizations": [{"id": 1}]}
+    dumped = json_dumps(content)
+    assert isinstance(dumped, bytes)
+    assert json.loads(dumped) == content
+    assert json_loads(dumped) == content
+    with pytest.raises(ValueError):
+        json_loads(b"not json")
+
+
+def test_build_json_response_forwards_raw_content():
+    response = build_json_response(
+        {"status_code": 201, "content": b'{"id": "1234"}'}, 200
+    )
+    assert isinstance(response, RawJSONResponse)
+    assert response.status_code == 201
+    assert response.body == b'{"id": "1234"}'
+    assert response.headers["Content-Type"] == "application/json"
+
+
+def test_build_json_response_serializes_data():
+    response = build_json_response({"data": {"organizations": []}}, 200)
+    assert isinstance(response, FastJSONResponse)
+    assert response.status_code == 200
+    assert json.loads(response.body) == {"organizations": []}
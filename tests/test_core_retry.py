@@ -0,0 +1,49 @@
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import pytest
+
+from app.core.retry import RetryPolicy, parse_retry_after
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_parse_retry_after_http_date():
+    date = format_datetime(datetime.now(UTC) + timedelta(seconds=30), usegmt=True)
+    assert 28 <= parse_retry_after(date) <= 30
+
+
+def test_retry_policy_attempts_for():
+    policy = RetryPolicy(max_attempts=4)
+    assert policy.attempts_for("GET") == 4
+    assert policy.attempts_for("delete") == 4
+    assert policy.attempts_for("POST") == 1
+    assert policy.attempts_for("POST", headers={"idempotency-key": "key"}) == 4
+    assert RetryPolicy(max_attempts=0).attempts_for("GET") == 1
+
+
+@pytest.mark.parametrize(
+    ("attempt", "expected"), [(1, 0.2), (2, 0.4), (3, 0.8), (10, 5.0)]
+)
+def test_retry_policy_exponential_backoff(attempt, expected):
+    policy = RetryPolicy(backoff_base=0.2, backoff_max=5.0, jitter=False)
+    assert policy.backoff_delay(attempt) == pytest.approx(expected)
+
+
+def test_retry_policy_backoff_jitter():
+    policy = RetryPolicy(backoff_base=0.2, backoff_max=5.0)
+    delays = {policy.backoff_delay(3) for _ in range(20)}
+    assert all(0 <= delay <= 0.8 for delay in delays)
+    assert len(delays) > 1
+
+
+def test_retry_policy_honours_retry_after():
+    policy = RetryPolicy(backoff_max=5.0)
+    assert policy.backoff_delay(1, retry_after="3") == 3.0
+    # the upstream asks to wait for too long, don't retry
+    assert policy.backoff_delay(1, retry_after="60") is None
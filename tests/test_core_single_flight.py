@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+async def test_single_flight_collapses_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def func():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(single_flight.do("key", func) for _ in range(10)))
+    assert results == ["result"] * 10
+    assert calls == 1
+    assert single_flight.stats() == {"calls": 1, "collapsed": 9}
+    assert single_flight.in_flight() == 0
+
+
+async def test_single_flight_different_keys():
+    single_flight = SingleFlight()
+
+    async def func(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(
+        single_flight.do("a", lambda: func("a")),
+        single_flight.do("b", lambda: func("b")),
+    )
+    assert results == ["a", "b"]
+    assert single_flight.stats() == {"calls": 2, "collapsed": 0}
+
+
+async def test_single_flight_propagates_exceptions():
+    single_flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.01)
+        raise ValueError("Oh no!")
+
+    results = await asyncio.gather(
+        single_flight.do("key", func),
+        single_flight.do("key", func),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    # the failed call is not kept around
+    with pytest.raises(ValueError, match="Oh no!"):
+        await single_flight.do("key", func)
+    assert single_flight.calls == 2
+
+
+async def test_single_flight_survives_cancelled_caller():
+    single_flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    first = asyncio.ensure_future(single_flight.do("key", func))
+    second = asyncio.ensure_future(single_flight.do("key", func))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "result"
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+from fastapi import Request
+
+from app.core.streaming import accepts_ndjson, stream_json_array, stream_ndjson
+
+
+async def records(items):
+    for item in items:
+        yield item
+
+
+async def test_stream_json_array():
+    chunks = [chunk async for chunk in stream_json_array(records([{"a": 1}, 2]))]
+    assert len(chunks) == 3
+    assert json.loads(b"".join(chunks)) == [{"a": 1}, 2]
+
+
+async def test_stream_empty_json_array():
+    chunks = [chunk async for chunk in stream_json_array(records([]))]
+    assert json.loads(b"".join(chunks)) == []
+
+
+async def test_stream_ndjson():
+    chunks = [chunk async for chunk in stream_ndjson(records([{"a": 1}, {"b": 2}]))]
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    assert [json.loads(chunk) for chunk in chunks] == [{"a": 1}, {"b": 2}]
+    # plain iterables are accepted too
+    chunks = [chunk async for chunk in stream_ndjson([{"a": 1}])]
+    assert [json.loads(chunk) for chunk in chunks] == [{"a": 1}]
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        ("application/x-ndjson", True),
+        ("application/json, application/x-ndjson;q=0.9", True),
+        ("Application/X-NDJSON", True),
+        ("application/json", False),
+        ("", False),
+    ],
+)
+def test_accepts_ndjson(accept, expected):
+    request = Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+    assert accepts_ndjson(request) is expected
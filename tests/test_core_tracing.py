@@ -0,0 +1,206 @@
+import io
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.error_formats import create_error_response
+from app.core.tracing import (
+    ConsoleExporter,
+    FileExporter,
+    NoOpExporter,
+    Span,
+    SpanContext,
+    SpanExporter,
+    Tracer,
+    configure_tracing,
+    current_span,
+    current_trace_id,
+    stop_tracing,
+    tracer,
+)
+from tests.helpers.fake_optscale import ORGANIZATIONS, Fault
+from tests.helpers.jwt import create_jwt_token
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def exported_spans():
+    exporter = ListExporter()
+    previous = tracer.exporter
+    tracer.exporter = exporter
+    yield exporter.spans
+    tracer.exporter = previous
+
+
+@pytest.mark.parametrize(
+    ("traceparent", "expected"),
+    [
+        (f"00-{TRACE_ID}-{PARENT_ID}-01", SpanContext(TRACE_ID, PARENT_ID, True)),
+        (
+            f"00-{TRACE_ID.upper()}-{PARENT_ID}-00",
+            SpanContext(TRACE_ID, PARENT_ID, False),
+        ),
+        (None, None),
+        ("garbage", None),
+        (f"ff-{TRACE_ID}-{PARENT_ID}-01", None),
+        (f"00-{'0' * 32}-{PARENT_ID}-01", None),
+        (f"00-{TRACE_ID}-{'0' * 16}-01", None),
+    ],
+)
+def test_span_context_from_traceparent(traceparent, expected):
+    assert SpanContext.from_traceparent(traceparent) == expected
+
+
+def test_nested_spans():
+    exporter = ListExporter()
+    test_tracer = Tracer(exporter)
+    with test_tracer.start_as_current_span("parent", kind="server") as parent:
+        assert current_span() is parent
+        with test_tracer.start_as_current_span("child", attributes={"a": 1}) as child:
+            assert current_trace_id() == parent.trace_id
+        assert current_span() is parent
+    assert current_span() is None
+
+    assert [span.name for span in exporter.spans] == ["child", "parent"]
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert child.attributes == {"a": 1}
+    assert child.end_time >= child.start_time
+    assert child.traceparent == f"00-{child.trace_id}-{child.span_id}-01"
+
+
+def test_remote_parent():
+    test_tracer = Tracer(ListExporter())
+    remote_parent = SpanContext(TRACE_ID, PARENT_ID)
+    with test_tracer.start_as_current_span(
+        "server", remote_parent=remote_parent
+    ) as span:
+        pass
+    assert span.trace_id == TRACE_ID
+    assert span.parent_id == PARENT_ID
+
+
+def test_unsampled_spans_are_not_exported():
+    exporter = ListExporter()
+    test_tracer = Tracer(exporter)
+    remote_parent = SpanContext(TRACE_ID, PARENT_ID, sampled=False)
+    with test_tracer.start_as_current_span("server", remote_parent=remote_parent):
+        with test_tracer.start_as_current_span("child") as child:
+            pass
+    assert child.traceparent.endswith("-00")
+    assert exporter.spans == []
+
+
+def test_span_records_exception():
+    exporter = ListExporter()
+    with pytest.raises(RuntimeError):
+        with Tracer(exporter).start_as_current_span("failing"):
+            raise RuntimeError("Oh no!")
+    assert exporter.spans[0].status == "error"
+    assert exporter.spans[0].status_message == "RuntimeError('Oh no!')"
+
+
+def test_console_exporter():
+    stream = io.StringIO()
+    with Tracer(ConsoleExporter(stream)).start_as_current_span("operation") as span:
+        span.set_attribute("http.response.status_code", 200)
+    exported = json.loads(stream.getvalue())
+    assert exported["name"] == "operation"
+    assert exported["trace_id"] == span.trace_id
+    assert exported["attributes"] == {"http.response.status_code": 200}
+    assert exported["duration"] >= 0
+
+
+def test_file_exporter(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = FileExporter(str(path))
+    test_tracer = Tracer(exporter)
+    for name in ("first", "second"):
+        with test_tracer.start_as_current_span(name):
+            pass
+    exporter.close()
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["first", "second"]
+
+
+def test_configure_tracing(tmp_path):
+    previous = tracer.exporter
+    tracer.exporter = NoOpExporter()
+    try:
+        configure_tracing("console")
+        assert isinstance(tracer.exporter, ConsoleExporter)
+        configure_tracing("file", str(tmp_path / "traces.jsonl"))
+        assert isinstance(tracer.exporter, FileExporter)
+        file_exporter = tracer.exporter
+        configure_tracing("none")
+        assert isinstance(tracer.exporter, NoOpExporter)
+        # the replaced exporter is closed
+        assert file_exporter.stream.closed
+        with pytest.raises(ValueError, match="Unknown tracing exporter"):
+            configure_tracing("zipkin")
+    finally:
+        tracer.exporter = previous
+
+
+def test_stop_tracing(tmp_path):
+    previous = tracer.exporter
+    exporter = FileExporter(str(tmp_path / "traces.jsonl"))
+    tracer.exporter = exporter
+    try:
+        stop_tracing()
+        assert exporter.stream.closed
+        assert isinstance(tracer.exporter, NoOpExporter)
+        with tracer.start_as_current_span("after the shutdown"):
+            pass
+    finally:
+        tracer.exporter = previous
+
+
+def test_error_response_uses_trace_id():
+    with tracer.start_as_current_span("request") as span:
+        error = create_error_response(status_code=400, title="Bad request")
+    assert error.detail["traceId"] == span.trace_id
+
+
+async def test_request_spans(async_client: AsyncClient, fake_optscale, exported_spans):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    fake_optscale.set_fault(ORGANIZATIONS, Fault(rate=1.0, status_code=500))
+
+    response = await async_client.post(
+        "/organizations",
+        json={"org_name": "Daily Bugle", "user_id": user["id"], "currency": "USD"},
+        headers={
+            "Authorization": f"Bearer {create_jwt_token()}",
+            "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01",
+        },
+    )
+
+    assert response.status_code == 500
+    assert response.json()["detail"]["traceId"] == TRACE_ID
+    server_span = exported_spans[-1]
+    assert server_span.kind == "server"
+    assert server_span.name == "POST /v1/admin/organizations"
+    assert server_span.parent_id == PARENT_ID
+    assert server_span.status == "error"
+    client_spans = [span for span in exported_spans if span.kind == "client"]
+    assert client_spans
+    for span in client_spans:
+        assert span.trace_id == TRACE_ID
+        assert span.parent_id == server_span.span_id
+    assert client_spans[-1].name == "POST /restapi/v2/organizations"
+    assert client_spans[-1].attributes["http.response.status_code"] == 500
@@ -0,0 +1,89 @@
+import pytest
+from httpx import AsyncClient
+
+from tests.helpers.fake_optscale import ORGANIZATIONS, TOKENS, USERS, Fault
+from tests.helpers.jwt import create_jwt_token
+
+CUSTOMER = {
+    "email": "peter.parker@iamspiderman.com",
+    "display_name": "Spider Man",
+    "password": "With great power",
+    "org_name": "Daily Bugle",
+    "currency": "USD",
+}
+
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_jwt_token()}"}
+
+
+async def test_create_customer(async_client: AsyncClient, fake_optscale, auth_headers):
+    response = await async_client.post(
+        "/customers", json=CUSTOMER, headers=auth_headers
+    )
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["user"]["email"] == CUSTOMER["email"]
+    assert data["user"]["token"]
+    assert data["organization"]["name"] == CUSTOMER["org_name"]
+    assert data["organization"]["currency"] == "USD"
+    # the organization is created with the token returned along with the user
+    assert fake_optscale.calls == {USERS: 1, ORGANIZATIONS: 1}
+
+    # and the token is reused by the next calls on behalf of the user
+    response = await async_client.get(
+        "/organizations",
+        params={"user_id": data["user"]["id"]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert fake_optscale.calls[TOKENS] == 0
+
+
+async def test_create_customer_invalid_currency(
+    async_client: AsyncClient, fake_optscale, auth_headers
+):
+    response = await async_client.post(
+        "/customers", json={**CUSTOMER, "currency": "XYZ"}, headers=auth_headers
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["errors"] == {"reason": "Unknown currency: XYZ"}
+    assert sum(fake_optscale.calls.values()) == 0
+
+
+async def test_create_customer_user_error(
+    async_client: AsyncClient, fake_optscale, auth_headers
+):
+    fake_optscale.add_user(email=CUSTOMER["email"])
+
+    response = await async_client.post(
+        "/customers", json=CUSTOMER, headers=auth_headers
+    )
+
+    assert response.status_code == 409
+    assert "user_id" not in response.json()["detail"]["errors"]
+    assert fake_optscale.calls[ORGANIZATIONS] == 0
+
+
+async def test_create_customer_organization_error(
+    async_client: AsyncClient, fake_optscale, auth_headers
+):
+    fake_optscale.set_fault(ORGANIZATIONS, Fault(rate=1.0, status_code=500))
+
+    response = await async_client.post(
+        "/customers", json=CUSTOMER, headers=auth_headers
+    )
+
+    assert response.status_code == 500
+    errors = response.json()["detail"]["errors"]
+    assert errors["reason"] == "Injected failure"
+    user_id = errors["user_id"]
+    assert fake_optscale.users[user_id]["email"] == CUSTOMER["email"]
+
+
+async def test_create_customer_unauthenticated(async_client: AsyncClient):
+    response = await async_client.post("/customers", json=CUSTOMER)
+    assert response.status_code == 401
@@ -0,0 +1,146 @@
+import asyncio
+import random
+import statistics
+
+import pytest
+from httpx import AsyncClient
+
+from app.optscale_api.helpers.response_cache import response_cache
+from tests.helpers.fake_optscale import (
+    ORGANIZATIONS,
+    TOKENS,
+    USERS,
+    FakeOptScale,
+    Fault,
+    Latency,
+)
+from tests.helpers.jwt import create_jwt_token
+
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_jwt_token()}"}
+
+
+@pytest.mark.parametrize(
+    "distribution", ["fixed", "uniform", "exponential", "lognormal"]
+)
+def test_latency_distributions(distribution):
+    rng = random.Random(1)  # nosec B311
+    latency = Latency(mean=0.1, distribution=distribution)
+    samples = [latency.sample(rng) for _ in range(5000)]
+    assert all(sample >= 0 for sample in samples)
+    assert statistics.mean(samples) == pytest.approx(0.1, rel=0.1)
+
+
+async def test_create_user(async_client: AsyncClient, fake_optscale, auth_headers):
+    payload = {
+        "email": "peter.parker@iamspiderman.com",
+        "display_name": "Spider Man",
+        "password": "With great power",
+    }
+    response = await async_client.post("/users", json=payload, headers=auth_headers)
+    assert response.status_code == 201
+    user = response.json()
+    assert user["email"] == payload["email"]
+    assert user["token"]
+    assert user["id"] in fake_optscale.users
+
+    response = await async_client.post("/users", json=payload, headers=auth_headers)
+    assert response.status_code == 409
+    assert fake_optscale.calls[USERS] == 2
+
+
+async def test_get_orgs(async_client: AsyncClient, fake_optscale, auth_headers):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    organization = fake_optscale.add_organization(user["id"], name="Daily Bugle")
+
+    for _ in range(2):
+        response = await async_client.get(
+            f"/organizations?user_id={user['id']}", headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json() == {"organizations": [organization]}
+    # the user's access token is cached
+    assert fake_optscale.calls == {TOKENS: 1, ORGANIZATIONS: 2}
+
+
+async def test_get_orgs_is_retried(
+    async_client: AsyncClient, fake_optscale, auth_headers
+):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    fake_optscale.fail_next(ORGANIZATIONS, count=2, status_code=503)
+
+    response = await async_client.get(
+        f"/organizations?user_id={user['id']}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert fake_optscale.calls[ORGANIZATIONS] == 3
+
+
+async def test_get_orgs_cached(
+    async_client: AsyncClient, fake_optscale, auth_headers, monkeypatch
+):
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+
+    for _ in range(3):
+        response = await async_client.get(
+            f"/organizations?user_id={user['id']}", headers=auth_headers
+        )
+        assert response.status_code == 200
+    assert fake_optscale.calls[ORGANIZATIONS] == 1
+
+
+async def test_create_org_error_injection(
+    async_client: AsyncClient, fake_optscale, auth_headers
+):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    fake_optscale.set_fault(ORGANIZATIONS, Fault(rate=1.0, status_code=500))
+
+    response = await async_client.post(
+        "/organizations",
+        json={"org_name": "Daily Bugle", "user_id": user["id"], "currency": "USD"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 500
+    assert response.json()["detail"]["errors"] == {"reason": "Injected failure"}
+    # a POST is not retried
+    assert fake_optscale.calls[ORGANIZATIONS] == 1
+    assert fake_optscale.organizations[user["id"]] == []
+
+
+async def test_concurrency_limit():
+    fake = FakeOptScale(admin_api_key="secret", max_concurrency=2)
+    fake.set_latency(USERS, Latency(mean=0.01))
+    user = fake.add_user(email="peter.parker@iamspiderman.com")
+    async with AsyncClient(
+        transport=fake.transport(), base_url="http://optscale"
+    ) as client:
+        responses = await asyncio.gather(
+            *(
+                client.get(f"/auth/v2/users/{user['id']}", headers={"Secret": "secret"})
+                for _ in range(6)
+            )
+        )
+    assert all(response.status_code == 200 for response in responses)
+    assert fake.stats() == {"calls": {USERS: 6}, "max_in_flight": 2, "rejected": 0}
+
+
+async def test_concurrency_limit_rejects():
+    fake = FakeOptScale(
+        admin_api_key="secret", max_concurrency=1, reject_over_limit=True
+    )
+    fake.set_latency(USERS, Latency(mean=0.01))
+    user = fake.add_user(email="peter.parker@iamspiderman.com")
+    async with AsyncClient(
+        transport=fake.transport(), base_url="http://optscale"
+    ) as client:
+        responses = await asyncio.gather(
+            *(
+                client.get(f"/auth/v2/users/{user['id']}", headers={"Secret": "secret"})
+                for _ in range(3)
+            )
+        )
+    assert sorted(response.status_code for response in responses) == [200, 503, 503]
+    assert fake.rejected == 2
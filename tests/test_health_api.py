@@ -0,0 +1,49 @@
+from httpx import AsyncClient
+
+from app import settings
+from app.core.api_client import api_clients
+from tests.helpers.jwt import create_jwt_token
+
+
+async def get_health_details(async_client: AsyncClient):
+    return await async_client.get(
+        "/health/details",
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+
+
+async def test_get_health(async_client: AsyncClient):
+    response = await async_client.get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+async def test_get_health_details(async_client: AsyncClient):
+    response = await get_health_details(async_client)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert data["upstreams"][settings.opt_scale_api_url]["state"] == "closed"
+    assert data["admission"]["max_in_flight"] == settings.admission_max_in_flight
+    assert data["admission"]["in_flight"] == 0
+
+
+async def test_get_health_degraded(async_client: AsyncClient):
+    circuit_breaker = api_clients.get(settings.opt_scale_api_url).circuit_breaker
+    circuit_breaker.failure_threshold = 1
+    try:
+        circuit_breaker.record_failure()
+        response = await async_client.get("/health")
+        assert response.status_code == 200
+        assert response.json() == {"status": "degraded"}
+        details = (await get_health_details(async_client)).json()
+        assert details["status"] == "degraded"
+        assert details["upstreams"][settings.opt_scale_api_url]["state"] == "open"
+    finally:
+        circuit_breaker.failure_threshold = settings.circuit_breaker_failure_threshold
+        circuit_breaker.record_success()
+
+
+async def test_get_health_details_requires_authentication(async_client: AsyncClient):
+    response = await async_client.get("/health/details")
+    assert response.status_code == 401
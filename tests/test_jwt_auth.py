@@ -1,12 +1,24 @@
+import dataclasses
 import logging
 import time
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import jwt
 import pytest
 from fastapi import HTTPException
 
 from app import settings
-from app.core.auth_jwt_bearer import JWTBearer, decode_jwt, verify_jwt
+from app.core.auth_jwt_bearer import (
+    JWTBearer,
+    JWTClaims,
+    decode_jwt,
+    decode_jwt_cached,
+    get_jwt_claims,
+    verified_tokens,
+    verify_jwt,
+)
+from app.core.tracing import tracer
 
 JWT_SECRET = settings.secret
 JWT_ALGORITHM = settings.algorithm
@@ -43,6 +55,7 @@ def create_jwt_token(subject: str, expires_in: int = 3600) -> str:
 class MockRequest:
     def __init__(self, authorization: str = None):
         self.headers = {"Authorization": authorization} if authorization else {}
+        self.state = SimpleNamespace()
 
 
 def test_decode_jwt_valid_token():
@@ -192,14 +205,92 @@ class TestVerifyJWT:
         assert verify_jwt(invalid_token) is False
 
 
+class TestJWTClaims:
+    def test_from_payload(self):
+        claims = JWTClaims.from_payload(
+            {
+                "sub": SUBJECT,
+                "iss": JWT_ISSUER,
+                "aud": JWT_AUDIENCE,
+                "exp": 2000,
+                "nbf": 1000,
+                "tenant": "ACC-1234",
+            }
+        )
+        assert claims.sub == SUBJECT
+        assert claims.exp == 2000
+        assert claims.iat is None
+        assert claims.extra == {"tenant": "ACC-1234"}
+
+    def test_get(self):
+        claims = JWTClaims(
+            iss=JWT_ISSUER, aud=JWT_AUDIENCE, exp=2000, nbf=1000, extra={"tenant": "A"}
+        )
+        assert claims.get("iss") == JWT_ISSUER
+        assert claims.get("tenant") == "A"
+        assert claims.get("sub", "anonymous") == "anonymous"
+        assert claims.get("missing") is None
+
+    def test_slots(self):
+        claims = JWTClaims(iss=JWT_ISSUER, aud=JWT_AUDIENCE, exp=2000, nbf=1000)
+        assert not hasattr(claims, "__dict__")
+
+
+class TestDecodeJWTCached:
+    def test_verified_token_is_cached(self):
+        token = create_jwt_token(subject=SUBJECT)
+        with patch("app.core.auth_jwt_bearer.decode_jwt", wraps=decode_jwt) as mock:
+            claims = decode_jwt_cached(token)
+            assert decode_jwt_cached(token) == claims
+            mock.assert_called_once_with(token)
+        assert claims.sub == SUBJECT
+        # the token itself is not kept
+        assert token not in str(verified_tokens._entries)
+
+    def test_claims_are_read_only(self):
+        claims = decode_jwt_cached(create_jwt_token(subject=SUBJECT))
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            claims.sub = "someone else"
+        with pytest.raises(TypeError):
+            claims.extra["tenant"] = "someone else"
+
+    def test_invalid_token_is_not_cached(self):
+        assert decode_jwt_cached("this.is.not.a.jwt") is None
+        assert len(verified_tokens) == 0
+
+    def test_token_expiring_within_leeway_is_not_cached(self):
+        token = create_jwt_token(subject=SUBJECT, expires_in=10)
+        assert decode_jwt_cached(token) is not None
+        assert len(verified_tokens) == 0
+
+    def test_cached_token_expiration(self):
+        token = create_jwt_token(subject=SUBJECT, expires_in=60)
+        with patch("app.core.cache.time.monotonic", return_value=1000.0):
+            decode_jwt_cached(token)
+        # the entry expires at exp - leeway, about 30 seconds later
+        with patch("app.core.cache.time.monotonic", return_value=1029.0):
+            assert verified_tokens.get(next(iter(verified_tokens._entries)))
+        with patch("app.core.cache.time.monotonic", return_value=1031.0):
+            assert len(verified_tokens) == 1
+            assert verified_tokens.get(next(iter(verified_tokens._entries))) is None
+
+
 @pytest.mark.asyncio
 class TestJWTBearer:
     async def test_valid_bearer_token(self):
         token = create_jwt_token(subject=SUBJECT)
         jwt_bearer = JWTBearer(auto_error=False)
         request = MockRequest(authorization=f"Bearer {token}")
-        credentials = await jwt_bearer(request)
-        assert credentials == token
+        claims = await jwt_bearer(request)
+        assert isinstance(claims, JWTClaims)
+        assert claims.sub == SUBJECT
+        assert claims.iss == JWT_ISSUER
+        assert claims.aud == JWT_AUDIENCE
+        assert request.state.jwt_claims is claims
+        assert get_jwt_claims(request) is claims
+
+    async def test_unauthenticated_request_has_no_claims(self):
+        assert get_jwt_claims(MockRequest()) is None
 
     async def test_invalid_scheme(self):
         token = create_jwt_token(subject=SUBJECT)
@@ -210,6 +301,22 @@ class TestJWTBearer:
         assert exc_info.value.status_code == 401
         assert exc_info.value.detail["title"] == "Invalid authorization scheme."
 
+    async def test_verification_span(self):
+        token = create_jwt_token(subject=SUBJECT)
+        with tracer.start_as_current_span("inbound") as parent:
+            with patch.object(tracer, "exporter") as exporter:
+                await JWTBearer(auto_error=False)(
+                    MockRequest(authorization=f"Bearer {token}")
+                )
+                with pytest.raises(HTTPException):
+                    await JWTBearer(auto_error=False)(
+                        MockRequest(authorization="Bearer invalid.token.here")
+                    )
+        spans = [call.args[0] for call in exporter.export.call_args_list]
+        assert [span.name for span in spans] == ["jwt.verify", "jwt.verify"]
+        assert all(span.parent_id == parent.span_id for span in spans)
+        assert [span.status for span in spans] == ["unset", "error"]
+
     async def test_invalid_token(self):
         invalid_token = "invalid.token.here"
         jwt_bearer = JWTBearer(auto_error=False)
@@ -0,0 +1,57 @@
+import re
+
+from httpx import AsyncClient
+
+from app.core.metrics import CONTENT_TYPE
+from tests.helpers.jwt import create_jwt_token
+
+METRICS_URL = "http://testserver/metrics"
+
+
+def sample(text: str, name: str, labels: str = "") -> float:
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+async def test_get_metrics(async_client: AsyncClient, fake_optscale):
+    user = fake_optscale.add_user(email="peter.parker@iamspiderman.com")
+    fake_optscale.add_organization(user["id"], name="Daily Bugle")
+    before = (await async_client.get(METRICS_URL)).text
+
+    response = await async_client.get(
+        "/organizations",
+        params={"user_id": user["id"]},
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+    assert response.status_code == 200
+
+    response = await async_client.get(METRICS_URL)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    after = response.text
+
+    route = 'method="GET",route="/v1/admin/organizations",status="200"'
+    name = "http_request_duration_seconds_count"
+    assert (
+        sample(after, name, f"{{{route}}}") == sample(before, name, f"{{{route}}}") + 1
+    )
+    upstream = 'method="GET",endpoint="/restapi/v2/organizations",status="200"'
+    name = "optscale_request_duration_seconds_count"
+    assert (
+        sample(after, name, f"{{{upstream}}}")
+        == sample(before, name, f"{{{upstream}}}") + 1
+    )
+    assert 'cache_lookups_total{cache="user_access_tokens",result="miss"}' in after
+    # the scrape itself is in flight
+    assert sample(after, "http_requests_in_flight") == 1
+
+
+async def test_get_metrics_unmatched_route(async_client: AsyncClient):
+    await async_client.get("http://testserver/not-found")
+
+    response = await async_client.get(METRICS_URL)
+
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'
+        in response.text
+    )
@@ -1,3 +1,4 @@
+import json
 import logging
 from unittest.mock import AsyncMock, patch
 
@@ -204,3 +205,116 @@ async def test_get_orgs_exception_handling(
     assert response.status_code == expected_status
     assert response_json.get("detail").get("title") == expected_title
     assert response_json.get("detail").get("errors").get("reason") == expected_reason
+
+
+async def test_lookup_orgs(async_client: AsyncClient, mock_get_org, test_data: dict):
+    organizations = test_data["org"]["case_get"]["response"]
+
+    async def get_user_org(user_id, **kwargs):
+        if user_id == "bad_user":
+            raise OptScaleAPIResponseError(
+                title="Error response from OptScale",
+                reason="test reason",
+                status_code=403,
+            )
+        return {"status_code": 200, "data": organizations}
+
+    mock_get_org.side_effect = get_user_org
+    response = await async_client.post(
+        "/organizations:lookup",
+        json={"user_ids": ["user_1", "bad_user", "user_2", "user_1"]},
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+
+    assert response.status_code == 200
+    got = response.json()
+    assert got["failed"] == 1
+    assert set(got["results"]) == {"user_1", "bad_user", "user_2"}
+    # the duplicated user is looked up once
+    assert mock_get_org.call_count == 3
+    for user_id in ("user_1", "user_2"):
+        assert got["results"][user_id]["status"] == 200
+        assert (
+            got["results"][user_id]["organizations"] == organizations["organizations"]
+        )
+    bad_user = got["results"]["bad_user"]
+    assert bad_user["status"] == 403
+    assert bad_user["error"]["errors"] == {"reason": "test reason"}
+
+
+async def test_lookup_orgs_validation(async_client: AsyncClient, mock_get_org):
+    response = await async_client.post(
+        "/organizations:lookup",
+        json={"user_ids": []},
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+    assert response.status_code == 422
+    mock_get_org.assert_not_called()
+
+
+async def test_get_orgs_does_not_stream_ndjson(
+    async_client: AsyncClient, mock_get_org, test_data: dict
+):
+    organizations = test_data["org"]["case_get"]["response"]
+    mock_get_org.return_value = {"status_code": 200, "data": organizations}
+    response = await async_client.get(
+        "/organizations?user_id=101010011",
+        headers={
+            "Authorization": f"Bearer {create_jwt_token()}",
+            "Accept": "application/x-ndjson",
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.json() == organizations
+
+
+async def test_lookup_orgs_ndjson(async_client: AsyncClient, mock_get_org):
+    async def get_user_org(user_id, **kwargs):
+        if user_id == "bad_user":
+            raise OptScaleAPIResponseError(
+                title="Error response from OptScale",
+                reason="test reason",
+                status_code=403,
+            )
+        return {"status_code": 200, "data": {"organizations": []}}
+
+    mock_get_org.side_effect = get_user_org
+    response = await async_client.post(
+        "/organizations:lookup",
+        json={"user_ids": ["user_1", "bad_user"]},
+        headers={
+            "Authorization": f"Bearer {create_jwt_token()}",
+            "Accept": "application/x-ndjson",
+        },
+    )
+
+    assert response.status_code == 200
+    results = {
+        result["user_id"]: result
+        for result in map(json.loads, response.text.splitlines())
+    }
+    assert results["user_1"] == {
+        "user_id": "user_1",
+        "status": 200,
+        "organizations": [],
+    }
+    assert results["bad_user"]["status"] == 403
+    assert results["bad_user"]["error"]["errors"] == {"reason": "test reason"}
+
+
+async def test_get_orgs_forwards_the_raw_response(
+    async_client: AsyncClient, mock_get_org
+):
+    content = b'{"organizations":[],"extra":"forwarded as is"}'
+    mock_get_org.return_value = {"status_code": 200, "content": content}
+    response = await async_client.get(
+        "/organizations?user_id=101010011",
+        headers={"Authorization": f"Bearer {create_jwt_token()}"},
+    )
+
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["Content-Type"] == "application/json"
+    assert mock_get_org.call_args.kwargs["raw"] is True
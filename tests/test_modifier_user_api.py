@@ -1,3 +1,4 @@
+import json
 import logging
 from unittest.mock import AsyncMock, patch
 
@@ -129,3 +130,82 @@ async def test_create_user_exception_handling(
         "Exception occurred during user creation: Error response from OptScale"
         in caplog.text
     ), "Expected error log message for the exception"
+
+
+async def test_create_users_batch(
+    async_client: AsyncClient, test_data: dict, mock_create_user
+):
+    payload = test_data["user"]["case_create"]["payload"]
+    users = [{**payload, "email": f"user{index}@example.com"} for index in range(3)]
+
+    async def create_user(email, **kwargs):
+        if email == "user1@example.com":
+            raise OptScaleAPIResponseError(
+                title="Error response from OptScale",
+                reason="User already exists",
+                status_code=409,
+            )
+        return {
+            "status_code": 201,
+            "data": {**test_data["user"]["case_create"]["response"], "email": email},
+        }
+
+    mock_create_user.side_effect = create_user
+    response = await async_client.post(
+        "/users:batch",
+        json=users,
+        headers={"Authorization": "Bearer " + create_jwt_token()},
+    )
+
+    assert response.status_code == 200
+    results = {result["index"]: result for result in response.json()}
+    assert len(results) == 3
+    assert mock_create_user.call_count == 3
+    for index in (0, 2):
+        assert results[index]["status"] == 201
+        assert results[index]["data"]["email"] == users[index]["email"]
+    assert results[1]["email"] == "user1@example.com"
+    assert results[1]["status"] == 409
+    assert results[1]["error"]["status"] == 409
+    assert results[1]["error"]["errors"] == {"reason": "User already exists"}
+
+
+async def test_create_users_batch_size(
+    async_client: AsyncClient, test_data: dict, mock_create_user
+):
+    headers = {"Authorization": "Bearer " + create_jwt_token()}
+    response = await async_client.post("/users:batch", json=[], headers=headers)
+    assert response.status_code == 422
+
+    payload = test_data["user"]["case_create"]["payload"]
+    response = await async_client.post(
+        "/users:batch", json=[payload] * 501, headers=headers
+    )
+    assert response.status_code == 422
+    mock_create_user.assert_not_called()
+
+
+async def test_create_users_batch_ndjson(
+    async_client: AsyncClient, test_data: dict, mock_create_user
+):
+    payload = test_data["user"]["case_create"]["payload"]
+    mock_create_user.return_value = {
+        "status_code": 201,
+        "data": test_data["user"]["case_create"]["response"],
+    }
+    response = await async_client.post(
+        "/users:batch",
+        json=[payload, payload],
+        headers={
+            "Authorization": "Bearer " + create_jwt_token(),
+            "Accept": "application/x-ndjson",
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == 2
+    results = [json.loads(line) for line in lines]
+    assert sorted(result["index"] for result in results) == [0, 1]
+    assert all(result["status"] == 201 for result in results)
@@ -3,12 +3,15 @@ from unittest.mock import AsyncMock
 
 import pytest
 
+from app import settings
+from app.core.deadline import remaining
 from app.core.exceptions import (
     OptScaleAPIResponseError,
     UserAccessTokenError,
     UserOrgCreationError,
 )
-from app.optscale_api.auth_api import OptScaleAuth
+from app.optscale_api.auth_api import OptScaleAuth, UserAccessToken
+from app.optscale_api.helpers.response_cache import response_cache
 from app.optscale_api.orgs_api import OptScaleOrgAPI
 
 ORG_RESPONSE = {
@@ -53,8 +56,8 @@ def mock_api_client_get(mocker, optscale_org_api_instance):
 def mock_auth_token(mocker, optscale_auth_api):
     mock_auth_token = mocker.patch.object(
         optscale_auth_api,
-        "obtain_user_auth_token_with_admin_api_key",
-        return_value="good token",
+        "obtain_user_access_token",
+        return_value=UserAccessToken(token="good token"),
     )
     return mock_auth_token
 
@@ -63,7 +66,7 @@ def mock_auth_token(mocker, optscale_auth_api):
 def mock_invalid_auth_token(mocker, optscale_auth_api):
     mock_auth_token = mocker.patch.object(
         optscale_auth_api,
-        "obtain_user_auth_token_with_admin_api_key",
+        "obtain_user_access_token",
         side_effect=UserAccessTokenError("Failed to get an admin access token"),
     )
     return mock_auth_token
@@ -338,3 +341,134 @@ async def test_create_org_user_response_error(
             in record.message
             for record in caplog.records
         )
+
+
+async def test_get_user_org_unauthorized_invalidates_token(
+    optscale_org_api_instance,
+    mock_api_client_get,
+    mock_auth_token,
+    optscale_auth_api,
+):
+    mock_api_client_get.return_value = {
+        "error": "HTTP error: 401",
+        "status_code": 401,
+        "data": {"error": {"reason": "Unauthorized"}},
+    }
+    for _ in range(2):
+        with pytest.raises(OptScaleAPIResponseError):
+            await optscale_org_api_instance.get_user_org(
+                user_id="test_user",
+                admin_api_key="test_key",
+                auth_client=optscale_auth_api,
+            )
+    # the rejected token is not reused
+    assert mock_auth_token.call_count == 2
+
+
+async def test_get_user_org_is_cached(
+    optscale_org_api_instance,
+    mock_api_client_get,
+    mock_api_client_post,
+    mock_auth_token,
+    optscale_auth_api,
+    monkeypatch,
+):
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    mock_api_client_get.return_value = {"status_code": 200, "data": {}}
+
+    for _ in range(2):
+        await optscale_org_api_instance.get_user_org(
+            user_id="test_user", admin_api_key="test_key", auth_client=optscale_auth_api
+        )
+    mock_api_client_get.assert_called_once()
+    assert response_cache.stats() == {"hits": 1, "stale_hits": 0, "misses": 1}
+
+    # creating an organization invalidates the cached entry
+    mock_api_client_post.return_value = ORG_RESPONSE
+    await optscale_org_api_instance.create_user_org(
+        org_name="MyOrg",
+        currency="USD",
+        user_id="test_user",
+        admin_api_key="test_key",
+        auth_client=optscale_auth_api,
+    )
+    await optscale_org_api_instance.get_user_org(
+        user_id="test_user", admin_api_key="test_key", auth_client=optscale_auth_api
+    )
+    assert mock_api_client_get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_user_org_shares_the_request_deadline(
+    monkeypatch, mock_api_client_get, optscale_org_api_instance, optscale_auth_api
+):
+    monkeypatch.setattr(settings, "request_deadline", 5)
+    time_left = []
+
+    async def obtain_token(**kwargs):
+        time_left.append(remaining())
+        return UserAccessToken(token="good token")
+
+    async def get(**kwargs):
+        time_left.append(remaining())
+        return {"status_code": 200, "data": {"organizations": []}}
+
+    monkeypatch.setattr(optscale_auth_api, "obtain_user_access_token", obtain_token)
+    mock_api_client_get.side_effect = get
+
+    await optscale_org_api_instance.get_user_org(
+        user_id="test_user_id",
+        admin_api_key="test_admin_api_key",
+        auth_client=optscale_auth_api,
+    )
+    assert len(time_left) == 2
+    assert all(0 < value <= 5 for value in time_left)
+    assert remaining() is None
+
+
+@pytest.mark.asyncio
+async def test_get_user_org_raw(
+    mocker, monkeypatch, optscale_org_api_instance, mock_auth_token, optscale_auth_api
+):
+    content = b'{"organizations": []}'
+    mock_get_raw = mocker.patch.object(
+        optscale_org_api_instance.api_client,
+        "get_raw",
+        new=AsyncMock(return_value={"status_code": 200, "content": content}),
+    )
+    result = await optscale_org_api_instance.get_user_org(
+        user_id="test_user",
+        admin_api_key="test_key",
+        auth_client=optscale_auth_api,
+        raw=True,
+    )
+    assert result == {"status_code": 200, "content": content}
+    mock_get_raw.assert_called_once_with(
+        endpoint="/restapi/v2/organizations",
+        headers={"Authorization": "Bearer good token"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_user_org_raw_with_cache(
+    monkeypatch,
+    mocker,
+    optscale_org_api_instance,
+    mock_api_client_get,
+    mock_auth_token,
+    optscale_auth_api,
+):
+    # the cache keeps the parsed responses, so raw is ignored
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    mock_get_raw = mocker.patch.object(
+        optscale_org_api_instance.api_client, "get_raw", new=AsyncMock()
+    )
+    mock_api_client_get.return_value = {"status_code": 200, "data": {}}
+    result = await optscale_org_api_instance.get_user_org(
+        user_id="test_user",
+        admin_api_key="test_key",
+        auth_client=optscale_auth_api,
+        raw=True,
+    )
+    assert result == {"status_code": 200, "data": {}}
+    mock_get_raw.assert_not_called()
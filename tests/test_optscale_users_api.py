@@ -4,6 +4,7 @@ from unittest.mock import AsyncMock
 import pytest
 
 from app.core.exceptions import OptScaleAPIResponseError
+from app.optscale_api.helpers.response_cache import response_cache
 from app.optscale_api.users_api import OptScaleUserAPI
 
 USER_ID = "f0bd0c4a-7c55-45b7-8b58-27740e38789a"
@@ -169,3 +170,51 @@ async def test_get_user_with_invalid_admin_api_key(optscale_api, mock_get):
         mock_get.assert_called_once_with(
             endpoint=f"/auth/v2/users/{USER_ID}", headers={"Secret": "invalid_key"}
         )
+
+
+async def test_get_user_by_id_is_cached(optscale_api, mock_get, mock_post, monkeypatch):
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    mock_get.return_value = {"status_code": 200, "data": {"id": USER_ID}}
+
+    for _ in range(2):
+        result = await optscale_api.get_user_by_id(
+            user_id=USER_ID, admin_api_key=ADMIN_API_KEY
+        )
+        assert result == {"status_code": 200, "data": {"id": USER_ID}}
+    mock_get.assert_called_once()
+
+    # creating the user invalidates the cached entry
+    mock_post.return_value = {"status_code": 201, "data": {"id": USER_ID}}
+    await optscale_api.create_user(
+        email=EMAIL,
+        display_name=DISPLAY_NAME,
+        password=PASSWORD,
+        admin_api_key=ADMIN_API_KEY,
+    )
+    await optscale_api.get_user_by_id(user_id=USER_ID, admin_api_key=ADMIN_API_KEY)
+    assert mock_get.call_count == 2
+
+
+async def test_create_user_raw(optscale_api, mocker, mock_get, monkeypatch):
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    content = b'{"id": "' + USER_ID.encode() + b'", "email": "' + EMAIL.encode() + b'"}'
+    mock_post_raw = mocker.patch.object(
+        optscale_api.api_client,
+        "post_raw",
+        new=AsyncMock(return_value={"status_code": 201, "content": content}),
+    )
+    mock_get.return_value = {"status_code": 200, "data": {"id": USER_ID}}
+    await optscale_api.get_user_by_id(user_id=USER_ID, admin_api_key=ADMIN_API_KEY)
+
+    result = await optscale_api.create_user(
+        email=EMAIL,
+        display_name=DISPLAY_NAME,
+        password=PASSWORD,
+        admin_api_key=ADMIN_API_KEY,
+        raw=True,
+    )
+    assert result == {"status_code": 201, "content": content}
+    mock_post_raw.assert_called_once()
+    # the cached entry is invalidated with the id read from the raw content
+    await optscale_api.get_user_by_id(user_id=USER_ID, admin_api_key=ADMIN_API_KEY)
+    assert mock_get.call_count == 2
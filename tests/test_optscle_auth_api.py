@@ -5,7 +5,7 @@ import pytest
 from httpx import AsyncClient
 
 from app.core.exceptions import OptScaleAPIResponseError, UserAccessTokenError
-from app.optscale_api.auth_api import OptScaleAuth
+from app.optscale_api.auth_api import OptScaleAuth, parse_valid_until
 
 
 @pytest.fixture
@@ -44,6 +44,32 @@ async def test_user_auth_token_with_admin_api_key(
     assert user_token == mock_response.get("data").get("token")
 
 
+async def test_obtain_user_access_token_expiration(
+    test_data: dict, mock_post, opt_scale_auth
+):
+    mock_post.return_value = test_data["auth_token"]["create"]
+    user_access_token = await opt_scale_auth.obtain_user_access_token(
+        user_id="f0bd0c4a-7c55-45b7-8b58-27740e38789a",
+        admin_api_key="f2312f2b-46h0-4456-o0i9-58e64f2j6725",
+    )
+    # 2024-11-04T18:38:21 UTC
+    assert user_access_token.valid_until == 1730745501
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("2024-11-04T18:38:21", 1730745501),
+        ("2024-11-04T19:38:21+01:00", 1730745501),
+        (1730745501, 1730745501),
+        ("soon", None),
+        (None, None),
+    ],
+)
+def test_parse_valid_until(value, expected):
+    assert parse_valid_until(value) == expected
+
+
 async def test_obtain_user_auth_token_with_admin_api_key_error_response(
     async_client: AsyncClient, mock_post, opt_scale_auth, caplog
 ):